@@ -1,30 +1,342 @@
-from flask import Flask, render_template, request, redirect, url_for, session, jsonify, flash
+from flask import Flask, render_template, request, redirect, url_for, session, jsonify, flash, abort, Response, stream_with_context, has_request_context
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import (Column, MetaData, Select, Table, case, column, create_engine, event, func, insert, inspect,
+                        or_, table, text, tuple_, union_all, update)
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.orm import Session
+from concurrent.futures import Future, ThreadPoolExecutor
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+from collections import OrderedDict, defaultdict, deque
+from contextlib import contextmanager
+import atexit
+import base64
 import bcrypt
-from datetime import datetime
+import bisect
+import click
+import copy
+import csv
+import glob
+import gzip
+import hashlib
+import io
+import itertools
+from datetime import date, datetime, timedelta
+import heapq
+import json
+import math
+import mimetypes
 import os
+import queue
+import random
+import re
+import socket
+import sqlite3
+import threading
+import time
+import unicodedata
+
+try:
+    import brotli
+except ImportError:  # opcional: sem ele os arquivos são servidos só com gzip
+    brotli = None
 
 app = Flask(__name__)
 app.secret_key = os.urandom(24)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///vendas.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///vendas.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Com FILA_ESCRITA=1 as gravações passam por uma única thread escritora com commit em grupo
+app.config['FILA_ESCRITA'] = os.environ.get('FILA_ESCRITA') == '1'
+# Quantos hashes bcrypt podem rodar ao mesmo tempo; os demais aguardam em fila (FIFO)
+app.config['BCRYPT_CONCORRENCIA'] = int(os.environ.get('BCRYPT_CONCORRENCIA', os.cpu_count() or 2))
+# Validade, em segundos, da autorização de administrador para sangrias
+app.config['AUTORIZACAO_ADMIN_TTL'] = 300
+# Requisições mais lentas que isso (ms) vão para o log com o plano das consultas; 0 desliga
+app.config['LOG_REQUISICOES_LENTAS_MS'] = int(os.environ.get('LOG_REQUISICOES_LENTAS_MS', 0))
+# Cache de resultados de leitura: número máximo de entradas e validade de cada uma (segundos)
+app.config['CACHE_CONSULTAS_ITENS'] = int(os.environ.get('CACHE_CONSULTAS_ITENS', 2048))
+app.config['CACHE_CONSULTAS_TTL'] = float(os.environ.get('CACHE_CONSULTAS_TTL', 60))
+# Auditoria: intervalo máximo (segundos) entre gravações do buffer e tamanho que força uma gravação
+app.config['AUDITORIA_INTERVALO'] = float(os.environ.get('AUDITORIA_INTERVALO', 1))
+app.config['AUDITORIA_LOTE'] = int(os.environ.get('AUDITORIA_LOTE', 500))
+# Cópia do banco lida pelos relatórios; sem BASE_RELATORIOS fica ao lado do banco (vendas-relatorios.db)
+app.config['BASE_RELATORIOS'] = os.environ.get('BASE_RELATORIOS')
+# Intervalo, em segundos, entre as atualizações automáticas da cópia; 0 deixa só a sob demanda
+app.config['RELATORIOS_INTERVALO'] = int(os.environ.get('RELATORIOS_INTERVALO', 300))
+# Pasta dos arquivos mensais de vendas (flask arquivar); sem PASTA_ARQUIVO, arquivo/ ao lado do banco
+app.config['PASTA_ARQUIVO'] = os.environ.get('PASTA_ARQUIVO')
+# Cupons: formato (texto, escpos ou pdf), destino (arquivo ou rede) e threads que os emitem;
+# com CUPOM_TRABALHADORES=0 este processo só enfileira (outro roda flask processar-cupons)
+app.config['CUPOM_FORMATO'] = os.environ.get('CUPOM_FORMATO', 'texto')
+app.config['CUPOM_BACKEND'] = os.environ.get('CUPOM_BACKEND', 'arquivo')
+app.config['CUPOM_TRABALHADORES'] = int(os.environ.get('CUPOM_TRABALHADORES', 2))
+# Pasta do backend 'arquivo' (padrão: instance/cupons) e endereço host:porta do backend 'rede'
+app.config['CUPOM_PASTA'] = os.environ.get('CUPOM_PASTA')
+app.config['CUPOM_IMPRESSORA'] = os.environ.get('CUPOM_IMPRESSORA', 'localhost:9100')
+NOME_LOJA = 'Armarinho'
 
 db = SQLAlchemy(app)
 
+# ===== HASH DE SENHAS =====
+# O bcrypt é lento de propósito. O pool limita quantos hashes rodam ao mesmo tempo
+# (BCRYPT_CONCORRENCIA); os demais esperam na fila do pool, em ordem de chegada. A thread
+# da requisição continua parada até o resultado: o pool não tira a espera do login, e sim
+# impede que uma leva de logins tome toda a CPU das outras requisições. Para não pagar o
+# hash a cada sangria, há as autorizações de administrador de curta duração.
+executor_bcrypt = ThreadPoolExecutor(max_workers=app.config['BCRYPT_CONCORRENCIA'],
+                                     thread_name_prefix='bcrypt')
+
+def _executar_bcrypt(operacao, func, *args):
+    # Bloqueia até o hash sair, contando o tempo na fila do pool
+    inicio = time.perf_counter()
+    try:
+        return executor_bcrypt.submit(func, *args).result()
+    finally:
+        metricas.registrar(('armarinho_bcrypt_segundos', (('operacao', operacao),), time.perf_counter() - inicio))
+
+def hash_senha(senha):
+    return _executar_bcrypt('hash', bcrypt.hashpw, senha.encode('utf-8'), bcrypt.gensalt())
+
+def conferir_senha(senha, senha_hash):
+    return _executar_bcrypt('conferir', bcrypt.checkpw, senha.encode('utf-8'), senha_hash.encode('utf-8'))
+
+# ===== AJUSTES DO SQLITE =====
+# WAL permite leituras simultâneas a uma escrita; busy_timeout faz a conexão esperar
+# pelo lock em vez de falhar com "database is locked". As transações são abertas por
+# _antes_do_comando, não pelo sqlite3 (isolation_level=None): o driver não emite BEGIN
+# antes de um SAVEPOINT, que então viraria a transação externa e o RELEASE a confirmaria.
+PRAGMAS_SQLITE = [
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA busy_timeout=15000',
+    'PRAGMA cache_size=-20000',
+    'PRAGMA mmap_size=268435456',
+    'PRAGMA temp_store=MEMORY',
+]
+
+@event.listens_for(Engine, 'connect')
+def _configurar_conexao_sqlite(conexao, registro):
+    if not isinstance(conexao, sqlite3.Connection):
+        return
+    conexao.isolation_level = None
+    cursor = conexao.cursor()
+    for pragma in PRAGMAS_SQLITE:
+        cursor.execute(pragma)
+    cursor.close()
+
+# ===== MÉTRICAS =====
+# Latência por rota, comandos SQL e espera pelo lock do SQLite, expostos em /metrics no
+# formato texto do Prometheus. Cada requisição acumula seus números na própria thread e
+# os publica de uma vez ao terminar: a trava global é tomada uma vez por requisição.
+LIMITES_LATENCIA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+LIMITES_ESPERA_LOCK = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 15)
+COMANDOS_NO_LOG_LENTO = 5
+SEGUNDO_PLANO = (('endpoint', 'segundo_plano'),)  # comandos fora de requisição (fila de escrita, CLI)
+
+METRICAS = {
+    'armarinho_requisicao_segundos': ('histogram', 'Duração das requisições por rota', LIMITES_LATENCIA),
+    'armarinho_requisicoes_total': ('counter', 'Requisições por rota e status', None),
+    'armarinho_sql_comandos_total': ('counter', 'Comandos SQL executados', None),
+    'armarinho_sql_segundos_total': ('counter', 'Tempo gasto em comandos SQL', None),
+    'armarinho_sqlite_espera_lock_segundos': ('histogram', 'Espera pelo lock de escrita do SQLite', LIMITES_ESPERA_LOCK),
+    'armarinho_fila_escrita_segundos': ('histogram', 'Espera pela thread escritora (FILA_ESCRITA=1), incluindo a gravação', LIMITES_LATENCIA),
+    'armarinho_bcrypt_segundos': ('histogram', 'Hash e conferência de senhas, incluindo a fila do pool', LIMITES_LATENCIA),
+    'armarinho_cache_consultas_total': ('counter', 'Consultas ao cache de resultados por resultado', None),
+    'armarinho_cache_entradas': ('gauge', 'Entradas no cache de resultados', None),
+    'armarinho_cupons_total': ('counter', 'Tentativas de emissão de cupom por resultado', None),
+    'armarinho_cupom_segundos': ('histogram', 'Montagem e envio de um cupom ao backend', LIMITES_LATENCIA),
+    'armarinho_base_relatorios_atualizacao_segundos': ('histogram', 'Cópia do banco para a base de relatórios', LIMITES_LATENCIA),
+    'armarinho_base_relatorios_gerada_em_segundos': ('gauge', 'Momento (epoch) da cópia lida pelos relatórios', None),
+}
+
+class Metricas:
+    def __init__(self):
+        self._trava = threading.Lock()
+        # (nome, rótulos) -> total (contadores), último valor (gauges) ou
+        # [contagens por faixa, soma, quantidade] (histogramas)
+        self._series = {}
+    
+    def registrar(self, *observacoes):
+        # Cada observação é (nome, rótulos, valor); rótulos é uma tupla de pares (chave, valor)
+        with self._trava:
+            for nome, rotulos, valor in observacoes:
+                tipo, _, limites = METRICAS[nome]
+                chave = (nome, rotulos)
+                if tipo == 'counter':
+                    self._series[chave] = self._series.get(chave, 0) + valor
+                    continue
+                if tipo == 'gauge':
+                    self._series[chave] = valor
+                    continue
+                serie = self._series.get(chave)
+                if serie is None:
+                    serie = self._series[chave] = [[0] * (len(limites) + 1), 0.0, 0]
+                serie[0][bisect.bisect_left(limites, valor)] += 1
+                serie[1] += valor
+                serie[2] += 1
+    
+    def definir_contadores(self, *observacoes):
+        # Contadores acumulados fora daqui (ex.: pelo cache): guarda o total como está
+        with self._trava:
+            for nome, rotulos, valor in observacoes:
+                self._series[(nome, rotulos)] = valor
+    
+    def exportar(self):
+        with self._trava:
+            series = sorted(
+                ((nome, rotulos), valor if not isinstance(valor, list) else (list(valor[0]), valor[1], valor[2]))
+                for (nome, rotulos), valor in self._series.items()
+            )
+        linhas = []
+        for nome, (tipo, ajuda, limites) in METRICAS.items():
+            linhas += [f'# HELP {nome} {ajuda}', f'# TYPE {nome} {tipo}']
+            for (serie, rotulos), valor in series:
+                if serie != nome:
+                    continue
+                if tipo != 'histogram':
+                    linhas.append(f'{nome}{_rotulos(rotulos)} {valor}')
+                    continue
+                contagens, soma, quantidade = valor
+                acumulado = 0
+                for limite, contagem in zip((*limites, '+Inf'), contagens):
+                    acumulado += contagem
+                    linhas.append(f'{nome}_bucket{_rotulos(rotulos + (("le", str(limite)),))} {acumulado}')
+                linhas.append(f'{nome}_sum{_rotulos(rotulos)} {soma}')
+                linhas.append(f'{nome}_count{_rotulos(rotulos)} {quantidade}')
+        return '\n'.join(linhas) + '\n'
+
+def _rotulos(rotulos):
+    if not rotulos:
+        return ''
+    pares = []
+    for chave, valor in rotulos:
+        valor = str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pares.append(f'{chave}="{valor}"')
+    return '{' + ','.join(pares) + '}'
+
+metricas = Metricas()
+_medicao = threading.local()
+_COMANDO_ESCRITA = re.compile(r'\s*(INSERT|UPDATE|DELETE|REPLACE|SAVEPOINT)\b', re.IGNORECASE)
+
+def _medicao_atual():
+    return getattr(_medicao, 'atual', None)
+
+def _anotar_espera_lock(espera):
+    atual = _medicao_atual()
+    if atual is None:
+        metricas.registrar(('armarinho_sqlite_espera_lock_segundos', SEGUNDO_PLANO, espera))
+    else:
+        atual['esperas'].append(espera)
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _antes_do_comando(conexao, cursor, comando, parametros, contexto, executemany):
+    dbapi = getattr(cursor, 'connection', None)
+    if (isinstance(dbapi, sqlite3.Connection) and not dbapi.in_transaction and conexao.in_transaction()
+            and _COMANDO_ESCRITA.match(comando)):
+        # Abre a transação do SQLAlchemy no banco na primeira escrita (ou SAVEPOINT), já com
+        # o lock de escrita: a espera fica isolada neste BEGIN e não há troca de lock de
+        # leitura para escrita no meio da transação, que o busy_timeout não resolve. Não é
+        # feito no evento 'begin' porque toda leitura também abre transação no SQLAlchemy,
+        # e ela passaria a segurar o lock de escrita até o fim da requisição.
+        inicio = time.perf_counter()
+        cursor.execute('BEGIN IMMEDIATE')
+        _anotar_espera_lock(time.perf_counter() - inicio)
+    conexao.info['inicio_comando'] = time.perf_counter()
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _depois_do_comando(conexao, cursor, comando, parametros, contexto, executemany):
+    duracao = time.perf_counter() - conexao.info.pop('inicio_comando', time.perf_counter())
+    atual = _medicao_atual()
+    if atual is None:
+        metricas.registrar(('armarinho_sql_comandos_total', SEGUNDO_PLANO, 1),
+                           ('armarinho_sql_segundos_total', SEGUNDO_PLANO, duracao))
+        return
+    atual['comandos'] += 1
+    atual['tempo_sql'] += duracao
+    if atual['sql'] is not None:
+        atual['sql'].append((duracao, comando, parametros, executemany))
+
+@app.before_request
+def _iniciar_medicao():
+    _medicao.atual = {
+        'inicio': time.perf_counter(), 'status': None, 'comandos': 0, 'tempo_sql': 0.0, 'esperas': [],
+        # Os comandos só são guardados quando o log de requisições lentas está ligado
+        'sql': [] if app.config['LOG_REQUISICOES_LENTAS_MS'] else None,
+    }
+
+@app.after_request
+def _anotar_status(resposta):
+    atual = _medicao_atual()
+    if atual is not None:
+        atual['status'] = resposta.status_code
+    return resposta
+
+@app.teardown_request
+def _encerrar_medicao(erro=None):
+    # Roda depois do fim do corpo, inclusive em respostas em streaming
+    atual = _medicao_atual()
+    if atual is None:
+        return
+    _medicao.atual = None
+    duracao = time.perf_counter() - atual['inicio']
+    endpoint = request.endpoint or 'sem_rota'
+    rota = (('endpoint', endpoint),)
+    metricas.registrar(
+        ('armarinho_requisicao_segundos', rota + (('metodo', request.method),), duracao),
+        ('armarinho_requisicoes_total', rota + (('metodo', request.method), ('status', atual['status'] or 500)), 1),
+        ('armarinho_sql_comandos_total', rota, atual['comandos']),
+        ('armarinho_sql_segundos_total', rota, atual['tempo_sql']),
+        *(('armarinho_sqlite_espera_lock_segundos', rota, espera) for espera in atual['esperas']),
+    )
+    limite = app.config['LOG_REQUISICOES_LENTAS_MS']
+    if limite and duracao * 1000 >= limite:
+        registrar_requisicao_lenta(endpoint, duracao, atual)
+
+def registrar_requisicao_lenta(endpoint, duracao, atual):
+    linhas = [f"Requisição lenta: {request.method} {request.path} ({endpoint}) {duracao * 1000:.0f} ms; "
+              f"{atual['comandos']} comandos SQL em {atual['tempo_sql'] * 1000:.0f} ms; "
+              f"espera por lock {sum(atual['esperas']) * 1000:.0f} ms"]
+    # Conexão crua: os EXPLAIN não passam pelos eventos e não entram nas métricas
+    conexao = db.engine.raw_connection()
+    try:
+        for duracao_sql, comando, parametros, executemany in heapq.nlargest(
+                COMANDOS_NO_LOG_LENTO, atual['sql'], key=lambda c: c[0]):
+            linhas.append(f"  {duracao_sql * 1000:.1f} ms: {' '.join(comando.split())}")
+            if executemany:
+                parametros = parametros[0] if parametros else ()
+            try:
+                plano = conexao.cursor().execute(f'EXPLAIN QUERY PLAN {comando}', parametros).fetchall()
+            except sqlite3.Error:
+                continue
+            linhas.extend(f'    {passo[3]}' for passo in plano)
+    finally:
+        conexao.close()
+    app.logger.warning('\n'.join(linhas))
+
+@app.route('/metrics')
+def exportar_metricas():
+    estatisticas = cache_consultas.estatisticas()
+    metricas.registrar(('armarinho_cache_entradas', (), estatisticas.pop('entradas')))
+    metricas.definir_contadores(
+        *(('armarinho_cache_consultas_total', (('resultado', nome),), valor) for nome, valor in estatisticas.items())
+    )
+    return Response(metricas.exportar(), mimetype='text/plain; version=0.0.4')
+
 # ===== MODELOS =====
 class Usuario(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     nome = db.Column(db.String(100), nullable=False)
     login = db.Column(db.String(50), unique=True, nullable=False)
     senha_hash = db.Column(db.String(200), nullable=False)
-    perfil = db.Column(db.String(20), nullable=False)  # 'admin' ou 'operador'
+    perfil = db.Column(db.String(20), nullable=False, index=True)  # 'admin' ou 'operador'
     ativo = db.Column(db.Boolean, default=True)
 
     def set_senha(self, senha):
-        self.senha_hash = bcrypt.hashpw(senha.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        self.senha_hash = hash_senha(senha).decode('utf-8')
     
     def verificar_senha(self, senha):
-        return bcrypt.checkpw(senha.encode('utf-8'), self.senha_hash.encode('utf-8'))
+        return conferir_senha(senha or '', self.senha_hash)
     
     def to_dict(self):
         return {
@@ -42,6 +354,9 @@ class Produto(db.Model):
     preco_venda = db.Column(db.Float, nullable=False)
     estoque = db.Column(db.Integer, default=0)
     ativo = db.Column(db.Boolean, default=True)
+    versao = db.Column(db.Integer, default=0, index=True)  # versão do catálogo da última alteração
+    
+    __table_args__ = (db.Index('ix_produto_ativo_descricao_id', 'ativo', 'descricao', 'id'),)
     
     def to_dict(self):
         return {
@@ -61,6 +376,8 @@ class Cliente(db.Model):
     email = db.Column(db.String(100))
     endereco = db.Column(db.String(200))
     
+    __table_args__ = (db.Index('ix_cliente_nome_id', 'nome', 'id'),)
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -74,23 +391,2101 @@ class Cliente(db.Model):
 
 class Venda(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    data = db.Column(db.DateTime, default=datetime.now)
-    usuario_id = db.Column(db.Integer, db.ForeignKey('usuario.id'), nullable=False)
-    cliente_id = db.Column(db.Integer, db.ForeignKey('cliente.id'))
+    data = db.Column(db.DateTime, default=datetime.now, index=True)
+    usuario_id = db.Column(db.Integer, db.ForeignKey('usuario.id'), nullable=False, index=True)
+    cliente_id = db.Column(db.Integer, db.ForeignKey('cliente.id'), index=True)
     total = db.Column(db.Float, nullable=False)
     tipo_cupom = db.Column(db.String(20), default='nao_fiscal')
     cancelada = db.Column(db.Boolean, default=False)
     senha_admin_cancelamento = db.Column(db.String(200))
+    chave_idempotencia = db.Column(db.String(64), unique=True, index=True)
+
+class ItemVenda(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    venda_id = db.Column(db.Integer, db.ForeignKey('venda.id'), nullable=False, index=True)
+    produto_id = db.Column(db.Integer, db.ForeignKey('produto.id'), nullable=False, index=True)
+    quantidade = db.Column(db.Integer, nullable=False)
+    preco_unitario = db.Column(db.Float, nullable=False)
+
+class FechamentoCaixa(db.Model):
+    # Totais por dia e operador, acumulados na mesma transação de cada venda ou movimentação
+    data = db.Column(db.Date, primary_key=True)
+    usuario_id = db.Column(db.Integer, db.ForeignKey('usuario.id'), primary_key=True)
+    vendas_quantidade = db.Column(db.Integer, nullable=False, default=0)
+    vendas_total = db.Column(db.Float, nullable=False, default=0)
+    canceladas_quantidade = db.Column(db.Integer, nullable=False, default=0)
+    canceladas_total = db.Column(db.Float, nullable=False, default=0)
+    sangrias_quantidade = db.Column(db.Integer, nullable=False, default=0)
+    sangrias_total = db.Column(db.Float, nullable=False, default=0)
+    suprimentos_quantidade = db.Column(db.Integer, nullable=False, default=0)
+    suprimentos_total = db.Column(db.Float, nullable=False, default=0)
+    
+    def to_dict(self):
+        liquido = self.vendas_total - self.canceladas_total
+        return {
+            'data': self.data.isoformat(),
+            'usuario_id': self.usuario_id,
+            'vendas_quantidade': self.vendas_quantidade,
+            'vendas_total': self.vendas_total,
+            'canceladas_quantidade': self.canceladas_quantidade,
+            'canceladas_total': self.canceladas_total,
+            'sangrias_quantidade': self.sangrias_quantidade,
+            'sangrias_total': self.sangrias_total,
+            'suprimentos_quantidade': self.suprimentos_quantidade,
+            'suprimentos_total': self.suprimentos_total,
+            'vendas_liquido': liquido,
+            'saldo_caixa': liquido - self.sangrias_total + self.suprimentos_total
+        }
+
+class GiroProduto(db.Model):
+    # Unidades vendidas por dia e produto, acumuladas na mesma transação de cada venda
+    data = db.Column(db.Date, primary_key=True)
+    produto_id = db.Column(db.Integer, db.ForeignKey('produto.id'), primary_key=True)
+    quantidade = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.Float, nullable=False, default=0)
+    ultima_venda = db.Column(db.DateTime)
+
+class TrabalhoCupom(db.Model):
+    # Fila persistente de cupons; o trabalho entra na mesma transação da venda
+    id = db.Column(db.Integer, primary_key=True)
+    venda_id = db.Column(db.Integer, db.ForeignKey('venda.id'), nullable=False, index=True)
+    status = db.Column(db.String(20), nullable=False, default='pendente')  # pendente, emitido, falhou
+    tentativas = db.Column(db.Integer, nullable=False, default=0)
+    proxima_tentativa = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    destino = db.Column(db.String(300))  # onde o cupom foi entregue (arquivo, impressora)
+    erro = db.Column(db.String(300))
+    
+    __table_args__ = (db.Index('ix_trabalho_cupom_status_proxima', 'status', 'proxima_tentativa'),)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'venda_id': self.venda_id,
+            'status': self.status,
+            'tentativas': self.tentativas,
+            'proxima_tentativa': self.proxima_tentativa.isoformat(sep=' ') if self.status == 'pendente' else None,
+            'destino': self.destino,
+            'erro': self.erro
+        }
+
+class DivergenciaEstoque(db.Model):
+    # Unidades de venda offline que o estoque do sistema não cobria: a baixa parou em zero
+    # e a diferença fica aqui até alguém conferir a prateleira
+    id = db.Column(db.Integer, primary_key=True)
+    data = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    venda_id = db.Column(db.Integer, nullable=False)  # sem FK: sobrevive ao arquivamento da venda
+    produto_id = db.Column(db.Integer, db.ForeignKey('produto.id'), nullable=False)
+    quantidade = db.Column(db.Integer, nullable=False)
+    resolvida = db.Column(db.Boolean, nullable=False, default=False)
+    
+    __table_args__ = (db.Index('ix_divergencia_estoque_resolvida_id', 'resolvida', 'id'),)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'data': self.data.isoformat(sep=' '),
+            'venda_id': self.venda_id,
+            'produto_id': self.produto_id,
+            'quantidade': self.quantidade,
+            'resolvida': self.resolvida
+        }
+
+class EventoAuditoria(db.Model):
+    # Trilha de auditoria, só acrescentada (ver RegistroAuditoria)
+    id = db.Column(db.Integer, primary_key=True)
+    data = db.Column(db.DateTime, nullable=False, index=True)
+    usuario_id = db.Column(db.Integer, db.ForeignKey('usuario.id'))  # None em login recusado
+    acao = db.Column(db.String(40), nullable=False)
+    alvo = db.Column(db.String(100))  # ex.: 'venda:12', 'cliente:7'
+    detalhes = db.Column(db.Text)  # JSON
+    ip = db.Column(db.String(45))
+    
+    __table_args__ = (db.Index('ix_evento_auditoria_usuario_data', 'usuario_id', 'data'),)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'data': self.data.isoformat(sep=' '),
+            'usuario_id': self.usuario_id,
+            'acao': self.acao,
+            'alvo': self.alvo,
+            'detalhes': json.loads(self.detalhes) if self.detalhes else {},
+            'ip': self.ip
+        }
+
+class Contador(db.Model):
+    nome = db.Column(db.String(50), primary_key=True)
+    valor = db.Column(db.Integer, nullable=False, default=0)
 
 class MovimentacaoCaixa(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    data = db.Column(db.DateTime, default=datetime.now)
+    data = db.Column(db.DateTime, default=datetime.now, index=True)
     usuario_id = db.Column(db.Integer, db.ForeignKey('usuario.id'), nullable=False)
     tipo = db.Column(db.String(20), nullable=False)  # 'sangria' ou 'suprimento'
     valor = db.Column(db.Float, nullable=False)
     especificacao = db.Column(db.String(200))
     senha_admin = db.Column(db.String(200), nullable=False)
 
+# ===== EVENTOS DE PRODUTOS =====
+# As alterações em Produto são coletadas no flush e só publicadas após o commit,
+# assim estruturas em memória nunca enxergam dados de uma transação desfeita.
+_ouvintes_produto = []
+
+def ao_alterar_produtos(func):
+    _ouvintes_produto.append(func)
+    return func
+
+def estado_produto(produto):
+    estado = produto.to_dict()
+    estado['ativo'] = produto.ativo is not False
+    return estado
+
+def registrar_alteracao_produtos(sessao, estados):
+    pendentes = sessao.info.setdefault('produtos_alterados', {})
+    for estado in estados:
+        pendentes[estado['id']] = estado
+
+def proxima_versao_catalogo(sessao):
+    # Uma versão nova por transação, reservada no contador dentro da própria transação
+    if 'versao_catalogo' not in sessao.info:
+        versao = sessao.execute(
+            update(Contador).where(Contador.nome == 'catalogo')
+            .values(valor=Contador.valor + 1).returning(Contador.valor)
+        ).scalar()
+        if versao is None:
+            versao = 1
+            sessao.execute(insert(Contador).values(nome='catalogo', valor=versao))
+        sessao.info['versao_catalogo'] = versao
+    return sessao.info['versao_catalogo']
+
+def versao_atual_catalogo():
+    contador = db.session.get(Contador, 'catalogo')
+    return contador.valor if contador else 0
+
+@event.listens_for(Session, 'before_flush')
+def _versionar_produtos_alterados(sessao, contexto, instancias):
+    for obj in list(sessao.new) + list(sessao.dirty):
+        if isinstance(obj, Produto) and sessao.is_modified(obj):
+            obj.versao = proxima_versao_catalogo(sessao)
+
+@event.listens_for(Session, 'after_flush')
+def _coletar_produtos_alterados(sessao, contexto):
+    estados = [estado_produto(obj) for obj in list(sessao.new) + list(sessao.dirty)
+               if isinstance(obj, Produto)]
+    estados += [{'id': obj.id, 'ativo': False} for obj in sessao.deleted if isinstance(obj, Produto)]
+    if estados:
+        registrar_alteracao_produtos(sessao, estados)
+
+@event.listens_for(Session, 'after_commit')
+def _publicar_produtos_alterados(sessao):
+    versao = sessao.info.pop('versao_catalogo', None)
+    pendentes = sessao.info.pop('produtos_alterados', None)
+    if not pendentes and versao is None:
+        return
+    # Versão gravada sem produto alterado (UPDATE que não achou nenhuma linha) também é
+    # publicada, vazia: a sequência de versões do stream de eventos não fica com lacuna
+    estados = list(pendentes.values()) if pendentes else []
+    for ouvinte in _ouvintes_produto:
+        ouvinte(estados, versao)
+
+@event.listens_for(Session, 'after_rollback')
+def _descartar_produtos_alterados(sessao):
+    sessao.info.pop('versao_catalogo', None)
+    sessao.info.pop('produtos_alterados', None)
+
+# ===== FILA DE ESCRITA =====
+@contextmanager
+def savepoint():
+    # SAVEPOINT que, se desfeito, também desfaz o que foi anotado em session.info dentro
+    # dele (versão do catálogo reservada, produtos alterados, etiquetas do cache)
+    info = {k: copy.copy(v) for k, v in db.session.info.items()}
+    try:
+        with db.session.begin_nested():
+            yield
+    except Exception:
+        db.session.info.clear()
+        db.session.info.update(info)
+        raise
+
+class FilaEscrita:
+    # Uma thread escritora executa as gravações em ordem de chegada. Cada gravação roda
+    # em um SAVEPOINT e o lote acumulado é confirmado com um único commit.
+    def __init__(self, tamanho_lote=64):
+        self.tamanho_lote = tamanho_lote
+        self._fila = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _iniciar(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._executar, name='fila-escrita', daemon=True)
+                self._thread.start()
+
+    def executar(self, func, *args, **kwargs):
+        self._iniciar()
+        futuro = Future()
+        self._fila.put((futuro, func, args, kwargs))
+        return futuro.result()
+
+    def _executar(self):
+        with app.app_context():
+            while True:
+                lote = [self._fila.get()]
+                while len(lote) < self.tamanho_lote:
+                    try:
+                        lote.append(self._fila.get_nowait())
+                    except queue.Empty:
+                        break
+                self._gravar_lote(lote)
+
+    def _gravar_lote(self, lote):
+        concluidos = []
+        for futuro, func, args, kwargs in lote:
+            try:
+                with savepoint():
+                    resultado = func(*args, **kwargs)
+                concluidos.append((futuro, resultado))
+            except Exception as e:
+                futuro.set_exception(e)
+        try:
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            for futuro, _ in concluidos:
+                futuro.set_exception(e)
+            return
+        finally:
+            db.session.remove()
+        for futuro, resultado in concluidos:
+            futuro.set_result(resultado)
+
+fila_escrita = FilaEscrita()
+TENTATIVAS_ESCRITA = 3
+
+def _pode_repetir(erro):
+    # Conflito de chave única com uma gravação concorrente (a nova tentativa já enxerga a
+    # linha gravada pela outra) ou banco ainda travado depois do busy_timeout
+    if isinstance(erro, IntegrityError):
+        return True
+    return isinstance(erro, OperationalError) and 'locked' in str(erro.orig)
+
+def executar_escrita(func, *args, **kwargs):
+    # A função grava na sessão sem fazer commit e deve devolver valores simples,
+    # pois com a fila ativa ela roda em outra thread e outra sessão. Conflitos
+    # passageiros são repetidos até TENTATIVAS_ESCRITA vezes, com espera aleatória.
+    for tentativa in range(1, TENTATIVAS_ESCRITA + 1):
+        try:
+            return _executar_escrita(func, *args, **kwargs)
+        except (IntegrityError, OperationalError) as e:
+            if tentativa == TENTATIVAS_ESCRITA or not _pode_repetir(e):
+                raise
+            time.sleep(random.uniform(0, 0.05 * 2 ** tentativa))
+
+def _executar_escrita(func, *args, **kwargs):
+    if app.config['FILA_ESCRITA']:
+        inicio = time.perf_counter()
+        try:
+            return fila_escrita.executar(func, *args, **kwargs)
+        finally:
+            rota = (('endpoint', request.endpoint if has_request_context() else 'segundo_plano'),)
+            metricas.registrar(('armarinho_fila_escrita_segundos', rota, time.perf_counter() - inicio))
+    try:
+        resultado = func(*args, **kwargs)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return resultado
+
+# ===== ÍNDICE DE BUSCA DE PRODUTOS =====
+def normalizar_texto(texto):
+    texto = unicodedata.normalize('NFKD', texto or '')
+    texto = ''.join(c for c in texto if not unicodedata.combining(c))
+    return ' '.join(texto.casefold().split())
+
+def _gramas(texto, n):
+    return {texto[i:i + n] for i in range(len(texto) - n + 1)}
+
+class IndiceProdutos:
+    # Índice de bigramas/trigramas dos produtos ativos, local ao processo.
+    # É carregado do banco na primeira busca e depois mantido pelos eventos de commit.
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._carregado = False
+        self._produtos = {}
+        self._codigos = {}
+        self._textos = {}
+        self._bigramas = defaultdict(set)
+        self._trigramas = defaultdict(set)
+
+    def _remover(self, produto_id):
+        textos = self._textos.pop(produto_id, None)
+        produto = self._produtos.pop(produto_id, None)
+        if produto is not None and self._codigos.get(produto['codigo']) == produto_id:
+            del self._codigos[produto['codigo']]
+        if textos is None:
+            return
+        for texto in textos:
+            for grama in _gramas(texto, 2):
+                self._descartar(self._bigramas, grama, produto_id)
+            for grama in _gramas(texto, 3):
+                self._descartar(self._trigramas, grama, produto_id)
+
+    @staticmethod
+    def _descartar(postagens, grama, produto_id):
+        ids = postagens.get(grama)
+        if ids is not None:
+            ids.discard(produto_id)
+            if not ids:
+                del postagens[grama]
+
+    def _inserir(self, estado):
+        textos = (normalizar_texto(estado.get('codigo')), normalizar_texto(estado['descricao']))
+        self._textos[estado['id']] = textos
+        self._produtos[estado['id']] = {k: v for k, v in estado.items() if k != 'ativo'}
+        if estado.get('codigo'):
+            self._codigos[estado['codigo']] = estado['id']
+        for texto in textos:
+            for grama in _gramas(texto, 2):
+                self._bigramas[grama].add(estado['id'])
+            for grama in _gramas(texto, 3):
+                self._trigramas[grama].add(estado['id'])
+
+    def aplicar(self, estados):
+        with self._lock:
+            # Ainda não carregado: a carga, feita depois deste commit, já verá os dados novos
+            if not self._carregado:
+                return
+            for estado in estados:
+                self._remover(estado['id'])
+                if estado.get('ativo', True):
+                    self._inserir(estado)
+
+    def recarregar(self, somente_se_vazio=False):
+        with self._lock:
+            if somente_se_vazio and self._carregado:
+                return
+            self._produtos.clear()
+            self._codigos.clear()
+            self._textos.clear()
+            self._bigramas.clear()
+            self._trigramas.clear()
+            ativos = db.session.execute(db.select(*COLUNAS_PRODUTO).where(Produto.ativo == True)).all()
+            for estado in como_dicts(ativos):
+                self._inserir(estado)
+            self._carregado = True
+
+    def _candidatos(self, termo):
+        if len(termo) == 1:
+            return list(self._textos)
+        if len(termo) == 2:
+            return self._bigramas.get(termo, ())
+        postagens = sorted((self._trigramas.get(g, set()) for g in _gramas(termo, 3)), key=len)
+        return postagens[0].intersection(*postagens[1:])
+
+    @staticmethod
+    def _relevancia(termo, codigo, descricao):
+        if codigo == termo:
+            nivel = 0
+        elif codigo.startswith(termo):
+            nivel = 1
+        elif descricao.startswith(termo):
+            nivel = 2
+        elif f' {termo}' in descricao:
+            nivel = 3
+        else:
+            nivel = 4
+        posicao = descricao.find(termo)
+        return (nivel, posicao if posicao >= 0 else len(descricao), len(descricao), descricao)
+
+    def buscar(self, termo, limite=10):
+        termo = normalizar_texto(termo)
+        if not termo:
+            return []
+        if not self._carregado:
+            self.recarregar(somente_se_vazio=True)
+        with self._lock:
+            encontrados = []
+            for produto_id in self._candidatos(termo):
+                codigo, descricao = self._textos[produto_id]
+                if termo in codigo or termo in descricao:
+                    encontrados.append((self._relevancia(termo, codigo, descricao), produto_id))
+            melhores = heapq.nsmallest(limite, encontrados)
+            return [dict(self._produtos[produto_id]) for _, produto_id in melhores]
+
+    def por_codigos(self, codigos):
+        # Busca exata pelo código de barras: uma consulta de dicionário por código
+        if not self._carregado:
+            self.recarregar(somente_se_vazio=True)
+        with self._lock:
+            resultado = []
+            for codigo in codigos:
+                produto_id = self._codigos.get(codigo)
+                resultado.append(dict(self._produtos[produto_id]) if produto_id is not None else None)
+            return resultado
+
+indice_produtos = IndiceProdutos()
+
+@ao_alterar_produtos
+def _atualizar_indice_produtos(estados, versao):
+    indice_produtos.aplicar(estados)
+
+# ===== TRANSMISSÃO DE ALTERAÇÕES DE PRODUTOS =====
+# Cada commit que altera produtos vira um evento, identificado pela versão do catálogo,
+# entregue por Server-Sent Events a todos os terminais conectados a este processo. Os
+# últimos eventos ficam guardados para quem reconectar com Last-Event-ID; se houver
+# lacuna (histórico esgotado ou gravação feita por outro processo) o terminal recebe
+# "sincronizar" e busca a diferença em /api/catalogo?desde=.
+HISTORICO_EVENTOS_PRODUTOS = 1000
+INTERVALO_PING_EVENTOS = 15
+
+class TransmissorProdutos:
+    def __init__(self, historico=HISTORICO_EVENTOS_PRODUTOS):
+        self._condicao = threading.Condition()
+        self._eventos = deque(maxlen=historico)  # (versão, dados já serializados)
+    
+    def publicar(self, versao, alteracoes):
+        dados = json.dumps(alteracoes, separators=(',', ':'))
+        with self._condicao:
+            self._eventos.append((versao, dados))
+            self._condicao.notify_all()
+    
+    def ultima_versao(self):
+        with self._condicao:
+            return self._eventos[-1][0] if self._eventos else None
+    
+    def cobre(self, ultima):
+        # O histórico ainda tem todos os eventos posteriores a ultima?
+        with self._condicao:
+            return any(versao == ultima + 1 for versao, _ in self._eventos)
+    
+    def aguardar(self, ultima, tempo_limite):
+        # Devolve (eventos posteriores a ultima, houve_lacuna); bloqueia até haver algum
+        # ou até o tempo limite
+        with self._condicao:
+            self._condicao.wait_for(lambda: self._eventos and self._eventos[-1][0] > ultima, tempo_limite)
+            novos = [evento for evento in self._eventos if evento[0] > ultima]
+        lacuna = bool(novos) and novos[0][0] != ultima + 1
+        return novos, lacuna
+
+transmissor_produtos = TransmissorProdutos()
+
+@ao_alterar_produtos
+def _transmitir_produtos(estados, versao):
+    if versao is None:
+        return  # sem versão não há como retomar; os terminais recuperam pela sincronização periódica
+    transmissor_produtos.publicar(versao, [
+        {'id': e['id'], 'ativo': e['ativo'], 'preco': e.get('preco_venda'), 'estoque': e.get('estoque')}
+        for e in estados
+    ])
+
+def gerar_eventos_produtos(ultima, sincronizar=False):
+    yield 'retry: 5000\n\n'
+    if sincronizar:
+        yield f'id: {ultima}\nevent: sincronizar\ndata: {{}}\n\n'
+    while True:
+        eventos, lacuna = transmissor_produtos.aguardar(ultima, INTERVALO_PING_EVENTOS)
+        if not eventos:
+            yield ': ping\n\n'  # mantém a conexão viva em proxies e detecta terminais desconectados
+            continue
+        if lacuna:
+            ultima = eventos[-1][0]
+            yield f'id: {ultima}\nevent: sincronizar\ndata: {{}}\n\n'
+            continue
+        for versao, dados in eventos:
+            yield f'id: {versao}\nevent: produtos\ndata: {dados}\n\n'
+        ultima = eventos[-1][0]
+
+# ===== CACHE DE CONSULTAS =====
+# Resultados de leituras frequentes que vão ao banco (cliente por id, listagem e busca de
+# clientes, fechamentos de dias anteriores na base de relatórios), com limite de entradas (LRU) e validade. A busca de produtos fica de fora: o
+# índice em memória já a responde sem banco, e cada venda invalidaria todas as entradas.
+# Cada entrada leva etiquetas das dependências: 'cliente:7' para um registro, 'cliente:*'
+# para quem depende da tabela toda.
+# Os commits invalidam as etiquetas do que gravaram; a validade cobre o que este processo
+# não vê (outros processos, SQL direto). Falhas simultâneas da mesma chave fazem uma só
+# consulta: as demais esperam o resultado da primeira.
+class CacheConsultas:
+    def __init__(self, capacidade, validade):
+        self.capacidade = capacidade
+        self.validade = validade
+        self._lock = threading.Lock()
+        self._entradas = OrderedDict()  # chave -> (expira_em, valor, etiquetas), da menos para a mais usada
+        self._por_etiqueta = defaultdict(set)
+        self._em_andamento = {}  # chave -> Future da consulta em curso
+        self._geracao = 0  # muda a cada invalidação; resultado carregado antes dela não é guardado
+        self._contagens = dict.fromkeys(['acerto', 'falha', 'coalescida', 'expirada', 'invalidada', 'descartada'], 0)
+    
+    def obter(self, chave, etiquetas, carregar):
+        with self._lock:
+            entrada = self._entradas.get(chave)
+            if entrada is not None:
+                if entrada[0] > time.monotonic():
+                    self._entradas.move_to_end(chave)
+                    self._contagens['acerto'] += 1
+                    return entrada[1]
+                self._remover(chave)
+                self._contagens['expirada'] += 1
+            futuro = self._em_andamento.get(chave)
+            dono = futuro is None
+            if dono:
+                futuro = self._em_andamento[chave] = Future()
+                self._contagens['falha'] += 1
+                geracao = self._geracao
+            else:
+                self._contagens['coalescida'] += 1
+        if not dono:
+            return futuro.result()
+        
+        try:
+            valor = carregar()
+        except BaseException as e:
+            with self._lock:
+                del self._em_andamento[chave]
+            futuro.set_exception(e)
+            raise
+        with self._lock:
+            del self._em_andamento[chave]
+            if geracao == self._geracao:
+                self._entradas[chave] = (time.monotonic() + self.validade, valor, tuple(etiquetas))
+                for etiqueta in etiquetas:
+                    self._por_etiqueta[etiqueta].add(chave)
+                while len(self._entradas) > self.capacidade:
+                    self._remover(next(iter(self._entradas)))
+                    self._contagens['descartada'] += 1
+        futuro.set_result(valor)
+        return valor
+    
+    def _remover(self, chave):
+        _, _, etiquetas = self._entradas.pop(chave)
+        for etiqueta in etiquetas:
+            chaves = self._por_etiqueta.get(etiqueta)
+            if chaves is not None:
+                chaves.discard(chave)
+                if not chaves:
+                    del self._por_etiqueta[etiqueta]
+    
+    def invalidar(self, etiquetas):
+        # 'cliente:7' derruba as entradas de 'cliente:7' e de 'cliente:*';
+        # 'cliente:*' derruba todas as entradas de clientes
+        with self._lock:
+            self._geracao += 1
+            alvos = set()
+            for etiqueta in etiquetas:
+                grupo, _, item = etiqueta.partition(':')
+                if item == '*':
+                    for outra, chaves in self._por_etiqueta.items():
+                        if outra.startswith(f'{grupo}:'):
+                            alvos |= chaves
+                else:
+                    alvos |= self._por_etiqueta.get(etiqueta, set())
+                    alvos |= self._por_etiqueta.get(f'{grupo}:*', set())
+            for chave in alvos:
+                self._remover(chave)
+            self._contagens['invalidada'] += len(alvos)
+    
+    def limpar(self):
+        with self._lock:
+            self._geracao += 1
+            self._entradas.clear()
+            self._por_etiqueta.clear()
+    
+    def estatisticas(self):
+        with self._lock:
+            return dict(self._contagens, entradas=len(self._entradas))
+
+cache_consultas = CacheConsultas(app.config['CACHE_CONSULTAS_ITENS'], app.config['CACHE_CONSULTAS_TTL'])
+
+@event.listens_for(Session, 'after_flush')
+def _coletar_etiquetas_cache(sessao, contexto):
+    etiquetas = sessao.info.setdefault('etiquetas_cache', set())
+    for obj in itertools.chain(sessao.new, sessao.dirty, sessao.deleted):
+        if isinstance(obj, Cliente):
+            etiquetas.add(f'cliente:{obj.id}')
+
+@event.listens_for(Session, 'after_commit')
+def _invalidar_cache(sessao):
+    etiquetas = sessao.info.pop('etiquetas_cache', None)
+    if etiquetas:
+        cache_consultas.invalidar(etiquetas)
+
+@event.listens_for(Session, 'after_rollback')
+def _descartar_etiquetas_cache(sessao):
+    sessao.info.pop('etiquetas_cache', None)
+
+# ===== PAGINAÇÃO POR CURSOR =====
+# O cursor guarda a chave de ordenação da última linha entregue; a página seguinte
+# começa por uma busca no índice a partir dela, em tempo constante em qualquer profundidade.
+LIMITE_MAXIMO_PAGINA = 200
+
+def codificar_cursor(valores):
+    return base64.urlsafe_b64encode(json.dumps(valores).encode('utf-8')).decode('ascii')
+
+def decodificar_cursor(cursor):
+    if not cursor:
+        return None
+    try:
+        valores = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (ValueError, UnicodeError):
+        raise ValueError('Cursor inválido')
+    if not isinstance(valores, list):
+        raise ValueError('Cursor inválido')
+    return valores
+
+def limite_pagina(padrao):
+    limite = request.args.get('limite', padrao, type=int)
+    return max(1, min(limite, LIMITE_MAXIMO_PAGINA))
+
+def paginar(consulta, colunas, limite, cursor, chave):
+    # colunas: ordenação da consulta (sempre terminando no id); chave: valores do cursor por linha
+    if cursor is not None:
+        if len(cursor) != len(colunas):
+            raise ValueError('Cursor inválido')
+        consulta = consulta.filter(tuple_(*colunas) > tuple_(*cursor))
+    consulta = consulta.order_by(*colunas).limit(limite + 1)
+    # Query do ORM ou select do Core (ver LEITURA SEM ORM): chave recebe o objeto ou a linha
+    linhas = db.session.execute(consulta).all() if isinstance(consulta, Select) else consulta.all()
+    proximo = codificar_cursor(chave(linhas[limite - 1])) if len(linhas) > limite else None
+    return linhas[:limite], proximo
+
+def resposta_paginada(itens, proximo):
+    resposta = jsonify(itens)
+    if proximo:
+        resposta.headers['X-Proximo-Cursor'] = proximo
+    return resposta
+
+# ===== LEITURA SEM ORM =====
+# As listagens longas (catálogo, páginas de produtos e clientes, carga do índice) selecionam
+# só as colunas da resposta e montam os dicts direto das linhas do Core, sem objetos do
+# modelo: a hidratação e o identity map custavam mais CPU que a própria consulta.
+# As chaves são os nomes das colunas, iguais às de to_dict().
+COLUNAS_PRODUTO = (Produto.id, Produto.codigo, Produto.descricao, Produto.preco_venda, Produto.estoque)
+COLUNAS_CLIENTE = (Cliente.id, Cliente.nome, Cliente.tipo, Cliente.documento, Cliente.telefone,
+                   Cliente.email, Cliente.endereco)
+LINHAS_POR_PEDACO_JSON = 1000
+
+def como_dicts(linhas):
+    # dict(zip()) com os nomes das colunas custa uma fração de Row._asdict() por linha
+    if not linhas:
+        return []
+    chaves = linhas[0]._fields
+    return [dict(zip(chaves, linha)) for linha in linhas]
+
+def gerar_lista_json(consulta, inicio='', fim=''):
+    # Envia `inicio` + a lista JSON das linhas + `fim`, serializando um lote de linhas por
+    # vez enquanto o cursor avança: nem a lista inteira nem o texto inteiro ficam na memória
+    yield inicio + '['
+    separador = ''
+    resultado = db.session.execute(consulta.execution_options(yield_per=LINHAS_POR_PEDACO_JSON))
+    for lote in resultado.partitions():
+        yield separador + json.dumps(como_dicts(lote), ensure_ascii=False)[1:-1]
+        separador = ','
+    yield ']' + fim
+
+# ===== BUSCA DE CLIENTES (FTS5) =====
+# Tabela FTS5 de conteúdo externo sobre cliente.nome, mantida por triggers do próprio SQLite.
+DDL_BUSCA_CLIENTES = [
+    '''CREATE VIRTUAL TABLE IF NOT EXISTS cliente_fts USING fts5(
+        nome, content='cliente', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3')''',
+    '''CREATE TRIGGER IF NOT EXISTS cliente_fts_ai AFTER INSERT ON cliente BEGIN
+        INSERT INTO cliente_fts(rowid, nome) VALUES (new.id, new.nome);
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS cliente_fts_ad AFTER DELETE ON cliente BEGIN
+        INSERT INTO cliente_fts(cliente_fts, rowid, nome) VALUES ('delete', old.id, old.nome);
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS cliente_fts_au AFTER UPDATE OF nome ON cliente BEGIN
+        INSERT INTO cliente_fts(cliente_fts, rowid, nome) VALUES ('delete', old.id, old.nome);
+        INSERT INTO cliente_fts(rowid, nome) VALUES (new.id, new.nome);
+    END''',
+]
+
+def criar_busca_clientes():
+    existia = db.session.execute(text(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'cliente_fts'"
+    )).first() is not None
+    for ddl in DDL_BUSCA_CLIENTES:
+        db.session.execute(text(ddl))
+    if not existia:
+        # Banco criado antes da busca FTS: indexa os clientes já cadastrados
+        db.session.execute(text("INSERT INTO cliente_fts(cliente_fts) VALUES ('rebuild')"))
+
+def _consulta_fts(busca):
+    tokens = re.findall(r'\w+', busca)
+    return ' '.join(f'"{t}"*' for t in tokens)
+
+def _fim_prefixo(prefixo):
+    return prefixo[:-1] + chr(ord(prefixo[-1]) + 1)
+
+def buscar_clientes(busca, limite=20, cursor=None):
+    documento = re.sub(r'[.\-/\s]', '', busca)
+    if documento.isdigit():
+        # Intervalo sobre o índice único de documento, equivalente a LIKE 'prefixo%'
+        consulta = db.select(*COLUNAS_CLIENTE).where(
+            Cliente.documento >= documento,
+            Cliente.documento < _fim_prefixo(documento)
+        )
+        return paginar(consulta, [Cliente.documento], limite, cursor, lambda c: [c.documento])
+    
+    consulta = _consulta_fts(busca)
+    if not consulta:
+        return [], None
+    
+    # Ordenação por relevância (bm25) e id; o cursor guarda o par da última linha
+    parametros = {'consulta': consulta, 'limite': limite + 1, 'score': None, 'id': None}
+    filtro = ''
+    if cursor is not None:
+        if len(cursor) != 2:
+            raise ValueError('Cursor inválido')
+        parametros['score'], parametros['id'] = cursor
+        filtro = 'WHERE (score, id) > (:score, :id)'
+    # MATERIALIZED: sem ele o SQLite achata a subconsulta e bm25() no WHERE não é confiável
+    ranking = db.session.execute(text(f'''
+        WITH ranking AS MATERIALIZED (
+            SELECT rowid AS id, bm25(cliente_fts) AS score FROM cliente_fts
+            WHERE cliente_fts MATCH :consulta
+        )
+        SELECT id, score FROM ranking {filtro}
+        ORDER BY score, id
+        LIMIT :limite
+    '''), parametros).all()
+    
+    proximo = None
+    if len(ranking) > limite:
+        proximo = codificar_cursor([ranking[limite - 1].score, ranking[limite - 1].id])
+    ranking = ranking[:limite]
+    por_id = {c.id: c for c in db.session.execute(
+        db.select(*COLUNAS_CLIENTE).where(Cliente.id.in_([r.id for r in ranking])))}
+    return [por_id[r.id] for r in ranking if r.id in por_id], proximo
+
+# ===== GRAVAÇÃO DE VENDAS =====
+LIMITE_LOTE_VENDAS = 500
+
+def validar_itens_venda(itens):
+    if not isinstance(itens, list):
+        raise ValueError('Itens da venda inválidos')
+    
+    validados = []
+    for item in itens:
+        try:
+            produto_id = int(item['produto_id'])
+            quantidade = int(item['quantidade'])
+            preco_unitario = float(item['preco_unitario'])
+        except (KeyError, TypeError, ValueError):
+            raise ValueError('Item da venda inválido')
+        if quantidade <= 0:
+            raise ValueError('Quantidade deve ser maior que zero')
+        validados.append({'produto_id': produto_id, 'quantidade': quantidade, 'preco_unitario': preco_unitario})
+    return validados
+
+def preparar_venda(dados):
+    if not isinstance(dados, dict):
+        raise ValueError('Venda inválida')
+    try:
+        total = float(dados['total'])
+    except (KeyError, TypeError, ValueError):
+        raise ValueError('Total da venda inválido')
+    
+    # Vendas guardadas offline trazem a hora em que foram feitas no terminal
+    data = datetime.now()
+    if dados.get('data'):
+        try:
+            data = datetime.fromisoformat(dados['data'])
+            if data.tzinfo is not None:
+                data = data.astimezone().replace(tzinfo=None)
+        except (TypeError, ValueError):
+            raise ValueError('Data da venda inválida')
+    
+    chave = str(dados.get('chave_idempotencia') or '').strip()
+    if len(chave) > 64:
+        raise ValueError('Chave de idempotência muito longa')
+    
+    return {
+        'cliente_id': dados.get('cliente_id'),
+        'total': total,
+        'tipo_cupom': dados.get('tipo_cupom', 'nao_fiscal'),
+        'data': data,
+        'chave_idempotencia': chave or None,
+        'itens': validar_itens_venda(dados.get('itens', [])),
+        # Venda feita com o terminal sem conexão: a mercadoria já saiu, então é gravada
+        # mesmo que o estoque do sistema não a cubra; a falta vira DivergenciaEstoque
+        'conferir_estoque': not dados.get('offline')
+    }
+
+def _resultado_venda(venda_id, data, total, duplicada=False):
+    return {
+        'venda_id': venda_id,
+        'data': data.strftime('%d/%m/%Y %H:%M:%S'),
+        'total': total,
+        'duplicada': duplicada
+    }
+
+class EstoqueInsuficiente(Exception):
+    def __init__(self, produtos):
+        self.produtos = produtos  # [{'id', 'descricao', 'estoque'}] dos que não têm o suficiente
+        super().__init__('Estoque insuficiente: ' + ', '.join(
+            f"{p['descricao']} (disponível: {p['estoque']})" for p in produtos))
+
+def gravar_vendas(usuario_id, vendas):
+    # Grava vendas já preparadas com um número fixo de comandos, qualquer que seja o
+    # tamanho do lote. Vendas cuja chave de idempotência já existe não são regravadas.
+    chaves = {v['chave_idempotencia'] for v in vendas if v['chave_idempotencia']}
+    existentes = {}
+    if chaves:
+        existentes = {
+            linha.chave_idempotencia: _resultado_venda(linha.id, linha.data, linha.total, duplicada=True)
+            for linha in db.session.execute(
+                db.select(Venda.chave_idempotencia, Venda.id, Venda.data, Venda.total)
+                .where(Venda.chave_idempotencia.in_(chaves))
+            )
+        }
+    
+    novas = []
+    for venda in vendas:
+        chave = venda['chave_idempotencia']
+        if chave is None or chave not in existentes:
+            novas.append(venda)
+            if chave is not None:
+                existentes[chave] = None  # repetida dentro do próprio lote
+    
+    if not any(v['conferir_estoque'] and v['itens'] for v in novas):
+        gravadas = _inserir_vendas(usuario_id, novas)
+    else:
+        # Venda recusada não gasta versão do catálogo: a reserva feita pela baixa de estoque
+        # é desfeita com o SAVEPOINT, no contador e em session.info
+        try:
+            with savepoint():
+                gravadas = _inserir_vendas(usuario_id, novas)
+        except EstoqueInsuficiente:
+            # Algum produto acabou no meio do lote: grava venda a venda e recusa só as afetadas
+            gravadas = {}
+            for venda in novas:
+                try:
+                    with savepoint():
+                        gravadas.update(_inserir_vendas(usuario_id, [venda]))
+                except EstoqueInsuficiente as e:
+                    gravadas[id(venda)] = {'error': str(e), 'produtos': e.produtos}
+    
+    for venda in novas:
+        chave = venda['chave_idempotencia']
+        if chave is not None and existentes[chave] is None:
+            resultado = gravadas[id(venda)]
+            existentes[chave] = resultado if 'error' in resultado else dict(resultado, duplicada=True)
+    
+    return [gravadas.get(id(v)) or existentes[v['chave_idempotencia']] for v in vendas]
+
+def _inserir_vendas(usuario_id, vendas):
+    # A baixa de estoque vem primeiro: se faltar algum produto, nada mais é gravado
+    quantidades = defaultdict(int)
+    conferir = set()
+    for venda in vendas:
+        for item in venda['itens']:
+            quantidades[item['produto_id']] += item['quantidade']
+            if venda['conferir_estoque']:
+                conferir.add(item['produto_id'])
+    faltas = baixar_estoque(quantidades, conferir) if quantidades else {}
+    
+    linhas = [{
+        'usuario_id': usuario_id,
+        'cliente_id': v['cliente_id'],
+        'total': v['total'],
+        'tipo_cupom': v['tipo_cupom'],
+        'data': v['data'],
+        'cancelada': False,
+        'chave_idempotencia': v['chave_idempotencia']
+    } for v in vendas]
+    ids = []
+    if linhas:
+        ids = db.session.scalars(
+            insert(Venda).returning(Venda.id, sort_by_parameter_order=True), linhas
+        ).all()
+    
+    # Todos os itens em um único executemany, sem carregar nada na sessão
+    itens = []
+    gravadas = {}
+    for venda, venda_id in zip(vendas, ids):
+        itens.extend(dict(item, venda_id=venda_id) for item in venda['itens'])
+        gravadas[id(venda)] = _resultado_venda(venda_id, venda['data'], venda['total'])
+    if itens:
+        db.session.execute(insert(ItemVenda), itens)
+    acumular_fechamento(db.session, [(v['data'].date(), usuario_id, 'vendas', v['total']) for v in vendas])
+    acumular_giro(db.session, [(v['data'], item['produto_id'], item['quantidade'],
+                                item['quantidade'] * item['preco_unitario'])
+                               for v in vendas for item in v['itens']])
+    enfileirar_cupons(db.session, ids)
+    if faltas:
+        registrar_divergencias(vendas, ids, faltas)
+    return gravadas
+
+def registrar_divergencias(vendas, ids, faltas):
+    # O que faltou de cada produto é atribuído às vendas offline do lote que o levaram,
+    # da mais recente para a mais antiga
+    faltas = dict(faltas)
+    linhas = []
+    for venda, venda_id in reversed(list(zip(vendas, ids))):
+        if venda['conferir_estoque']:
+            continue
+        for item in venda['itens']:
+            falta = min(faltas.get(item['produto_id'], 0), item['quantidade'])
+            if falta > 0:
+                faltas[item['produto_id']] -= falta
+                linhas.append({'venda_id': venda_id, 'produto_id': item['produto_id'], 'quantidade': falta,
+                               'data': venda['data'], 'resolvida': False})
+    if linhas:
+        db.session.execute(insert(DivergenciaEstoque), linhas)
+
+def baixar_estoque(quantidades, conferir=()):
+    # quantidades: produto_id -> unidades que saem do estoque (negativo devolve).
+    # Os produtos em conferir só baixam se houver estoque suficiente. A condição vai no
+    # próprio UPDATE, avaliada sobre o valor atual da linha: duas vendas simultâneas do
+    # último item não conseguem baixar as duas, e nada é lido ou travado antes.
+    conferir = [produto_id for produto_id in conferir if quantidades.get(produto_id, 0) > 0]
+    consulta = update(Produto).where(Produto.id.in_(quantidades))
+    if conferir:
+        consulta = consulta.where(or_(
+            Produto.id.not_in(conferir),
+            Produto.estoque.is_(None),  # produto sem controle de estoque
+            Produto.estoque >= case({p: quantidades[p] for p in conferir}, value=Produto.id)
+        ))
+    atualizados = db.session.execute(
+        consulta
+        .values(estoque=Produto.estoque - case(quantidades, value=Produto.id, else_=0),
+                versao=proxima_versao_catalogo(db.session))
+        .returning(Produto.id, Produto.codigo, Produto.descricao, Produto.preco_venda,
+                   Produto.estoque, Produto.ativo),
+        execution_options={'synchronize_session': False}
+    ).all()
+    
+    faltando = set(conferir) - {linha.id for linha in atualizados}
+    if faltando:
+        # Ids que não existem continuam ignorados, como sempre foram
+        sem_estoque = [
+            {'id': linha.id, 'descricao': linha.descricao, 'estoque': linha.estoque}
+            for linha in db.session.execute(
+                db.select(Produto.id, Produto.descricao, Produto.estoque)
+                .where(Produto.id.in_(faltando)).order_by(Produto.id)
+            )
+        ]
+        if sem_estoque:
+            # As baixas já feitas por este UPDATE são desfeitas com a transação (ou SAVEPOINT)
+            raise EstoqueInsuficiente(sem_estoque)
+    
+    # Fora de conferir (venda offline) a baixa não é recusada, mas o estoque não fica
+    # negativo: para em zero e o que faltou é devolvido para registrar a divergência.
+    # O lock de escrita já é desta transação, então nada muda entre os dois UPDATEs.
+    faltas = {linha.id: min(quantidades[linha.id], -linha.estoque) for linha in atualizados
+              if quantidades[linha.id] > 0 and linha.estoque is not None and linha.estoque < 0}
+    if faltas:
+        db.session.execute(update(Produto).where(Produto.id.in_(faltas)).values(estoque=0),
+                           execution_options={'synchronize_session': False})
+    registrar_alteracao_produtos(db.session, [
+        dict(linha._mapping, estoque=0 if linha.id in faltas else linha.estoque, ativo=linha.ativo is not False)
+        for linha in atualizados
+    ])
+    return faltas
+
+# ===== FECHAMENTO DE CAIXA =====
+CAMPOS_FECHAMENTO = ['vendas', 'canceladas', 'sangrias', 'suprimentos']
+
+def acumular_fechamento(sessao, lancamentos):
+    # lancamentos: (data, usuario_id, campo, valor); agrupados e gravados em um único upsert
+    totais = {}
+    for data, usuario_id, campo, valor in lancamentos:
+        linha = totais.setdefault((data, usuario_id), dict(
+            {f'{c}_quantidade': 0 for c in CAMPOS_FECHAMENTO},
+            **{f'{c}_total': 0.0 for c in CAMPOS_FECHAMENTO},
+            data=data, usuario_id=usuario_id
+        ))
+        linha[f'{campo}_quantidade'] += 1
+        linha[f'{campo}_total'] += valor
+    if not totais:
+        return
+    
+    tabela = FechamentoCaixa.__table__
+    comando = sqlite_insert(tabela)
+    comando = comando.on_conflict_do_update(
+        index_elements=[tabela.c.data, tabela.c.usuario_id],
+        set_={coluna: tabela.c[coluna] + comando.excluded[coluna]
+              for c in CAMPOS_FECHAMENTO for coluna in (f'{c}_quantidade', f'{c}_total')}
+    )
+    sessao.execute(comando, list(totais.values()))
+
+@event.listens_for(Session, 'after_flush')
+def _acumular_fechamento_orm(sessao, contexto):
+    # Vendas e movimentações gravadas pelo ORM; gravar_vendas acumula as suas diretamente
+    lancamentos = []
+    for obj in sessao.new:
+        if isinstance(obj, MovimentacaoCaixa):
+            campo = 'sangrias' if obj.tipo == 'sangria' else 'suprimentos'
+            lancamentos.append((obj.data.date(), obj.usuario_id, campo, obj.valor))
+        elif isinstance(obj, Venda):
+            lancamentos.append((obj.data.date(), obj.usuario_id, 'vendas', obj.total))
+            if obj.cancelada:
+                lancamentos.append((obj.data.date(), obj.usuario_id, 'canceladas', obj.total))
+    for obj in sessao.dirty:
+        if isinstance(obj, Venda):
+            historico = inspect(obj).attrs.cancelada.history
+            if historico.added and historico.added[0] and not (historico.deleted and historico.deleted[0]):
+                lancamentos.append((obj.data.date(), obj.usuario_id, 'canceladas', obj.total))
+    acumular_fechamento(sessao, lancamentos)
+
+def reconstruir_fechamentos():
+    # Recalcula os totais a partir de venda e movimentacao_caixa. Os meses já arquivados
+    # estão fechados e não estão mais nessas tabelas: seus totais ficam como estão.
+    marca = arquivado_ate()
+    desde = {'desde': marca.date().isoformat() if marca else date.min.isoformat()}
+    db.session.execute(text('DELETE FROM fechamento_caixa WHERE data >= :desde'), desde)
+    db.session.execute(text('''
+        INSERT INTO fechamento_caixa (
+            data, usuario_id, vendas_quantidade, vendas_total, canceladas_quantidade, canceladas_total,
+            sangrias_quantidade, sangrias_total, suprimentos_quantidade, suprimentos_total)
+        SELECT data, usuario_id, sum(vq), sum(vt), sum(cq), sum(ct), sum(sq), sum(st), sum(pq), sum(pt)
+        FROM (
+            SELECT date(data) AS data, usuario_id,
+                   count(*) AS vq, sum(total) AS vt,
+                   sum(cancelada = 1) AS cq, sum(CASE WHEN cancelada = 1 THEN total ELSE 0 END) AS ct,
+                   0 AS sq, 0 AS st, 0 AS pq, 0 AS pt
+            FROM venda WHERE data >= :desde GROUP BY date(data), usuario_id
+            UNION ALL
+            SELECT date(data), usuario_id, 0, 0, 0, 0,
+                   sum(tipo = 'sangria'), sum(CASE WHEN tipo = 'sangria' THEN valor ELSE 0 END),
+                   sum(tipo = 'suprimento'), sum(CASE WHEN tipo = 'suprimento' THEN valor ELSE 0 END)
+            FROM movimentacao_caixa WHERE data >= :desde GROUP BY date(data), usuario_id
+        )
+        GROUP BY data, usuario_id
+    '''), desde)
+    db.session.commit()
+
+@app.cli.command('reconstruir-fechamentos')
+def reconstruir_fechamentos_comando():
+    reconstruir_fechamentos()
+    print(f'✓ {FechamentoCaixa.query.count()} fechamentos recalculados')
+
+# ===== GIRO DE PRODUTOS =====
+# Unidades vendidas por produto e dia (giro_produto), acumuladas na transação de cada venda
+# e descontadas no cancelamento. Mais vendidos e sugestão de reposição somam só os dias da
+# janela pedida, no máximo JANELA_GIRO_DIAS linhas por produto, sem ler itens de venda.
+JANELA_GIRO_DIAS = 90  # reconstruir-giro descarta os dias anteriores
+
+def acumular_giro(sessao, lancamentos):
+    # lancamentos: (data da venda, produto_id, quantidade, valor); quantidade negativa desconta
+    linhas = {}
+    for data, produto_id, quantidade, valor in lancamentos:
+        linha = linhas.setdefault((data.date(), produto_id), {
+            'data': data.date(), 'produto_id': produto_id, 'quantidade': 0, 'total': 0.0, 'ultima_venda': None
+        })
+        linha['quantidade'] += quantidade
+        linha['total'] += valor
+        if quantidade > 0 and (linha['ultima_venda'] is None or data > linha['ultima_venda']):
+            linha['ultima_venda'] = data
+    if not linhas:
+        return
+    
+    tabela = GiroProduto.__table__
+    comando = sqlite_insert(tabela)
+    # max() do SQLite com mais de um argumento devolve NULL se algum for NULL
+    ultima_atual = func.coalesce(tabela.c.ultima_venda, comando.excluded.ultima_venda)
+    ultima_nova = func.coalesce(comando.excluded.ultima_venda, tabela.c.ultima_venda)
+    comando = comando.on_conflict_do_update(
+        index_elements=[tabela.c.data, tabela.c.produto_id],
+        set_={'quantidade': tabela.c.quantidade + comando.excluded.quantidade,
+              'total': tabela.c.total + comando.excluded.total,
+              'ultima_venda': func.max(ultima_atual, ultima_nova)}
+    )
+    sessao.execute(comando, list(linhas.values()))
+
+def reconstruir_giro():
+    # Recalcula a janela a partir das vendas não canceladas; quem chama faz o commit
+    desde = date.today() - timedelta(days=JANELA_GIRO_DIAS)
+    db.session.execute(text('DELETE FROM giro_produto'))
+    db.session.execute(text('''
+        INSERT INTO giro_produto (data, produto_id, quantidade, total, ultima_venda)
+        SELECT date(v.data), i.produto_id, sum(i.quantidade), sum(i.quantidade * i.preco_unitario), max(v.data)
+        FROM venda v JOIN item_venda i ON i.venda_id = v.id
+        WHERE v.data >= :desde AND NOT coalesce(v.cancelada, 0)
+        GROUP BY date(v.data), i.produto_id
+    '''), {'desde': desde.isoformat()})
+
+@app.cli.command('reconstruir-giro')
+def reconstruir_giro_comando():
+    reconstruir_giro()
+    db.session.commit()
+    print(f'✓ Giro dos últimos {JANELA_GIRO_DIAS} dias recalculado')
+
+def giro_por_produto(dias):
+    # Vendidos, faturado e última venda de cada produto nos últimos `dias` dias (hoje incluso)
+    desde = date.today() - timedelta(days=dias - 1)
+    return (
+        db.select(GiroProduto.produto_id,
+                  func.sum(GiroProduto.quantidade).label('vendidos'),
+                  func.sum(GiroProduto.total).label('faturado'),
+                  func.max(GiroProduto.ultima_venda).label('ultima_venda'))
+        .where(GiroProduto.data >= desde)
+        .group_by(GiroProduto.produto_id)
+        .subquery('giro')
+    )
+
+def dias_giro():
+    return max(1, min(request.args.get('dias', 30, type=int), JANELA_GIRO_DIAS))
+
+def linha_giro(linha, dias):
+    return {
+        'id': linha.id,
+        'codigo': linha.codigo,
+        'descricao': linha.descricao,
+        'estoque': linha.estoque,
+        'vendidos': linha.vendidos,
+        'faturado': round(linha.faturado, 2),
+        'por_dia': round(linha.vendidos / dias, 2),
+        'ultima_venda': linha.ultima_venda.isoformat(sep=' ') if linha.ultima_venda else None,
+    }
+
+# ===== CUPONS =====
+# A venda só enfileira o cupom (trabalho_cupom, na mesma transação); threads do spool
+# montam o cupom no formato configurado e o entregam ao backend (impressora, emissor
+# fiscal ou o substituto em arquivo). Falhas voltam para a fila com espera crescente até
+# TENTATIVAS_CUPOM; o caixa nunca espera pela impressora.
+TENTATIVAS_CUPOM = 6
+PRAZO_CUPOM = 120  # segundos de posse de um trabalho; passado o prazo, outra thread o retoma
+INTERVALO_SPOOL = 5  # consulta periódica por retentativas e por trabalhos de outros processos
+COLUNAS_CUPOM = 40
+LARGURA_PDF = 227  # 80 mm, em pontos
+
+def enfileirar_cupons(sessao, venda_ids):
+    if not venda_ids:
+        return
+    sessao.execute(insert(TrabalhoCupom), [{'venda_id': venda_id} for venda_id in venda_ids])
+    sessao.info['cupons_enfileirados'] = True
+
+@event.listens_for(Session, 'after_commit')
+def _acordar_spool(sessao):
+    if sessao.info.pop('cupons_enfileirados', None):
+        spool_cupons.acordar()
+
+@event.listens_for(Session, 'after_rollback')
+def _descartar_cupons_enfileirados(sessao):
+    sessao.info.pop('cupons_enfileirados', None)
+
+def _moeda(valor):
+    return f'{valor:,.2f}'.replace(',', '_').replace('.', ',').replace('_', '.')
+
+def dados_cupom(venda_id):
+    venda = db.session.get(Venda, venda_id)
+    if venda is None:
+        raise LookupError(f'Venda {venda_id} não encontrada')
+    operador = db.session.get(Usuario, venda.usuario_id)
+    cliente = db.session.get(Cliente, venda.cliente_id) if venda.cliente_id else None
+    itens = db.session.execute(
+        db.select(ItemVenda.quantidade, ItemVenda.preco_unitario, Produto.codigo, Produto.descricao)
+        .join(Produto, Produto.id == ItemVenda.produto_id)
+        .where(ItemVenda.venda_id == venda_id).order_by(ItemVenda.id)
+    ).all()
+    return {
+        'venda_id': venda.id,
+        'data': venda.data,
+        'tipo_cupom': venda.tipo_cupom or 'nao_fiscal',
+        'operador': operador.nome if operador else '',
+        'cliente': f'{cliente.nome} - {cliente.documento}' if cliente else None,
+        'itens': [dict(item._mapping) for item in itens],
+        'total': venda.total,
+    }
+
+def linhas_cupom(cupom):
+    largura = COLUNAS_CUPOM
+    def colunas(esquerda, direita):
+        return f'{esquerda[:largura - len(direita) - 1]:<{largura - len(direita)}}{direita}'
+    linhas = [
+        NOME_LOJA.upper().center(largura),
+        ('CUPOM NÃO FISCAL' if cupom['tipo_cupom'] == 'nao_fiscal' else 'CUPOM FISCAL').center(largura),
+        colunas(f"Venda {cupom['venda_id']}", cupom['data'].strftime('%d/%m/%Y %H:%M')),
+        f"Operador: {cupom['operador']}"[:largura],
+    ]
+    if cupom['cliente']:
+        linhas.append(f"Cliente: {cupom['cliente']}"[:largura])
+    linhas.append('-' * largura)
+    for item in cupom['itens']:
+        linhas.append(f"{item['codigo'] or ''} {item['descricao']}".strip()[:largura])
+        linhas.append(colunas(f"  {item['quantidade']} x {_moeda(item['preco_unitario'])}",
+                              _moeda(item['quantidade'] * item['preco_unitario'])))
+    linhas.append('-' * largura)
+    linhas.append(colunas('TOTAL', f"R$ {_moeda(cupom['total'])}"))
+    return linhas
+
+def renderizar_texto(cupom):
+    return ('\n'.join(linhas_cupom(cupom)) + '\n').encode('utf-8')
+
+def renderizar_escpos(cupom):
+    linhas = linhas_cupom(cupom)
+    saida = bytearray(b'\x1b@\x1bt\x03')  # inicializa e seleciona a tabela PC860 (português)
+    saida += b'\x1ba\x01\x1bE\x01' + linhas[0].strip().encode('cp860', 'replace') + b'\n\x1bE\x00\x1ba\x00'
+    for linha in linhas[1:]:
+        saida += linha.encode('cp860', 'replace') + b'\n'
+    saida += b'\n\n\n\x1dVB\x00'  # avança o papel e corta
+    return bytes(saida)
+
+def renderizar_pdf(cupom):
+    # Uma página da largura da bobina, em Courier; sem dependências externas
+    linhas = linhas_cupom(cupom)
+    altura = 36 + 10 * len(linhas)
+    texto = ['BT', '/F1 8 Tf', '10 TL', f'12 {altura - 22} Td']
+    for linha in linhas:
+        escapada = linha.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+        texto.append(f'({escapada}) Tj T*')
+    texto.append('ET')
+    fluxo = '\n'.join(texto).encode('cp1252', 'replace')
+    objetos = [
+        b'<< /Type /Catalog /Pages 2 0 R >>',
+        b'<< /Type /Pages /Kids [3 0 R] /Count 1 >>',
+        b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] /Resources << /Font << /F1 4 0 R >> >> '
+        b'/Contents 5 0 R >>' % (LARGURA_PDF, altura),
+        b'<< /Type /Font /Subtype /Type1 /BaseFont /Courier /Encoding /WinAnsiEncoding >>',
+        b'<< /Length %d >>\nstream\n%s\nendstream' % (len(fluxo), fluxo),
+    ]
+    pdf = bytearray(b'%PDF-1.4\n')
+    posicoes = []
+    for numero, objeto in enumerate(objetos, 1):
+        posicoes.append(len(pdf))
+        pdf += b'%d 0 obj\n%s\nendobj\n' % (numero, objeto)
+    inicio_xref = len(pdf)
+    pdf += b'xref\n0 %d\n0000000000 65535 f \n' % (len(objetos) + 1)
+    pdf += b''.join(b'%010d 00000 n \n' % posicao for posicao in posicoes)
+    pdf += b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objetos) + 1, inicio_xref)
+    return bytes(pdf)
+
+RENDERIZADORES_CUPOM = {
+    'texto': ('.txt', renderizar_texto),
+    'escpos': ('.bin', renderizar_escpos),
+    'pdf': ('.pdf', renderizar_pdf),
+}
+
+# Backends recebem (cupom, conteúdo renderizado, extensão) e devolvem onde o cupom foi
+# entregue; qualquer exceção conta como falha da tentativa. Um emissor fiscal (SAT,
+# NFC-e) entra aqui registrando outro nome e olhando cupom['tipo_cupom'].
+BACKENDS_CUPOM = {}
+
+def backend_cupom(nome):
+    def registrar(func):
+        BACKENDS_CUPOM[nome] = func
+        return func
+    return registrar
+
+@backend_cupom('arquivo')
+def _cupom_em_arquivo(cupom, conteudo, extensao):
+    # Substituto local da impressora e do emissor fiscal
+    pasta = app.config['CUPOM_PASTA'] or os.path.join(app.instance_path, 'cupons')
+    os.makedirs(pasta, exist_ok=True)
+    caminho = os.path.join(pasta, f"{cupom['tipo_cupom']}-{cupom['venda_id']}{extensao}")
+    with open(caminho + '.tmp', 'wb') as arquivo:
+        arquivo.write(conteudo)
+    os.replace(caminho + '.tmp', caminho)
+    return caminho
+
+@backend_cupom('rede')
+def _cupom_na_impressora(cupom, conteudo, extensao):
+    # Impressora térmica em rede (porta RAW, normalmente 9100); use CUPOM_FORMATO=escpos
+    host, _, porta = app.config['CUPOM_IMPRESSORA'].rpartition(':')
+    with socket.create_connection((host, int(porta)), timeout=10) as conexao:
+        conexao.sendall(conteudo)
+    return app.config['CUPOM_IMPRESSORA']
+
+def _reservar_trabalho_cupom():
+    # Pega o trabalho vencido mais antigo e o segura por PRAZO_CUPOM; se a thread morrer
+    # no meio, ele volta sozinho para a fila
+    agora = datetime.now()
+    proximo = (
+        db.select(TrabalhoCupom.id)
+        .where(TrabalhoCupom.status == 'pendente', TrabalhoCupom.proxima_tentativa <= agora)
+        .order_by(TrabalhoCupom.proxima_tentativa, TrabalhoCupom.id).limit(1)
+        .scalar_subquery()
+    )
+    linha = db.session.execute(
+        update(TrabalhoCupom).where(TrabalhoCupom.id == proximo)
+        .values(tentativas=TrabalhoCupom.tentativas + 1,
+                proxima_tentativa=agora + timedelta(seconds=PRAZO_CUPOM))
+        .returning(TrabalhoCupom.id, TrabalhoCupom.venda_id, TrabalhoCupom.tentativas)
+    ).first()
+    return tuple(linha) if linha else None
+
+def _concluir_trabalho_cupom(trabalho_id, tentativa, destino=None, erro=None):
+    if erro is None:
+        valores = {'status': 'emitido', 'destino': destino, 'erro': None}
+    elif tentativa >= TENTATIVAS_CUPOM:
+        valores = {'status': 'falhou', 'erro': erro[:300]}
+    else:
+        espera = min(5 * 2 ** tentativa, 600)
+        valores = {'erro': erro[:300], 'proxima_tentativa': datetime.now() + timedelta(seconds=espera)}
+    db.session.execute(update(TrabalhoCupom).where(TrabalhoCupom.id == trabalho_id).values(**valores))
+
+def emitir_cupom(trabalho_id, venda_id, tentativa):
+    inicio = time.perf_counter()
+    try:
+        extensao, renderizar = RENDERIZADORES_CUPOM[app.config['CUPOM_FORMATO']]
+        cupom = dados_cupom(venda_id)
+        db.session.rollback()  # não segura a leitura enquanto fala com a impressora
+        destino = BACKENDS_CUPOM[app.config['CUPOM_BACKEND']](cupom, renderizar(cupom), extensao)
+    except Exception as e:
+        db.session.rollback()
+        app.logger.warning(f'Cupom da venda {venda_id}, tentativa {tentativa}: {e}')
+        executar_escrita(_concluir_trabalho_cupom, trabalho_id, tentativa, erro=f'{type(e).__name__}: {e}')
+        resultado = 'falhou' if tentativa >= TENTATIVAS_CUPOM else 'erro'
+    else:
+        executar_escrita(_concluir_trabalho_cupom, trabalho_id, tentativa, destino=destino)
+        resultado = 'emitido'
+    metricas.registrar(('armarinho_cupons_total', (('resultado', resultado),), 1),
+                       ('armarinho_cupom_segundos', (), time.perf_counter() - inicio))
+    return resultado
+
+def processar_cupons_pendentes():
+    # Emite, nesta thread, tudo o que estiver vencido na fila; devolve quantos trabalhos tratou
+    tratados = 0
+    while (trabalho := executar_escrita(_reservar_trabalho_cupom)) is not None:
+        emitir_cupom(*trabalho)
+        tratados += 1
+    return tratados
+
+class SpoolCupons:
+    def __init__(self):
+        self._acordar = threading.Event()
+        self._threads = []
+        self._lock = threading.Lock()
+    
+    def iniciar(self, quantidade=None):
+        quantidade = app.config['CUPOM_TRABALHADORES'] if quantidade is None else quantidade
+        with self._lock:
+            while len(self._threads) < quantidade:
+                thread = threading.Thread(target=self._trabalhar, name=f'cupons-{len(self._threads) + 1}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        return self._threads
+    
+    def acordar(self):
+        self.iniciar()
+        self._acordar.set()
+    
+    def _trabalhar(self):
+        with app.app_context():
+            while True:
+                try:
+                    processar_cupons_pendentes()
+                except Exception:
+                    app.logger.exception('Falha no spool de cupons')
+                finally:
+                    db.session.remove()
+                self._acordar.wait(INTERVALO_SPOOL)
+                self._acordar.clear()
+
+spool_cupons = SpoolCupons()
+
+@app.cli.command('processar-cupons')
+@click.option('--uma-vez', is_flag=True, help='Emite os cupons pendentes e termina')
+def processar_cupons_comando(uma_vez):
+    if uma_vez:
+        print(f'✓ {processar_cupons_pendentes()} cupons processados')
+        return
+    for thread in spool_cupons.iniciar(max(1, app.config['CUPOM_TRABALHADORES'])):
+        thread.join()
+
+# ===== AUDITORIA =====
+# Logins, sangrias, cancelamentos, exclusões e autorizações de administrador entram num
+# buffer em memória; uma thread grava o acumulado em evento_auditoria num único commit
+# a cada AUDITORIA_INTERVALO segundos (ou ao juntar AUDITORIA_LOTE eventos), em vez de um
+# commit por requisição. No encerramento do processo o buffer é gravado com
+# synchronous=FULL. Um processo derrubado à força perde no máximo o último intervalo.
+class RegistroAuditoria:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._gravacao = threading.Lock()  # uma gravação por vez, na ordem dos eventos
+        self._pendentes = []
+        self._sinal = threading.Event()
+        self._thread = None
+    
+    def registrar(self, evento):
+        with self._lock:
+            self._pendentes.append(evento)
+            cheio = len(self._pendentes) >= app.config['AUDITORIA_LOTE']
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._executar, name='auditoria', daemon=True)
+                self._thread.start()
+        if cheio:
+            self._sinal.set()
+    
+    def descarregar(self, duravel=False):
+        with self._gravacao:
+            with self._lock:
+                lote, self._pendentes = self._pendentes, []
+            if not lote:
+                return 0
+            try:
+                if duravel:
+                    _gravar_auditoria_duravel(lote)
+                else:
+                    executar_escrita(_gravar_auditoria, lote)
+            except Exception:
+                with self._lock:
+                    self._pendentes[:0] = lote  # volta para a frente e vai na próxima gravação
+                raise
+            return len(lote)
+    
+    def _executar(self):
+        with app.app_context():
+            while True:
+                self._sinal.wait(app.config['AUDITORIA_INTERVALO'])
+                self._sinal.clear()
+                try:
+                    self.descarregar()
+                except Exception:
+                    app.logger.exception('Falha ao gravar a auditoria; nova tentativa no próximo intervalo')
+                finally:
+                    db.session.remove()
+    
+    def encerrar(self):
+        with app.app_context():
+            self.descarregar(duravel=True)
+
+def _gravar_auditoria(lote):
+    db.session.execute(insert(EventoAuditoria), lote)
+
+def _gravar_auditoria_duravel(lote):
+    # Fora da fila de escrita (que pode já ter parado) e com fsync no commit
+    conexao = db.session.connection()
+    conexao.exec_driver_sql('PRAGMA synchronous=FULL')
+    try:
+        _gravar_auditoria(lote)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    finally:
+        db.session.connection().exec_driver_sql('PRAGMA synchronous=NORMAL')
+        db.session.rollback()
+
+auditoria = RegistroAuditoria()
+atexit.register(auditoria.encerrar)
+
+def auditar(acao, alvo=None, usuario_id=None, **detalhes):
+    # Dentro de uma requisição o usuário e o IP vêm da sessão e do pedido
+    if usuario_id is None and has_request_context():
+        usuario_id = session.get('user_id')
+    auditoria.registrar({
+        'data': datetime.now(),
+        'usuario_id': usuario_id,
+        'acao': acao,
+        'alvo': alvo,
+        'detalhes': json.dumps(detalhes, ensure_ascii=False, default=str) if detalhes else None,
+        'ip': request.remote_addr if has_request_context() else None,
+    })
+
+# ===== BASE DE RELATÓRIOS =====
+# Os relatórios leem de uma cópia consistente do banco, feita com a API de backup online
+# do SQLite e acessada por uma engine própria: uma exportação longa não disputa o banco
+# com o caixa. A cópia é refeita a cada RELATORIOS_INTERVALO segundos por uma thread e
+# sob demanda em POST /api/relatorios/base.
+class BaseRelatorios:
+    def __init__(self):
+        self._trava = threading.Lock()
+        self._engine = None
+        self._thread = None
+        self.gerada_em = None  # epoch do início da última cópia feita por este processo
+    
+    def caminho(self):
+        if app.config['BASE_RELATORIOS']:
+            return app.config['BASE_RELATORIOS']
+        banco = db.engine.url.database
+        if not banco or banco == ':memory:':
+            return os.path.join(app.instance_path, 'relatorios.db')
+        return f'{os.path.splitext(banco)[0]}-relatorios.db'
+    
+    def idade(self):
+        return time.time() - self.gerada_em if self.gerada_em is not None else None
+    
+    def atualizar(self):
+        with self._trava:
+            inicio = time.perf_counter()
+            marca = time.time()  # a cópia tem tudo o que foi confirmado até aqui
+            caminho = self.caminho()
+            origem = db.engine.raw_connection()
+            destino = sqlite3.connect(caminho, timeout=15)
+            try:
+                # Em um único passo a cópia sai de uma só transação de leitura: fica consistente
+                # e, no modo WAL, não segura as vendas gravadas enquanto isso. No destino a troca
+                # também é uma transação, então quem lê a cópia nunca vê metade dela.
+                origem.driver_connection.backup(destino)
+            finally:
+                destino.close()
+                origem.close()
+            self.gerada_em = marca
+            if self._engine is None:
+                self._engine = create_engine(f'sqlite:///{caminho}')
+                event.listen(self._engine, 'connect', _somente_leitura)
+            metricas.registrar(
+                ('armarinho_base_relatorios_atualizacao_segundos', (), time.perf_counter() - inicio),
+                ('armarinho_base_relatorios_gerada_em_segundos', (), self.gerada_em),
+            )
+            cache_consultas.invalidar(['relatorio:*'])
+        return self.estado()
+    
+    def engine(self):
+        # A primeira leitura do processo faz a cópia e liga a atualização periódica
+        if self.gerada_em is None:
+            self.atualizar()
+        intervalo = app.config['RELATORIOS_INTERVALO']
+        with self._trava:
+            if intervalo and self._thread is None:
+                self._thread = threading.Thread(target=self._atualizar_periodicamente, args=(intervalo,),
+                                                name='base-relatorios', daemon=True)
+                self._thread.start()
+        return self._engine
+    
+    def cobre(self, instante):
+        # A cópia já tem tudo o que foi gravado até instante (epoch)?
+        self.engine()
+        return self.gerada_em >= instante
+    
+    def _atualizar_periodicamente(self, intervalo):
+        while True:
+            # Uma atualização sob demanda adia a próxima automática
+            time.sleep(max(1, intervalo - self.idade()))
+            if self.idade() < intervalo:
+                continue
+            try:
+                with app.app_context():
+                    self.atualizar()
+            except Exception:
+                app.logger.exception('Falha ao atualizar a base de relatórios')
+    
+    def estado(self):
+        return {
+            'caminho': self.caminho(),
+            'gerada_em': datetime.fromtimestamp(self.gerada_em).isoformat() if self.gerada_em else None,
+            'idade_segundos': round(self.idade(), 1) if self.gerada_em else None,
+            'intervalo_segundos': app.config['RELATORIOS_INTERVALO'],
+        }
+
+def _somente_leitura(conexao, registro):
+    conexao.execute('PRAGMA query_only=ON')
+
+base_relatorios = BaseRelatorios()
+
+@app.cli.command('atualizar-relatorios')
+def atualizar_relatorios_comando():
+    estado = base_relatorios.atualizar()
+    print(f"✓ Base de relatórios atualizada em {estado['caminho']}")
+
+# ===== ARQUIVO DE MESES FECHADOS =====
+# Meses fechados de venda, item_venda e movimentacao_caixa saem do banco principal para um
+# arquivo SQLite por mês (arquivo/vendas-2024-01.db), e o banco do caixa fica só com o
+# período recente. Cada mês é copiado inteiro, a marca 'arquivado_ate' (contador, AAAAMM)
+# avança e só então as linhas são apagadas, em lotes. Leituras históricas pegam os meses
+# anteriores à marca dos arquivos (ATTACH) e o resto do banco principal: mesmo com o
+# trabalho interrompido no meio, nenhuma linha é lida duas vezes.
+LOTE_ARQUIVO = 2000
+ANEXOS_POR_CONSULTA = 10  # limite padrão de bancos anexados a uma conexão no SQLite
+TABELAS_ARQUIVADAS = ['venda', 'item_venda', 'movimentacao_caixa']
+
+def pasta_arquivo():
+    if app.config['PASTA_ARQUIVO']:
+        return app.config['PASTA_ARQUIVO']
+    banco = db.engine.url.database
+    if not banco or banco == ':memory:':
+        return os.path.join(app.instance_path, 'arquivo')
+    return os.path.join(os.path.dirname(banco), 'arquivo')
+
+def caminho_arquivo(mes):
+    return os.path.join(pasta_arquivo(), f'vendas-{mes:%Y-%m}.db')
+
+def _esquema_arquivo(mes):
+    return f'arquivo_{mes:%Y_%m}'
+
+def _mes_seguinte(mes):
+    return datetime(mes.year + mes.month // 12, mes.month % 12 + 1, 1)
+
+def arquivado_ate(conexao=None):
+    # Primeiro mês ainda no banco principal; os anteriores estão nos arquivos
+    if conexao is None:
+        conexao = db.session
+    valor = conexao.execute(db.select(Contador.valor).where(Contador.nome == 'arquivado_ate')).scalar()
+    return datetime(valor // 100, valor % 100, 1) if valor else None
+
+def meses_arquivados(marca, inicio=None, fim=None):
+    # Meses com arquivo anteriores à marca que tocam o período [inicio, fim)
+    meses = []
+    if marca is None:
+        return meses
+    for caminho in sorted(glob.glob(os.path.join(pasta_arquivo(), 'vendas-????-??.db'))):
+        mes = datetime.strptime(os.path.basename(caminho)[7:14], '%Y-%m')
+        if mes < marca and (inicio is None or _mes_seguinte(mes) > inicio) and (fim is None or mes < fim):
+            meses.append(mes)
+    return meses
+
+def janelas_historicas(conexao, inicio=None, fim=None):
+    # Divide [inicio, fim) em janelas (meses anexados, de, até): grupos de até
+    # ANEXOS_POR_CONSULTA meses arquivados e, por último, o banco principal (meses vazio)
+    marca = arquivado_ate(conexao)
+    meses = meses_arquivados(marca, inicio, fim)
+    janelas = []
+    for i in range(0, len(meses), ANEXOS_POR_CONSULTA):
+        grupo = meses[i:i + ANEXOS_POR_CONSULTA]
+        janelas.append((grupo, max(inicio or grupo[0], grupo[0]), min(fim or datetime.max, _mes_seguinte(grupo[-1]))))
+    if marca is None:
+        janelas.append(([], inicio, fim))
+    elif fim is None or fim > marca:
+        janelas.append(([], max(inicio or marca, marca), fim))
+    return janelas
+
+@contextmanager
+def anexar_arquivos(conexao, meses):
+    for mes in meses:
+        conexao.exec_driver_sql(f'ATTACH DATABASE ? AS {_esquema_arquivo(mes)}', (caminho_arquivo(mes),))
+    try:
+        yield
+    finally:
+        for mes in meses:
+            conexao.exec_driver_sql(f'DETACH DATABASE {_esquema_arquivo(mes)}')
+
+def visao_arquivada(nome, meses):
+    # UNION ALL da tabela em cada mês anexado, com as colunas (e tipos) da tabela principal
+    colunas = db.metadata.tables[nome].columns
+    partes = [db.select(table(nome, *(column(c.name, c.type) for c in colunas), schema=_esquema_arquivo(mes)))
+              for mes in meses]
+    return union_all(*partes).subquery(f'{nome}_arquivada')
+
+def _tabelas_arquivo():
+    metadata = MetaData(schema='arquivo')
+    for nome in TABELAS_ARQUIVADAS:
+        Table(nome, metadata, *(Column(c.name, c.type, primary_key=c.primary_key, index=c.name in ('data', 'venda_id'))
+                                for c in db.metadata.tables[nome].columns))
+    return metadata
+
+def _por_faixas(conexao, tabela, mes, lote, comandos):
+    # Percorre os ids de `tabela` no mês em faixas de até `lote`, executando os comandos
+    # (com :primeiro, :ultimo, :de e :ate) e fazendo commit a cada faixa. Devolve quantas
+    # linhas o primeiro comando afetou.
+    faixa = {'de': mes.isoformat(' '), 'ate': _mes_seguinte(mes).isoformat(' '), 'ultimo': 0, 'lote': lote}
+    afetadas = 0
+    while True:
+        ids = conexao.execute(text(
+            f'SELECT id FROM main.{tabela} WHERE data >= :de AND data < :ate AND id > :ultimo ORDER BY id LIMIT :lote'
+        ), faixa).scalars().all()
+        if not ids:
+            return afetadas
+        faixa.update(primeiro=ids[0], ultimo=ids[-1])
+        for i, comando in enumerate(comandos):
+            resultado = conexao.execute(text(comando), faixa)
+            if i == 0:
+                afetadas += resultado.rowcount
+        conexao.commit()
+
+def _arquivar_mes(conexao, mes, lote):
+    metadata = _tabelas_arquivo()
+    colunas = {nome: ', '.join(c.name for c in tabela.columns) for nome, tabela in metadata.tables.items()}
+    faixa_venda = 'SELECT id FROM main.venda WHERE id BETWEEN :primeiro AND :ultimo AND data >= :de AND data < :ate'
+    faixa_mov = 'id BETWEEN :primeiro AND :ultimo AND data >= :de AND data < :ate'
+    conexao.exec_driver_sql('ATTACH DATABASE ? AS arquivo', (caminho_arquivo(mes),))
+    try:
+        conexao.exec_driver_sql('PRAGMA arquivo.journal_mode=WAL')
+        metadata.create_all(conexao)
+        conexao.commit()
+        
+        # 1. Cópia (INSERT OR IGNORE: rodar de novo sobre um mês já copiado não duplica nada)
+        vendas = _por_faixas(conexao, 'venda', mes, lote, [
+            f"INSERT OR IGNORE INTO arquivo.venda ({colunas['arquivo.venda']}) "
+            f"SELECT {colunas['arquivo.venda']} FROM main.venda WHERE id IN ({faixa_venda})",
+            f"INSERT OR IGNORE INTO arquivo.item_venda ({colunas['arquivo.item_venda']}) "
+            f"SELECT {colunas['arquivo.item_venda']} FROM main.item_venda WHERE venda_id IN ({faixa_venda})",
+        ])
+        movimentacoes = _por_faixas(conexao, 'movimentacao_caixa', mes, lote, [
+            f"INSERT OR IGNORE INTO arquivo.movimentacao_caixa ({colunas['arquivo.movimentacao_caixa']}) "
+            f"SELECT {colunas['arquivo.movimentacao_caixa']} FROM main.movimentacao_caixa WHERE {faixa_mov}",
+        ])
+        
+        # 2. Marca: daqui em diante o mês é lido do arquivo
+        valor = _mes_seguinte(mes).year * 100 + _mes_seguinte(mes).month
+        comando = sqlite_insert(Contador).values(nome='arquivado_ate', valor=valor)
+        conexao.execute(comando.on_conflict_do_update(
+            index_elements=[Contador.nome], set_={'valor': func.max(Contador.valor, comando.excluded.valor)}))
+        conexao.commit()
+        
+        # 3. Remoção do banco principal, só do que está no arquivo. A linha de maior id de
+        # cada tabela fica (o SQLite reutilizaria o id numa tabela vazia); lida pela marca,
+        # ela não aparece em dobro.
+        _por_faixas(conexao, 'venda', mes, lote, [
+            f'DELETE FROM main.item_venda WHERE venda_id IN ({faixa_venda} '
+            'AND id IN (SELECT id FROM arquivo.venda) AND id < (SELECT max(id) FROM main.venda))',
+            f'DELETE FROM main.trabalho_cupom WHERE venda_id IN ({faixa_venda} '
+            'AND id IN (SELECT id FROM arquivo.venda) AND id < (SELECT max(id) FROM main.venda))',
+            f'DELETE FROM main.venda WHERE id IN ({faixa_venda} '
+            'AND id IN (SELECT id FROM arquivo.venda) AND id < (SELECT max(id) FROM main.venda))',
+        ])
+        _por_faixas(conexao, 'movimentacao_caixa', mes, lote, [
+            f'DELETE FROM main.movimentacao_caixa WHERE {faixa_mov} '
+            'AND id IN (SELECT id FROM arquivo.movimentacao_caixa) AND id < (SELECT max(id) FROM main.movimentacao_caixa)',
+        ])
+    finally:
+        conexao.rollback()
+        conexao.exec_driver_sql('DETACH DATABASE arquivo')
+    return vendas, movimentacoes
+
+def arquivar_meses(manter_meses, lote=LOTE_ARQUIVO):
+    # Arquiva os meses anteriores aos `manter_meses` mais recentes (o mês corrente conta)
+    hoje = date.today()
+    meses = hoje.year * 12 + hoje.month - manter_meses
+    limite = datetime(meses // 12, meses % 12 + 1, 1)
+    os.makedirs(pasta_arquivo(), exist_ok=True)
+    arquivados = []
+    with db.engine.connect() as conexao:
+        de = datetime(1, 1, 1)
+        while True:
+            proximo = conexao.execute(text('''
+                SELECT min(data) FROM (
+                    SELECT min(data) AS data FROM venda WHERE data >= :de AND data < :limite
+                    UNION ALL
+                    SELECT min(data) FROM movimentacao_caixa WHERE data >= :de AND data < :limite
+                )
+            '''), {'de': de.isoformat(' '), 'limite': limite.isoformat(' ')}).scalar()
+            if proximo is None:
+                break
+            mes = datetime(int(proximo[:4]), int(proximo[5:7]), 1)
+            arquivados.append((mes, *_arquivar_mes(conexao, mes, lote)))
+            de = _mes_seguinte(mes)
+    return arquivados
+
+@app.cli.command('arquivar')
+@click.option('--manter-meses', type=click.IntRange(min=1), default=12, show_default=True,
+              help='Meses mais recentes (incluindo o corrente) mantidos no banco principal')
+@click.option('--lote', type=click.IntRange(min=1), default=LOTE_ARQUIVO, show_default=True,
+              help='Linhas por transação ao copiar e apagar')
+def arquivar_comando(manter_meses, lote):
+    arquivados = [mes for mes in arquivar_meses(manter_meses, lote) if mes[1] or mes[2]]
+    for mes, vendas, movimentacoes in arquivados:
+        print(f'✓ {mes:%Y-%m}: {vendas} vendas e {movimentacoes} movimentações em {caminho_arquivo(mes)}')
+    if not arquivados:
+        print('✓ Nenhum mês novo para arquivar')
+
+# ===== EXPORTAÇÃO DE VENDAS =====
+COLUNAS_EXPORTACAO = ['id', 'data', 'usuario_id', 'operador', 'cliente_id', 'cliente', 'cliente_documento',
+                      'total', 'tipo_cupom', 'cancelada']
+LOTE_EXPORTACAO = 1000
+
+def periodo_exportacao(inicio, fim):
+    # Datas no formato AAAA-MM-DD; o fim é inclusivo
+    inicio = datetime.combine(date.fromisoformat(inicio), datetime.min.time()) if inicio else None
+    fim = datetime.combine(date.fromisoformat(fim) + timedelta(days=1), datetime.min.time()) if fim else None
+    return inicio, fim
+
+def gerar_exportacao_vendas(formato, inicio=None, fim=None, origem=None):
+    # Percorre as vendas em lotes (yield_per) e devolve o arquivo em pedaços: a memória
+    # usada não depende do tamanho do período exportado. origem é a conexão lida; sem
+    # ela, a do banco principal. Meses arquivados vêm dos arquivos mensais, anexados
+    # alguns por vez, em ordem de data.
+    if origem is None:
+        origem = db.session.connection()
+    
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    if formato == 'csv':
+        escritor.writerow(COLUNAS_EXPORTACAO)
+    
+    for meses, de, ate in janelas_historicas(origem, inicio, fim):
+        vendas = visao_arquivada('venda', meses) if meses else Venda.__table__
+        consulta = (
+            db.select(vendas.c.id, vendas.c.data, vendas.c.usuario_id, Usuario.nome.label('operador'),
+                      vendas.c.cliente_id, Cliente.nome.label('cliente'), Cliente.documento.label('cliente_documento'),
+                      vendas.c.total, vendas.c.tipo_cupom, vendas.c.cancelada)
+            .join(Usuario, Usuario.id == vendas.c.usuario_id)
+            .outerjoin(Cliente, Cliente.id == vendas.c.cliente_id)
+            .order_by(vendas.c.data, vendas.c.id)
+            .execution_options(yield_per=LOTE_EXPORTACAO)
+        )
+        if de:
+            consulta = consulta.where(vendas.c.data >= de)
+        if ate:
+            consulta = consulta.where(vendas.c.data < ate)
+        
+        with anexar_arquivos(origem, meses):
+            resultado = origem.execute(consulta)
+            try:
+                for lote in resultado.partitions():
+                    for linha in lote:
+                        registro = dict(linha._mapping, data=linha.data.isoformat(sep=' ') if linha.data else None,
+                                        cancelada=bool(linha.cancelada))
+                        if formato == 'csv':
+                            escritor.writerow([registro[c] for c in COLUNAS_EXPORTACAO])
+                        else:
+                            buffer.write(json.dumps(registro, ensure_ascii=False))
+                            buffer.write('\n')
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate()
+            finally:
+                resultado.close()  # o DETACH falha com a consulta ainda aberta
+    
+    if buffer.tell():
+        yield buffer.getvalue()
+
+@app.cli.command('exportar-vendas')
+@click.option('--formato', type=click.Choice(['csv', 'ndjson']), default='csv')
+@click.option('--inicio', help='Data inicial (AAAA-MM-DD)')
+@click.option('--fim', help='Data final, inclusiva (AAAA-MM-DD)')
+@click.option('--saida', type=click.File('w', encoding='utf-8'), default='-', help='Arquivo de saída')
+def exportar_vendas_comando(formato, inicio, fim, saida):
+    for pedaco in gerar_exportacao_vendas(formato, *periodo_exportacao(inicio, fim)):
+        saida.write(pedaco)
+
+# ===== IMPORTAÇÃO DE PRODUTOS =====
+# Tabelas de preço de fornecedores (CSV com ';' ou ','). Obrigatórias: codigo, descricao e
+# preco_venda; opcionais: preco_custo, estoque e ativo. Colunas opcionais ausentes ou vazias
+# não alteram o produto existente.
+LINHAS_POR_COMANDO_IMPORTACAO = 1000
+COMANDOS_POR_TRANSACAO_IMPORTACAO = 10
+COLUNAS_OPCIONAIS_IMPORTACAO = ['preco_custo', 'estoque', 'ativo']
+MAXIMO_ERROS_RELATADOS = 100
+
+class ImportacaoInterrompida(Exception):
+    def __init__(self, resultado, linha, erro):
+        # resultado: o que já foi gravado; a partir de linha nada foi importado
+        self.resultado = resultado
+        self.linha = linha
+        super().__init__(f'Erro ao ler o arquivo na linha {linha}: {erro}')
+
+def _numero(texto):
+    texto = texto.strip().replace('R$', '').strip()
+    if ',' in texto:
+        texto = texto.replace('.', '').replace(',', '.')  # formato brasileiro: 1.234,56
+    return float(texto)
+
+def _booleano(texto):
+    texto = normalizar_texto(texto)
+    if texto in ('1', 'true', 'sim', 's', 'ativo'):
+        return True
+    if texto in ('0', 'false', 'nao', 'n', 'inativo'):
+        return False
+    raise ValueError(texto)
+
+def _linha_importacao(campos):
+    codigo = (campos.get('codigo') or '').strip()
+    descricao = (campos.get('descricao') or '').strip()
+    if not codigo or not descricao:
+        raise ValueError('código e descrição são obrigatórios')
+    if len(codigo) > 50 or len(descricao) > 200:
+        raise ValueError('código ou descrição muito longos')
+    try:
+        produto = {'codigo': codigo, 'descricao': descricao, 'preco_venda': _numero(campos.get('preco_venda') or '')}
+    except ValueError:
+        raise ValueError('preço de venda inválido')
+    if produto['preco_venda'] < 0:
+        raise ValueError('preço de venda negativo')
+    
+    for coluna, converter in (('preco_custo', _numero), ('estoque', lambda t: int(_numero(t))), ('ativo', _booleano)):
+        if (campos.get(coluna) or '').strip():
+            try:
+                produto[coluna] = converter(campos[coluna])
+            except ValueError:
+                raise ValueError(f'{coluna} inválido')
+    return produto
+
+def _upsert_produtos(linhas):
+    # Linhas com as mesmas colunas informadas vão no mesmo INSERT ... ON CONFLICT de várias linhas
+    tabela = Produto.__table__
+    versao = proxima_versao_catalogo(db.session)
+    por_colunas = defaultdict(list)
+    for linha in linhas:
+        por_colunas[tuple(c for c in COLUNAS_OPCIONAIS_IMPORTACAO if c in linha)].append(linha)
+    
+    estados = []
+    for opcionais, grupo in por_colunas.items():
+        # executemany de um comando já compilado; o SQLAlchemy o envia como INSERT de várias linhas
+        comando = sqlite_insert(tabela)
+        atualizar = ['descricao', 'preco_venda', 'versao', *opcionais]
+        comando = comando.on_conflict_do_update(
+            index_elements=[tabela.c.codigo],
+            set_={coluna: comando.excluded[coluna] for coluna in atualizar}
+        ).returning(tabela.c.id, tabela.c.codigo, tabela.c.descricao, tabela.c.preco_venda,
+                    tabela.c.estoque, tabela.c.ativo)
+        linhas_grupo = [dict(linha, versao=versao) for linha in grupo]
+        estados.extend(dict(r._mapping, ativo=r.ativo is not False)
+                       for r in db.session.execute(comando, linhas_grupo))
+    registrar_alteracao_produtos(db.session, estados)
+
+def _gravar_importacao(lotes):
+    atualizados = 0
+    for linhas in lotes:
+        codigos = [linha['codigo'] for linha in linhas]
+        atualizados += db.session.execute(
+            db.select(func.count()).select_from(Produto).where(Produto.codigo.in_(codigos))
+        ).scalar()
+        _upsert_produtos(linhas)
+    return atualizados
+
+def importar_produtos(arquivo):
+    # arquivo: texto já decodificado, lido linha a linha (nunca inteiro na memória)
+    cabecalho = arquivo.readline()
+    delimitador = ';' if cabecalho.count(';') > cabecalho.count(',') else ','
+    colunas = [normalizar_texto(c).replace(' ', '_') for c in next(csv.reader([cabecalho], delimiter=delimitador), [])]
+    faltando = {'codigo', 'descricao', 'preco_venda'} - set(colunas)
+    if faltando:
+        raise ValueError(f"Colunas obrigatórias ausentes: {', '.join(sorted(faltando))}")
+    
+    resultado = {'inseridos': 0, 'atualizados': 0, 'rejeitados': 0, 'erros': []}
+    lotes, lote = [], {}
+    
+    def gravar():
+        total = sum(len(l) for l in lotes)
+        atualizados = executar_escrita(_gravar_importacao, lotes)
+        resultado['atualizados'] += atualizados
+        resultado['inseridos'] += total - atualizados
+        lotes.clear()
+    
+    leitor = csv.reader(arquivo, delimiter=delimitador)
+    linhas = enumerate(leitor, start=2)
+    while True:
+        try:
+            numero, campos = next(linhas)
+        except StopIteration:
+            break
+        except (UnicodeDecodeError, csv.Error) as e:
+            # Os lotes anteriores já foram confirmados: grava também as linhas lidas até aqui,
+            # para que tudo antes da linha com erro fique importado e o resto possa ser reenviado
+            if lote:
+                lotes.append(list(lote.values()))
+            if lotes:
+                gravar()
+            raise ImportacaoInterrompida(resultado, leitor.line_num + 2, e) from e
+        if not any(c.strip() for c in campos):
+            continue
+        try:
+            produto = _linha_importacao(dict(zip(colunas, campos)))
+        except ValueError as e:
+            resultado['rejeitados'] += 1
+            if len(resultado['erros']) < MAXIMO_ERROS_RELATADOS:
+                resultado['erros'].append({'linha': numero, 'erro': str(e)})
+            continue
+        
+        # Código repetido no mesmo lote: vale a última ocorrência
+        lote[produto['codigo']] = produto
+        if len(lote) >= LINHAS_POR_COMANDO_IMPORTACAO:
+            lotes.append(list(lote.values()))
+            lote = {}
+            if len(lotes) >= COMANDOS_POR_TRANSACAO_IMPORTACAO:
+                gravar()
+    
+    if lote:
+        lotes.append(list(lote.values()))
+    if lotes:
+        gravar()
+    return resultado
+
+@app.cli.command('importar-produtos')
+@click.argument('arquivo', type=click.Path(exists=True, dir_okay=False))
+@click.option('--codificacao', default='utf-8-sig', help='Codificação do arquivo (ex.: latin-1)')
+def importar_produtos_comando(arquivo, codificacao):
+    interrompida = None
+    with open(arquivo, encoding=codificacao, newline='') as entrada:
+        try:
+            resultado = importar_produtos(entrada)
+        except ImportacaoInterrompida as e:
+            resultado, interrompida = e.resultado, e
+    print(f"✓ {resultado['inseridos']} inseridos, {resultado['atualizados']} atualizados, "
+          f"{resultado['rejeitados']} rejeitados")
+    for erro in resultado['erros']:
+        print(f"   linha {erro['linha']}: {erro['erro']}")
+    if interrompida:
+        raise click.ClickException(f'{interrompida}; as linhas anteriores foram importadas')
+
+# ===== ARQUIVOS ESTÁTICOS =====
+# Páginas e arquivos estáticos são comprimidos uma única vez por processo e servidos da
+# memória. Em /assets/ o nome leva o hash do conteúdo (js/vendas.3f2a9c1b7e4d.js, gerado
+# por url_asset nos templates) e pode ficar em cache indefinidamente; as páginas de rota
+# fixa (/login, /admin, /clientes) são revalidadas pelo ETag e custam só um 304.
+PASTA_APP = os.path.dirname(os.path.abspath(__file__))
+PADROES_ESTATICOS = ['css/*.css', 'js/*.js', 'index*.html', 'assets/**/*']
+TIPOS_COMPRIMIVEIS = ('text/', 'application/javascript', 'application/json', 'image/svg+xml')
+CACHE_IMUTAVEL = 'public, max-age=31536000, immutable'
+
+class Asset:
+    def __init__(self, nome, conteudo):
+        self.nome = nome
+        self.tipo = mimetypes.guess_type(nome)[0] or 'application/octet-stream'
+        self.hash = hashlib.sha256(conteudo).hexdigest()[:12]
+        self.variantes = {'identity': conteudo}
+        if self.tipo.startswith(TIPOS_COMPRIMIVEIS):
+            comprimidos = {'gzip': gzip.compress(conteudo, compresslevel=9, mtime=0)}
+            if brotli is not None:
+                comprimidos['br'] = brotli.compress(conteudo, quality=11)
+            for codificacao, corpo in comprimidos.items():
+                if len(corpo) < len(conteudo):
+                    self.variantes[codificacao] = corpo
+    
+    @property
+    def nome_versionado(self):
+        base, extensao = os.path.splitext(self.nome)
+        return f'{base}.{self.hash}{extensao}'
+    
+    def _codificacao(self):
+        aceitas = request.accept_encodings
+        for codificacao in ('br', 'gzip'):
+            if codificacao in self.variantes and aceitas[codificacao]:
+                return codificacao
+        return 'identity'
+    
+    def resposta(self, cache_control):
+        codificacao = self._codificacao()
+        # ETag forte por representação: o corpo em gzip não é o mesmo byte a byte do original
+        etag = self.hash if codificacao == 'identity' else f'{self.hash}-{codificacao}'
+        if request.if_none_match.contains(etag):
+            resposta = app.response_class(status=304)
+        else:
+            resposta = app.response_class(self.variantes[codificacao], mimetype=self.tipo)
+            if codificacao != 'identity':
+                resposta.headers['Content-Encoding'] = codificacao
+        resposta.set_etag(etag)
+        resposta.headers['Cache-Control'] = cache_control
+        resposta.vary.add('Accept-Encoding')
+        return resposta
+
+_trava_assets = threading.Lock()
+_assets = {}
+_assets_versionados = {}
+_paginas = {}
+
+def carregar_assets():
+    with _trava_assets:
+        if _assets:
+            return _assets
+        for padrao in PADROES_ESTATICOS:
+            for caminho in sorted(glob.glob(os.path.join(PASTA_APP, padrao), recursive=True)):
+                if not os.path.isfile(caminho):
+                    continue
+                nome = os.path.relpath(caminho, PASTA_APP).replace(os.sep, '/')
+                with open(caminho, 'rb') as arquivo:
+                    asset = Asset(nome, arquivo.read())
+                _assets[nome] = asset
+                _assets_versionados[asset.nome_versionado] = asset
+        return _assets
+
+def url_asset(nome):
+    return f'/assets/{carregar_assets()[nome].nome_versionado}'
+
+app.jinja_env.globals['url_asset'] = url_asset
+
+def servir_pagina(nome, html, cache_control='private, no-cache'):
+    pagina = _paginas.get(nome)
+    if pagina is None:
+        pagina = _paginas.setdefault(nome, Asset(f'{nome}.html', html.encode('utf-8')))
+    return pagina.resposta(cache_control)
+
+@app.route('/assets/<path:nome>')
+def servir_asset(nome):
+    carregar_assets()
+    asset = _assets_versionados.get(nome)
+    if asset is not None:
+        return asset.resposta(CACHE_IMUTAVEL)
+    asset = _assets.get(nome)
+    if asset is None:
+        abort(404)
+    # Sem hash no nome o conteúdo pode mudar a qualquer deploy: revalida sempre
+    return asset.resposta('public, no-cache')
+
 # ===== ROTAS =====
 @app.route('/login', methods=['GET', 'POST'])
 def login():
@@ -105,17 +2500,19 @@ def login():
             session['user_id'] = usuario.id
             session['perfil'] = usuario.perfil
             session['nome'] = usuario.nome
+            auditar('login', usuario_id=usuario.id, perfil=usuario.perfil)
             
             if request.is_json:
                 return jsonify({'success': True, 'redirect': '/vendas' if usuario.perfil == 'operador' else '/admin'})
             return redirect('/vendas' if usuario.perfil == 'operador' else '/admin')
         
+        auditar('login_recusado', login=login)
         if request.is_json:
             return jsonify({'success': False, 'error': 'Usuário ou senha inválidos'}), 401
         flash('Usuário ou senha inválidos!', 'error')
         return redirect('/login')
     
-    return '''
+    return servir_pagina('login', '''
     <!DOCTYPE html>
     <html lang="pt-BR">
     <head>
@@ -193,10 +2590,12 @@ def login():
         </script>
     </body>
     </html>
-    '''
+    ''', 'public, no-cache')
 
 @app.route('/logout')
 def logout():
+    if 'user_id' in session:
+        auditar('logout')
     session.clear()
     return redirect('/login')
 
@@ -205,17 +2604,75 @@ def tela_vendas():
     if 'user_id' not in session or session.get('perfil') != 'operador':
         return redirect('/login')
     
-    produtos = Produto.query.filter_by(ativo=True).all()
-    return render_template('vendas.html', 
-                         produtos=[p.to_dict() for p in produtos],
-                         operador=session['nome'])
+    # O catálogo não vem mais embutido na página: o terminal o mantém via /api/catalogo
+    return render_template('vendas.html', operador=session['nome'])
+
+@app.route('/api/catalogo')
+def catalogo():
+    if 'user_id' not in session:
+        return jsonify({'error': 'Não autenticado'}), 401
+    
+    versao = versao_atual_catalogo()
+    desde = request.args.get('desde', type=int)
+    if desde is not None and desde > versao:
+        desde = None  # versão desconhecida (banco recriado): envia o catálogo completo
+    
+    etag = f'catalogo-{versao}'
+    if request.if_none_match.contains(etag):
+        resposta = app.response_class(status=304)
+    elif desde is None:
+        # O catálogo completo é a maior resposta do sistema: vai em pedaços, direto do cursor
+        resposta = app.response_class(
+            stream_with_context(gerar_lista_json(
+                db.select(*COLUNAS_PRODUTO).where(Produto.ativo == True),
+                f'{{"completo":true,"removidos":[],"versao":{versao},"produtos":', '}'
+            )),
+            mimetype='application/json'
+        )
+    else:
+        alterados = como_dicts(db.session.execute(
+            db.select(*COLUNAS_PRODUTO, Produto.ativo).where(Produto.versao > desde)
+        ).all())
+        ativos = [p.pop('ativo') is not False for p in alterados]
+        resposta = jsonify({
+            'versao': versao,
+            'completo': False,
+            'produtos': [p for p, ativo in zip(alterados, ativos) if ativo],
+            'removidos': [p['id'] for p, ativo in zip(alterados, ativos) if not ativo]
+        })
+    
+    resposta.set_etag(etag)
+    resposta.headers['Cache-Control'] = 'private, no-cache'
+    return resposta
+
+@app.route('/api/produtos/eventos')
+def eventos_produtos():
+    if 'user_id' not in session:
+        return jsonify({'error': 'Não autenticado'}), 401
+    
+    # Na reconexão o navegador manda Last-Event-ID; na primeira conexão o terminal
+    # informa a versão do catálogo que já tem
+    ultima = request.headers.get('Last-Event-ID', type=int)
+    if ultima is None:
+        ultima = request.args.get('desde', type=int)
+    atual = max(transmissor_produtos.ultima_versao() or 0, versao_atual_catalogo())
+    # Versão desconhecida (banco recriado) ou anterior ao histórico guardado: o terminal
+    # busca a diferença pelo /api/catalogo antes de seguir com os eventos
+    sincronizar = ultima is not None and (ultima > atual or (ultima < atual and not transmissor_produtos.cobre(ultima)))
+    if ultima is None or sincronizar:
+        ultima = atual
+    
+    resposta = Response(gerar_eventos_produtos(ultima, sincronizar), mimetype='text/event-stream')
+    resposta.headers['Cache-Control'] = 'no-cache'
+    resposta.headers['X-Accel-Buffering'] = 'no'
+    return resposta
 
 @app.route('/admin')
 def admin():
     if 'user_id' not in session or session.get('perfil') != 'admin':
         return redirect('/login')
     
-    return '''
+    return servir_pagina('admin', '''
     <!DOCTYPE html>
     <html lang="pt-BR">
     <head>
@@ -276,7 +2733,7 @@ def admin():
         </div>
     </body>
     </html>
-    '''
+    ''')
 
 @app.route('/api/produtos/buscar')
 def buscar_produto():
@@ -287,34 +2744,254 @@ def buscar_produto():
     if not termo:
         return jsonify([])
     
-    produtos = Produto.query.filter(
-        Produto.ativo == True,
-        (Produto.codigo.ilike(f'%{termo}%')) | (Produto.descricao.ilike(f'%{termo}%'))
-    ).limit(10).all()
+    return jsonify(indice_produtos.buscar(termo, limite=10))
+
+@app.route('/api/produtos')
+def listar_produtos():
+    if 'user_id' not in session:
+        return jsonify({'error': 'Não autenticado'}), 401
+    
+    try:
+        produtos, proximo = paginar(
+            db.select(*COLUNAS_PRODUTO).where(Produto.ativo == True), [Produto.descricao, Produto.id],
+            limite_pagina(50), decodificar_cursor(request.args.get('cursor')),
+            lambda p: [p.descricao, p.id]
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return resposta_paginada(como_dicts(produtos), proximo)
+
+@app.route('/api/produtos/importar', methods=['POST'])
+def importar_produtos_api():
+    if 'user_id' not in session or session.get('perfil') != 'admin':
+        return jsonify({'error': 'Acesso restrito ao administrador'}), 403
+    
+    # Aceita upload (campo "arquivo") ou o CSV direto no corpo da requisição
+    enviado = request.files.get('arquivo')
+    binario = enviado.stream if enviado else request.stream
+    arquivo = io.TextIOWrapper(binario, encoding=request.args.get('codificacao', 'utf-8-sig'), newline='')
+    try:
+        resultado = importar_produtos(arquivo)
+    except ImportacaoInterrompida as e:
+        # Parte do arquivo já foi gravada: o operador precisa saber até onde
+        auditar('importacao_produtos', arquivo=enviado.filename if enviado else None,
+                inseridos=e.resultado['inseridos'], atualizados=e.resultado['atualizados'],
+                rejeitados=e.resultado['rejeitados'], interrompida_na_linha=e.linha)
+        return jsonify(dict(e.resultado, error=str(e), linha=e.linha)), 400
+    except (ValueError, LookupError) as e:
+        return jsonify({'error': str(e)}), 400
+    
+    auditar('importacao_produtos', arquivo=enviado.filename if enviado else None,
+            inseridos=resultado['inseridos'], atualizados=resultado['atualizados'],
+            rejeitados=resultado['rejeitados'])
+    return jsonify(dict(resultado, success=True))
+
+@app.route('/api/produtos/codigo/<path:codigo>')
+def produto_por_codigo(codigo):
+    if 'user_id' not in session:
+        return jsonify({'error': 'Não autenticado'}), 401
+    
+    produto = indice_produtos.por_codigos([codigo.strip()])[0]
+    if produto is None:
+        return jsonify({'error': 'Produto não encontrado'}), 404
+    return jsonify(produto)
+
+@app.route('/api/produtos/codigos', methods=['POST'])
+def produtos_por_codigos():
+    if 'user_id' not in session:
+        return jsonify({'error': 'Não autenticado'}), 401
+    
+    dados = request.get_json(silent=True) or {}
+    codigos = dados.get('codigos')
+    if not isinstance(codigos, list):
+        return jsonify({'error': 'Informe a lista de códigos'}), 400
+    
+    # Mantém a ordem e as repetições da leitura: cada bipe é uma unidade
+    codigos = [str(c).strip() for c in codigos]
+    produtos = indice_produtos.por_codigos(codigos)
+    return jsonify({
+        'produtos': [p for p in produtos if p is not None],
+        'nao_encontrados': [c for c, p in zip(codigos, produtos) if p is None]
+    })
+
+@app.route('/api/produtos/mais-vendidos')
+def produtos_mais_vendidos():
+    if 'user_id' not in session or session.get('perfil') != 'admin':
+        return jsonify({'error': 'Acesso restrito ao administrador'}), 403
+    
+    dias = dias_giro()
+    giro = giro_por_produto(dias)
+    linhas = db.session.execute(
+        db.select(Produto.id, Produto.codigo, Produto.descricao, Produto.estoque,
+                  giro.c.vendidos, giro.c.faturado, giro.c.ultima_venda)
+        .join(giro, giro.c.produto_id == Produto.id)
+        .where(giro.c.vendidos > 0)
+        .order_by(giro.c.vendidos.desc(), Produto.id)
+        .limit(limite_pagina(20))
+    ).all()
+    return jsonify({'dias': dias, 'produtos': [linha_giro(linha, dias) for linha in linhas]})
+
+@app.route('/api/produtos/reposicao')
+def sugestao_reposicao():
+    if 'user_id' not in session or session.get('perfil') != 'admin':
+        return jsonify({'error': 'Acesso restrito ao administrador'}), 403
     
-    return jsonify([p.to_dict() for p in produtos])
+    # Produtos cujo estoque não cobre `cobertura` dias no ritmo de venda da janela,
+    # começando pelos que acabam primeiro
+    dias = dias_giro()
+    cobertura = max(1, request.args.get('cobertura', 7, type=int))
+    giro = giro_por_produto(dias)
+    por_dia = giro.c.vendidos * 1.0 / dias
+    linhas = db.session.execute(
+        db.select(Produto.id, Produto.codigo, Produto.descricao, Produto.estoque,
+                  giro.c.vendidos, giro.c.faturado, giro.c.ultima_venda)
+        .join(giro, giro.c.produto_id == Produto.id)
+        .where(Produto.ativo == True, Produto.estoque.is_not(None), giro.c.vendidos > 0,
+               Produto.estoque < por_dia * cobertura)
+        .order_by(Produto.estoque / por_dia, Produto.id)
+        .limit(limite_pagina(50))
+    ).all()
+    
+    produtos = []
+    for linha in linhas:
+        produto = linha_giro(linha, dias)
+        velocidade = linha.vendidos / dias
+        produto['dias_restantes'] = round(max(linha.estoque, 0) / velocidade, 1)
+        produto['sugestao'] = math.ceil(velocidade * cobertura) - max(linha.estoque, 0)
+        produtos.append(produto)
+    return jsonify({'dias': dias, 'cobertura': cobertura, 'produtos': produtos})
 
 @app.route('/api/vendas', methods=['POST'])
 def registrar_venda():
     if 'user_id' not in session:
         return jsonify({'error': 'Não autenticado'}), 401
     
-    dados = request.get_json()
-    venda = Venda(
-        usuario_id=session['user_id'],
-        cliente_id=dados.get('cliente_id'),
-        total=dados['total'],
-        tipo_cupom=dados.get('tipo_cupom', 'nao_fiscal')
-    )
+    try:
+        venda = preparar_venda(request.get_json())
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    db.session.add(venda)
-    db.session.commit()
+    try:
+        resultado = executar_escrita(gravar_vendas, session['user_id'], [venda])[0]
+    except IntegrityError:
+        return jsonify({'error': 'Venda já está sendo registrada, tente novamente'}), 409
+    
+    if 'error' in resultado:
+        return jsonify(dict(resultado, success=False)), 409
+    return jsonify(dict(resultado, success=True))
+
+@app.route('/api/vendas/lote', methods=['POST'])
+def registrar_vendas_lote():
+    if 'user_id' not in session:
+        return jsonify({'error': 'Não autenticado'}), 401
+    
+    lote = (request.get_json(silent=True) or {}).get('vendas')
+    if not isinstance(lote, list) or not lote:
+        return jsonify({'error': 'Informe a lista de vendas'}), 400
+    if len(lote) > LIMITE_LOTE_VENDAS:
+        return jsonify({'error': f'Máximo de {LIMITE_LOTE_VENDAS} vendas por lote'}), 400
+    
+    # Vendas inválidas são recusadas individualmente; as demais entram em uma transação
+    resultados = [None] * len(lote)
+    preparadas = []
+    for i, dados in enumerate(lote):
+        try:
+            venda = preparar_venda(dados)
+            if venda['chave_idempotencia'] is None:
+                raise ValueError('Chave de idempotência obrigatória')
+            preparadas.append((i, venda))
+        except ValueError as e:
+            chave = dados.get('chave_idempotencia') if isinstance(dados, dict) else None
+            resultados[i] = {'success': False, 'chave_idempotencia': chave, 'error': str(e)}
+    
+    try:
+        gravadas = executar_escrita(gravar_vendas, session['user_id'], [v for _, v in preparadas])
+    except IntegrityError:
+        return jsonify({'error': 'Lote já está sendo registrado, tente novamente'}), 409
+    
+    for (i, venda), resultado in zip(preparadas, gravadas):
+        resultados[i] = dict(resultado, success='error' not in resultado,
+                             chave_idempotencia=venda['chave_idempotencia'])
+    
+    return jsonify({'success': True, 'resultados': resultados})
+
+@app.route('/api/vendas/<int:id>/cupom', methods=['GET', 'POST'])
+def cupom_venda(id):
+    if 'user_id' not in session:
+        return jsonify({'error': 'Não autenticado'}), 401
+    
+    if request.method == 'POST':
+        # Reemissão: volta o cupom para a fila, inclusive depois de esgotadas as tentativas
+        def reenfileirar():
+            if db.session.get(Venda, id) is None:
+                return False
+            enfileirar_cupons(db.session, [id])
+            return True
+        if not executar_escrita(reenfileirar):
+            abort(404)
+    
+    trabalho = db.session.execute(
+        db.select(TrabalhoCupom).where(TrabalhoCupom.venda_id == id).order_by(TrabalhoCupom.id.desc()).limit(1)
+    ).scalar()
+    if trabalho is None:
+        abort(404)
+    return jsonify(trabalho.to_dict())
+
+# ===== AUTORIZAÇÃO DE ADMINISTRADOR =====
+def _assinador_autorizacao():
+    return URLSafeTimedSerializer(app.secret_key, salt='autorizacao-admin')
+
+def emitir_autorizacao_admin(admin_id, operador_id):
+    return _assinador_autorizacao().dumps({'admin': admin_id, 'operador': operador_id})
+
+def validar_autorizacao_admin(token, operador_id):
+    try:
+        dados = _assinador_autorizacao().loads(token, max_age=app.config['AUTORIZACAO_ADMIN_TTL'])
+    except BadSignature:
+        return None
+    # O token só vale para a sessão do operador que o solicitou
+    if dados.get('operador') != operador_id:
+        return None
+    return dados.get('admin')
+
+def _origem_autorizacao(senha_admin):
+    # O que vai para a auditoria: o administrador da autorização, nunca a senha digitada
+    return senha_admin if senha_admin.startswith('autorizacao:') else 'senha'
+
+def conferir_admin(dados, operador_id):
+    # Aceita a senha de administrador ou uma autorização emitida há pouco (sem novo bcrypt).
+    # Devolve o que fica registrado na operação e a mensagem de erro, se recusada.
+    if dados.get('token_admin'):
+        admin_id = validar_autorizacao_admin(dados['token_admin'], operador_id)
+        if admin_id is None:
+            return None, 'Autorização de administrador expirada ou inválida'
+        return f'autorizacao:{admin_id}', None
+    
+    senha_admin = dados.get('senha_admin', '')
+    
+    # Verificar senha de administrador (java1814)
+    admin = Usuario.query.filter_by(perfil='admin', ativo=True).first()
+    if not admin or not admin.verificar_senha(senha_admin):
+        return None, 'Senha de administrador inválida'
+    return senha_admin, None
+
+@app.route('/api/caixa/autorizacao', methods=['POST'])
+def autorizacao_admin():
+    if 'user_id' not in session:
+        return jsonify({'error': 'Não autenticado'}), 401
+    
+    dados = request.get_json()
+    admin = Usuario.query.filter_by(perfil='admin', ativo=True).first()
+    if not admin or not admin.verificar_senha(dados.get('senha_admin', '')):
+        auditar('autorizacao_recusada')
+        return jsonify({'error': 'Senha de administrador inválida'}), 403
     
+    auditar('autorizacao_admin', alvo=f'usuario:{admin.id}')
     return jsonify({
         'success': True,
-        'venda_id': venda.id,
-        'data': venda.data.strftime('%d/%m/%Y %H:%M:%S'),
-        'total': venda.total
+        'token': emitir_autorizacao_admin(admin.id, session['user_id']),
+        'expira_em': app.config['AUTORIZACAO_ADMIN_TTL']
     })
 
 @app.route('/api/caixa/sangria', methods=['POST'])
@@ -323,25 +3000,216 @@ def sangria():
         return jsonify({'error': 'Não autenticado'}), 401
     
     dados = request.get_json()
-    senha_admin = dados.get('senha_admin', '')
+    usuario_id = session['user_id']
     
-    # Verificar senha de administrador (java1814)
-    admin = Usuario.query.filter_by(perfil='admin', ativo=True).first()
-    if not admin or not admin.verificar_senha(senha_admin):
-        return jsonify({'error': 'Senha de administrador inválida'}), 403
+    senha_admin, erro = conferir_admin(dados, usuario_id)
+    if erro:
+        auditar('sangria_recusada', valor=dados.get('valor'), motivo=erro)
+        return jsonify({'error': erro}), 403
+    
+    def gravar():
+        movimentacao = MovimentacaoCaixa(
+            usuario_id=usuario_id,
+            tipo='sangria',
+            valor=float(dados['valor']),
+            especificacao=dados.get('especificacao', ''),
+            senha_admin=senha_admin
+        )
+        
+        db.session.add(movimentacao)
+        db.session.flush()
+        return movimentacao.id
+    
+    movimentacao_id = executar_escrita(gravar)
+    auditar('sangria', alvo=f'movimentacao:{movimentacao_id}', valor=float(dados['valor']),
+            especificacao=dados.get('especificacao', ''), autorizacao=_origem_autorizacao(senha_admin))
+    return jsonify({'success': True, 'id': movimentacao_id})
+
+@app.route('/api/vendas/<int:id>/cancelar', methods=['POST'])
+def cancelar_venda(id):
+    if 'user_id' not in session:
+        return jsonify({'error': 'Não autenticado'}), 401
+    
+    dados = request.get_json(silent=True) or {}
+    senha_admin, erro = conferir_admin(dados, session['user_id'])
+    if erro:
+        auditar('cancelamento_recusado', alvo=f'venda:{id}', motivo=erro)
+        return jsonify({'error': erro}), 403
+    
+    def gravar():
+        # A condição vai no próprio UPDATE: de dois cancelamentos simultâneos da mesma
+        # venda só um muda a linha, e só ele devolve o estoque e acumula os totais.
+        venda = db.session.execute(
+            update(Venda).where(Venda.id == id, or_(Venda.cancelada.is_(None), Venda.cancelada == False))
+            .values(cancelada=True, senha_admin_cancelamento=senha_admin)
+            .returning(Venda.data, Venda.usuario_id, Venda.total),
+            execution_options={'synchronize_session': False}
+        ).first()
+        if venda is None:
+            return None if db.session.get(Venda, id) is None else False
+        acumular_fechamento(db.session, [(venda.data.date(), venda.usuario_id, 'canceladas', venda.total)])
+        
+        # Os itens voltam ao estoque
+        itens = db.session.execute(
+            db.select(ItemVenda.produto_id, func.sum(ItemVenda.quantidade),
+                      func.sum(ItemVenda.quantidade * ItemVenda.preco_unitario))
+            .where(ItemVenda.venda_id == id).group_by(ItemVenda.produto_id)
+        ).all()
+        if itens:
+            baixar_estoque({produto_id: -quantidade for produto_id, quantidade, _ in itens})
+            acumular_giro(db.session, [(venda.data, produto_id, -quantidade, -valor)
+                                       for produto_id, quantidade, valor in itens])
+        return True
+    
+    resultado = executar_escrita(gravar)
+    if resultado is None:
+        abort(404)
+    if resultado is False:
+        return jsonify({'error': 'Venda já cancelada'}), 400
+    auditar('cancelamento', alvo=f'venda:{id}', autorizacao=_origem_autorizacao(senha_admin))
+    return jsonify({'success': True, 'message': 'Venda cancelada com sucesso!'})
+
+@app.route('/api/vendas/exportar')
+def exportar_vendas():
+    if 'user_id' not in session or session.get('perfil') != 'admin':
+        return jsonify({'error': 'Acesso restrito ao administrador'}), 403
     
-    movimentacao = MovimentacaoCaixa(
-        usuario_id=session['user_id'],
-        tipo='sangria',
-        valor=float(dados['valor']),
-        especificacao=dados.get('especificacao', ''),
-        senha_admin=senha_admin
+    formato = request.args.get('formato', 'csv')
+    if formato not in ('csv', 'ndjson'):
+        return jsonify({'error': 'Formato deve ser csv ou ndjson'}), 400
+    try:
+        inicio, fim = periodo_exportacao(request.args.get('inicio'), request.args.get('fim'))
+    except ValueError:
+        return jsonify({'error': 'Data inválida'}), 400
+    
+    tipo = 'text/csv' if formato == 'csv' else 'application/x-ndjson'
+    conexao = base_relatorios.engine().connect()
+    resposta = Response(
+        stream_with_context(gerar_exportacao_vendas(formato, inicio, fim, conexao)),
+        mimetype=tipo,
+        headers={'Content-Disposition': f'attachment; filename=vendas.{formato}',
+                 'X-Base-Relatorios-Idade': f'{base_relatorios.idade():.0f}'}
     )
+    resposta.call_on_close(conexao.close)
+    return resposta
+
+@app.route('/api/estoque/divergencias')
+def divergencias_estoque():
+    if 'user_id' not in session or session.get('perfil') != 'admin':
+        return jsonify({'error': 'Acesso restrito ao administrador'}), 403
     
-    db.session.add(movimentacao)
-    db.session.commit()
+    consulta = DivergenciaEstoque.query
+    if request.args.get('todas') != '1':
+        consulta = consulta.filter(DivergenciaEstoque.resolvida == False)
+    try:
+        divergencias, proximo = paginar(
+            consulta, [DivergenciaEstoque.id], limite_pagina(100),
+            decodificar_cursor(request.args.get('cursor')), lambda d: [d.id]
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return resposta_paginada([d.to_dict() for d in divergencias], proximo)
+
+@app.route('/api/estoque/divergencias/<int:id>/resolver', methods=['POST'])
+def resolver_divergencia(id):
+    if 'user_id' not in session or session.get('perfil') != 'admin':
+        return jsonify({'error': 'Acesso restrito ao administrador'}), 403
+    
+    def resolver():
+        divergencia = db.session.get(DivergenciaEstoque, id)
+        if divergencia is None:
+            return False
+        divergencia.resolvida = True
+        return True
+    
+    if not executar_escrita(resolver):
+        abort(404)
+    
+    auditar('divergencia_resolvida', alvo=f'divergencia:{id}')
+    return jsonify({'success': True})
+
+@app.route('/api/auditoria')
+def consultar_auditoria():
+    if 'user_id' not in session or session.get('perfil') != 'admin':
+        return jsonify({'error': 'Acesso restrito ao administrador'}), 403
+    
+    try:
+        inicio, fim = periodo_exportacao(request.args.get('inicio'), request.args.get('fim'))
+        cursor = decodificar_cursor(request.args.get('cursor'))
+        if cursor:
+            cursor = [datetime.fromisoformat(cursor[0]), cursor[-1]]
+    except (ValueError, TypeError, IndexError):
+        return jsonify({'error': 'Data ou cursor inválido'}), 400
+    
+    # O que ainda está no buffer também precisa aparecer
+    auditoria.descarregar()
+    
+    consulta = EventoAuditoria.query
+    if request.args.get('usuario_id'):
+        consulta = consulta.filter(EventoAuditoria.usuario_id == request.args.get('usuario_id', type=int))
+    if request.args.get('acao'):
+        consulta = consulta.filter(EventoAuditoria.acao == request.args['acao'])
+    if inicio:
+        consulta = consulta.filter(EventoAuditoria.data >= inicio)
+    if fim:
+        consulta = consulta.filter(EventoAuditoria.data < fim)
+    
+    try:
+        eventos, proximo = paginar(
+            consulta, [EventoAuditoria.data, EventoAuditoria.id], limite_pagina(100), cursor,
+            lambda e: [e.data.isoformat(sep=' '), e.id]
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return resposta_paginada([e.to_dict() for e in eventos], proximo)
+
+@app.route('/api/caixa/fechamento')
+def fechamento_caixa():
+    if 'user_id' not in session:
+        return jsonify({'error': 'Não autenticado'}), 401
+    
+    try:
+        dia = date.fromisoformat(request.args['data']) if request.args.get('data') else date.today()
+    except ValueError:
+        return jsonify({'error': 'Data inválida'}), 400
     
-    return jsonify({'success': True, 'id': movimentacao.id})
+    # Operadores veem apenas o próprio caixa; o administrador pode ver todos
+    usuario_id = None
+    if session.get('perfil') != 'admin':
+        usuario_id = session['user_id']
+    elif request.args.get('usuario_id'):
+        usuario_id = request.args.get('usuario_id', type=int)
+    consulta = db.select(FechamentoCaixa).filter_by(data=dia)
+    if usuario_id is not None:
+        consulta = consulta.filter_by(usuario_id=usuario_id)
+    
+    # Dias anteriores saem da base de relatórios, se a cópia foi feita depois do fim do dia;
+    # senão (logo após a meia-noite) faltariam as últimas vendas e o fechamento vem do banco
+    # principal, como o do dia corrente, que precisa bater com a gaveta agora
+    cabecalhos = {}
+    fim_do_dia = datetime.combine(dia + timedelta(days=1), datetime.min.time()).timestamp()
+    if dia < date.today() and base_relatorios.cobre(fim_do_dia):
+        # A cópia só muda quando é atualizada, e a atualização invalida 'relatorio:*'
+        def carregar():
+            with Session(base_relatorios.engine()) as sessao_relatorios:
+                return [f.to_dict() for f in sessao_relatorios.scalars(consulta)]
+        operadores = cache_consultas.obter(('fechamento', dia, usuario_id), ['relatorio:*'], carregar)
+        cabecalhos['X-Base-Relatorios-Idade'] = f'{base_relatorios.idade():.0f}'
+    else:
+        operadores = [f.to_dict() for f in db.session.scalars(consulta)]
+    total = {chave: sum(o[chave] for o in operadores)
+             for chave in operadores[0] if chave not in ('data', 'usuario_id')} if operadores else {}
+    return jsonify({'data': dia.isoformat(), 'operadores': operadores, 'total': total}), cabecalhos
+
+@app.route('/api/relatorios/base', methods=['GET', 'POST'])
+def base_relatorios_api():
+    if 'user_id' not in session or session.get('perfil') != 'admin':
+        return jsonify({'error': 'Acesso restrito ao administrador'}), 403
+    if request.method == 'POST':
+        return jsonify(base_relatorios.atualizar())
+    return jsonify(base_relatorios.estado())
 
 # ===== ROTAS DE CLIENTES =====
 @app.route('/api/clientes', methods=['GET', 'POST'])
@@ -362,56 +3230,76 @@ def clientes_api():
         if tipo == 'cnpj' and len(documento) != 14:
             return jsonify({'error': 'CNPJ inválido! Deve ter 14 dígitos.'}), 400
         
-        # Verificar se já existe
-        if Cliente.query.filter_by(documento=documento).first():
-            return jsonify({'error': 'Cliente com este documento já cadastrado!'}), 400
-        
-        cliente = Cliente(
-            nome=dados['nome'].strip(),
-            tipo=tipo,
-            documento=documento,
-            telefone=dados.get('telefone', '').strip(),
-            email=dados.get('email', '').strip(),
-            endereco=dados.get('endereco', '').strip()
-        )
+        def gravar():
+            # Verificar se já existe
+            if Cliente.query.filter_by(documento=documento).first():
+                return None
+            
+            cliente = Cliente(
+                nome=dados['nome'].strip(),
+                tipo=tipo,
+                documento=documento,
+                telefone=dados.get('telefone', '').strip(),
+                email=dados.get('email', '').strip(),
+                endereco=dados.get('endereco', '').strip()
+            )
+            
+            db.session.add(cliente)
+            db.session.flush()
+            return cliente.id
         
-        db.session.add(cliente)
-        db.session.commit()
+        cliente_id = executar_escrita(gravar)
+        if cliente_id is None:
+            return jsonify({'error': 'Cliente com este documento já cadastrado!'}), 400
         
         return jsonify({
             'success': True,
-            'id': cliente.id,
+            'id': cliente_id,
             'message': 'Cliente cadastrado com sucesso!'
         })
     
     # GET - Listar clientes
     busca = request.args.get('busca', '').strip()
-    if busca:
-        clientes = Cliente.query.filter(
-            (Cliente.nome.ilike(f'%{busca}%')) | 
-            (Cliente.documento.ilike(f'%{busca}%'))
-        ).limit(20).all()
-    else:
-        clientes = Cliente.query.order_by(Cliente.nome).limit(50).all()
+    limite = limite_pagina(20 if busca else 50)
+    
+    def listar():
+        cursor = decodificar_cursor(request.args.get('cursor'))
+        if busca:
+            clientes, proximo = buscar_clientes(busca, limite, cursor)
+        else:
+            clientes, proximo = paginar(db.select(*COLUNAS_CLIENTE), [Cliente.nome, Cliente.id], limite,
+                                        cursor, lambda c: [c.nome, c.id])
+        return como_dicts(clientes), proximo
+    
+    try:
+        clientes, proximo = cache_consultas.obter(
+            ('clientes', busca, request.args.get('cursor'), limite), ['cliente:*'], listar
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    return jsonify([c.to_dict() for c in clientes])
+    return resposta_paginada(clientes, proximo)
 
 @app.route('/api/clientes/<int:id>', methods=['PUT', 'DELETE'])
 def cliente_individual(id):
     if 'user_id' not in session:
         return jsonify({'error': 'Não autenticado'}), 401
     
-    cliente = Cliente.query.get_or_404(id)
-    
     if request.method == 'PUT':
         dados = request.get_json()
         
-        cliente.nome = dados.get('nome', cliente.nome).strip()
-        cliente.telefone = dados.get('telefone', cliente.telefone).strip()
-        cliente.email = dados.get('email', cliente.email).strip()
-        cliente.endereco = dados.get('endereco', cliente.endereco).strip()
+        def atualizar():
+            cliente = db.session.get(Cliente, id)
+            if cliente is None:
+                return False
+            cliente.nome = dados.get('nome', cliente.nome).strip()
+            cliente.telefone = dados.get('telefone', cliente.telefone).strip()
+            cliente.email = dados.get('email', cliente.email).strip()
+            cliente.endereco = dados.get('endereco', cliente.endereco).strip()
+            return True
         
-        db.session.commit()
+        if not executar_escrita(atualizar):
+            abort(404)
         
         return jsonify({
             'success': True,
@@ -419,9 +3307,20 @@ def cliente_individual(id):
         })
     
     # DELETE
-    db.session.delete(cliente)
-    db.session.commit()
+    def excluir():
+        cliente = db.session.get(Cliente, id)
+        if cliente is None:
+            return None
+        excluido = cliente.to_dict()
+        db.session.delete(cliente)
+        return excluido
     
+    excluido = executar_escrita(excluir)
+    if excluido is None:
+        abort(404)
+    
+    # Guarda o cadastro apagado: é a única cópia que sobra
+    auditar('exclusao_cliente', alvo=f'cliente:{id}', cliente=excluido)
     return jsonify({
         'success': True,
         'message': 'Cliente excluído com sucesso!'
@@ -432,8 +3331,14 @@ def buscar_cliente(id):
     if 'user_id' not in session:
         return jsonify({'error': 'Não autenticado'}), 401
     
-    cliente = Cliente.query.get_or_404(id)
-    return jsonify(cliente.to_dict())
+    def carregar():
+        cliente = db.session.get(Cliente, id)
+        return cliente.to_dict() if cliente else None
+    
+    cliente = cache_consultas.obter(('cliente', id), [f'cliente:{id}'], carregar)
+    if cliente is None:
+        abort(404)
+    return jsonify(cliente)
 
 # ===== ROTA PARA TELA DE CLIENTES =====
 @app.route('/clientes')
@@ -441,7 +3346,7 @@ def tela_clientes():
     if 'user_id' not in session:
         return redirect('/login')
     
-    return '''
+    return servir_pagina('clientes', '''
     <!DOCTYPE html>
     <html lang="pt-BR">
     <head>
@@ -520,6 +3425,7 @@ def tela_clientes():
                         </tr>
                     </tbody>
                 </table>
+                <button class="btn btn-primary" id="btn-carregar-mais" style="display:none; margin-top:20px; width:100%;">Carregar mais</button>
             </div>
         </div>
 
@@ -572,6 +3478,8 @@ def tela_clientes():
         <script>
             let clientes = [];
             let clienteEditando = null;
+            let termoAtual = '';
+            let proximoCursor = null;
 
             // Formatação de documentos
             function atualizarMascaraDocumento() {
@@ -622,11 +3530,17 @@ def tela_clientes():
                 e.target.value = valor;
             });
 
-            // Buscar clientes
-            async function buscarClientes(termo = '') {
+            // Buscar clientes (com cursor, acrescenta a próxima página à lista atual)
+            async function buscarClientes(termo = '', cursor = null) {
                 try {
-                    const response = await fetch(`/api/clientes?busca=${encodeURIComponent(termo)}`);
-                    clientes = await response.json();
+                    let url = `/api/clientes?busca=${encodeURIComponent(termo)}`;
+                    if (cursor) url += `&cursor=${encodeURIComponent(cursor)}`;
+                    const response = await fetch(url);
+                    const pagina = await response.json();
+                    clientes = cursor ? clientes.concat(pagina) : pagina;
+                    termoAtual = termo;
+                    proximoCursor = response.headers.get('X-Proximo-Cursor');
+                    document.getElementById('btn-carregar-mais').style.display = proximoCursor ? 'block' : 'none';
                     renderizarClientes();
                 } catch (err) {
                     console.error('Erro ao buscar clientes:', err);
@@ -779,6 +3693,10 @@ def tela_clientes():
                 }
             });
 
+            document.getElementById('btn-carregar-mais').addEventListener('click', () => {
+                if (proximoCursor) buscarClientes(termoAtual, proximoCursor);
+            });
+
             // Cancelar modal
             document.getElementById('btn-cancelar-cliente').addEventListener('click', () => {
                 document.getElementById('modal-cliente').style.display = 'none';
@@ -805,7 +3723,7 @@ def tela_clientes():
         </script>
     </body>
     </html>
-    '''
+    ''')
 
 @app.route('/')
 def index():
@@ -813,10 +3731,195 @@ def index():
         return redirect('/vendas' if session['perfil'] == 'operador' else '/clientes')
     return redirect('/login')
 
+# ===== MIGRAÇÕES =====
+# db.create_all() só cria tabelas que ainda não existem. A evolução de bancos já em uso
+# fica nas migrações abaixo, aplicadas em ordem; a versão do esquema é guardada em
+# PRAGMA user_version, na mesma transação (BEGIN IMMEDIATE) de cada migração. Como num banco novo o
+# create_all já cria tudo no formato atual, toda migração precisa ser idempotente.
+MIGRACOES = []
+
+def migracao(versao, descricao):
+    def registrar(func):
+        MIGRACOES.append((versao, descricao, func))
+        return func
+    return registrar
+
+def _adicionar_coluna(tabela, coluna, tipo):
+    colunas = {linha[1] for linha in db.session.execute(text(f'PRAGMA table_info({tabela})'))}
+    if coluna not in colunas:
+        db.session.execute(text(f'ALTER TABLE {tabela} ADD COLUMN {coluna} {tipo}'))
+
+def _criar_indice(nome, tabela, *colunas, unico=False):
+    db.session.execute(text(
+        f"CREATE {'UNIQUE ' if unico else ''}INDEX IF NOT EXISTS {nome} ON {tabela} ({', '.join(colunas)})"
+    ))
+
+@migracao(1, 'idempotência de vendas')
+def _migracao_idempotencia():
+    _adicionar_coluna('venda', 'chave_idempotencia', 'VARCHAR(64)')
+    _criar_indice('ix_venda_chave_idempotencia', 'venda', 'chave_idempotencia', unico=True)
+    _criar_indice('ix_venda_data', 'venda', 'data')
+    _criar_indice('ix_item_venda_venda_id', 'item_venda', 'venda_id')
+
+@migracao(2, 'versões do catálogo e paginação')
+def _migracao_catalogo():
+    _adicionar_coluna('produto', 'versao', 'INTEGER DEFAULT 0')
+    _criar_indice('ix_produto_versao', 'produto', 'versao')
+    _criar_indice('ix_produto_ativo_descricao_id', 'produto', 'ativo', 'descricao', 'id')
+    _criar_indice('ix_cliente_nome_id', 'cliente', 'nome', 'id')
+
+@migracao(3, 'busca de clientes')
+def _migracao_busca_clientes():
+    criar_busca_clientes()
+
+@migracao(4, 'índices de consultas frequentes')
+def _migracao_indices():
+    # Produto.ativo já é a primeira coluna de ix_produto_ativo_descricao_id
+    _criar_indice('ix_venda_usuario_id', 'venda', 'usuario_id')
+    _criar_indice('ix_venda_cliente_id', 'venda', 'cliente_id')
+    _criar_indice('ix_item_venda_produto_id', 'item_venda', 'produto_id')
+    _criar_indice('ix_movimentacao_caixa_data', 'movimentacao_caixa', 'data')
+    _criar_indice('ix_usuario_perfil', 'usuario', 'perfil')
+
+@migracao(5, 'giro de produtos')
+def _migracao_giro():
+    reconstruir_giro()
+
+def versao_esquema():
+    return db.session.execute(text('PRAGMA user_version')).scalar()
+
+def migrar_banco():
+    db.create_all()
+    atual = versao_esquema()
+    db.session.commit()
+    for versao, descricao, func in sorted(MIGRACOES, key=lambda m: m[0]):
+        if versao <= atual:
+            continue
+        # _antes_do_comando só abre a transação antes de INSERT/UPDATE/DELETE; DDL e PRAGMA
+        # rodariam em autocommit. O BEGIN explícito põe a migração e o user_version juntos:
+        # uma migração interrompida no meio não deixa o esquema mudado sem a versão.
+        db.session.execute(text('BEGIN IMMEDIATE'))
+        try:
+            # Outro processo pode ter aplicado esta migração enquanto esperávamos o lock
+            if versao_esquema() < versao:
+                func()
+                db.session.execute(text(f'PRAGMA user_version = {versao}'))
+        except BaseException:
+            db.session.rollback()
+            raise
+        db.session.commit()
+        print(f'✓ Migração {versao} aplicada: {descricao}')
+
+@app.cli.command('migrar')
+def migrar_comando():
+    migrar_banco()
+    print(f'✓ Esquema na versão {versao_esquema()}')
+
+# ===== PLANOS DE CONSULTA =====
+# As consultas mais frequentes do sistema, no mesmo formato em que as rotas as montam.
+# verificar-planos roda EXPLAIN QUERY PLAN em cada uma e falha se alguma percorrer uma
+# tabela inteira (SCAN sem índice) — sinal de que falta índice ou de que a consulta mudou.
+def consultas_principais():
+    giro = giro_por_produto(JANELA_GIRO_DIAS)
+    return {
+        'login': db.select(Usuario).where(Usuario.login == '', Usuario.ativo == True),
+        'administrador ativo': db.select(Usuario).where(Usuario.perfil == 'admin', Usuario.ativo == True).limit(1),
+        'produto por código': db.select(Produto).where(Produto.codigo == ''),
+        'catálogo completo': db.select(*COLUNAS_PRODUTO).where(Produto.ativo == True),
+        'catálogo desde versão': db.select(*COLUNAS_PRODUTO, Produto.ativo).where(Produto.versao > 0),
+        'página de produtos': (
+            db.select(*COLUNAS_PRODUTO).where(Produto.ativo == True, tuple_(Produto.descricao, Produto.id) > tuple_('', 0))
+            .order_by(Produto.descricao, Produto.id).limit(LIMITE_MAXIMO_PAGINA + 1)
+        ),
+        'página de clientes': (
+            db.select(*COLUNAS_CLIENTE).where(tuple_(Cliente.nome, Cliente.id) > tuple_('', 0))
+            .order_by(Cliente.nome, Cliente.id).limit(LIMITE_MAXIMO_PAGINA + 1)
+        ),
+        'cliente por documento': (
+            db.select(*COLUNAS_CLIENTE).where(Cliente.documento >= '', Cliente.documento < '')
+            .order_by(Cliente.documento).limit(LIMITE_MAXIMO_PAGINA + 1)
+        ),
+        'venda por chave': db.select(Venda.id).where(Venda.chave_idempotencia.in_([''])),
+        'vendas por período': (
+            db.select(Venda.id, Usuario.nome, Cliente.nome)
+            .join(Usuario, Usuario.id == Venda.usuario_id)
+            .outerjoin(Cliente, Cliente.id == Venda.cliente_id)
+            .where(Venda.data >= datetime.min, Venda.data < datetime.max)
+            .order_by(Venda.data, Venda.id)
+        ),
+        'vendas do operador': db.select(Venda).where(Venda.usuario_id == 0),
+        'vendas do cliente': db.select(Venda).where(Venda.cliente_id == 0),
+        'itens da venda': (
+            db.select(ItemVenda.produto_id, func.sum(ItemVenda.quantidade),
+                      func.sum(ItemVenda.quantidade * ItemVenda.preco_unitario))
+            .where(ItemVenda.venda_id == 0).group_by(ItemVenda.produto_id)
+        ),
+        'vendas do produto': db.select(ItemVenda).where(ItemVenda.produto_id == 0),
+        'movimentações do período': (
+            db.select(MovimentacaoCaixa).where(MovimentacaoCaixa.data >= datetime.min,
+                                               MovimentacaoCaixa.data < datetime.max)
+        ),
+        'fechamento do dia': db.select(FechamentoCaixa).where(FechamentoCaixa.data == date.min),
+        'próximo cupom': (
+            db.select(TrabalhoCupom.id)
+            .where(TrabalhoCupom.status == 'pendente', TrabalhoCupom.proxima_tentativa <= datetime.min)
+            .order_by(TrabalhoCupom.proxima_tentativa, TrabalhoCupom.id).limit(1)
+        ),
+        'cupom da venda': (
+            db.select(TrabalhoCupom).where(TrabalhoCupom.venda_id == 0).order_by(TrabalhoCupom.id.desc()).limit(1)
+        ),
+        'divergências pendentes': (
+            db.select(DivergenciaEstoque).where(DivergenciaEstoque.resolvida == False, DivergenciaEstoque.id > 0)
+            .order_by(DivergenciaEstoque.id).limit(LIMITE_MAXIMO_PAGINA + 1)
+        ),
+        'auditoria do usuário': (
+            db.select(EventoAuditoria)
+            .where(EventoAuditoria.usuario_id == 0, EventoAuditoria.data >= datetime.min,
+                   EventoAuditoria.data < datetime.max)
+            .order_by(EventoAuditoria.data, EventoAuditoria.id).limit(LIMITE_MAXIMO_PAGINA + 1)
+        ),
+        'auditoria do período': (
+            db.select(EventoAuditoria)
+            .where(EventoAuditoria.data >= datetime.min, EventoAuditoria.data < datetime.max)
+            .order_by(EventoAuditoria.data, EventoAuditoria.id).limit(LIMITE_MAXIMO_PAGINA + 1)
+        ),
+        'giro da janela': (
+            db.select(Produto.id, giro.c.vendidos).join(giro, giro.c.produto_id == Produto.id)
+            .order_by(giro.c.vendidos.desc()).limit(LIMITE_MAXIMO_PAGINA)
+        ),
+    }
+
+def verificar_planos():
+    # Devolve {consulta: [passos do plano que varrem a tabela inteira]}
+    varreduras = {}
+    conexao = db.session.connection()
+    for nome, consulta in consultas_principais().items():
+        compilada = consulta.compile(bind=db.engine, compile_kwargs={'render_postcompile': True})
+        # Os valores não influenciam o plano: o SQLite o escolhe ao preparar o comando
+        parametros = (None,) * len(compilada.positiontup)
+        plano = conexao.exec_driver_sql(f'EXPLAIN QUERY PLAN {compilada}', parametros).all()
+        # Só conta varredura de tabela; percorrer uma subconsulta já filtrada é esperado
+        passos = [linha[3] for linha in plano
+                  if re.fullmatch(r'SCAN \w+', linha[3]) and linha[3].split()[1] in db.metadata.tables]
+        if passos:
+            varreduras[nome] = passos
+    return varreduras
+
+@app.cli.command('verificar-planos')
+def verificar_planos_comando():
+    varreduras = verificar_planos()
+    for nome, passos in varreduras.items():
+        print(f"✗ {nome}: {'; '.join(passos)}")
+    if varreduras:
+        raise SystemExit(1)
+    print(f'✓ {len(consultas_principais())} consultas usam índices')
+
 # ===== INICIALIZAÇÃO =====
 def criar_usuarios_padrao():
     with app.app_context():
-        db.create_all()
+        migrar_banco()
+        if FechamentoCaixa.query.first() is None and (Venda.query.first() or MovimentacaoCaixa.query.first()):
+            reconstruir_fechamentos()
         if Usuario.query.count() == 0:
             # Admin com senha java1814
             admin = Usuario(nome='Administrador', login='admin', perfil='admin')
@@ -855,6 +3958,7 @@ def criar_usuarios_padrao():
 
 if __name__ == '__main__':
     criar_usuarios_padrao()
+    spool_cupons.iniciar()  # cupons que ficaram na fila da última execução
     print("\n🚀 Sistema iniciado com sucesso!")
     print("   Acesse em: http://localhost:5000")
     print("   Credenciais:")
@@ -0,0 +1,196 @@
+# Simula vários caixas usando o sistema ao mesmo tempo: cada terminal faz login e depois
+# alterna buscas de produto e de cliente, vendas e sangrias na proporção de --mix.
+# Sem --url a aplicação roda no próprio processo (cliente de teste do Flask) sobre a base
+# de --banco; com --url as requisições vão para um servidor local já em execução.
+#
+# Uso: python benchmarks/dados.py --banco /tmp/bench.db
+#      python benchmarks/carga.py --banco /tmp/bench.db --terminais 8 --duracao 60 --salvar base.json
+#      python benchmarks/carga.py --banco /tmp/bench.db --terminais 8 --duracao 60 --comparar base.json
+import argparse
+import http.cookiejar
+import json
+import os
+import random
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+
+import relatorio
+from dados import CORES, ITENS, NOMES, SOBRENOMES
+
+MIX_PADRAO = 'busca_produto=50,busca_cliente=15,venda=30,sangria=5'
+
+class ClienteTeste:
+    def __init__(self, app):
+        self._cliente = app.test_client()
+
+    def requisitar(self, metodo, caminho, dados=None):
+        resposta = self._cliente.open(caminho, method=metodo, json=dados)
+        return resposta.status_code, resposta.get_json(silent=True)
+
+class ClienteHttp:
+    def __init__(self, url):
+        self._url = url.rstrip('/')
+        self._abridor = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+
+    def requisitar(self, metodo, caminho, dados=None):
+        corpo = json.dumps(dados).encode('utf-8') if dados is not None else None
+        pedido = urllib.request.Request(self._url + caminho, data=corpo, method=metodo,
+                                        headers={'Content-Type': 'application/json'})
+        try:
+            with self._abridor.open(pedido, timeout=60) as resposta:
+                status, conteudo = resposta.status, resposta.read()
+        except urllib.error.HTTPError as e:
+            status, conteudo = e.code, e.read()
+        try:
+            return status, json.loads(conteudo)
+        except ValueError:
+            return status, None
+
+class Terminal:
+    def __init__(self, cliente, login, args, semente, latencias, erros):
+        self.cliente = cliente
+        self.login = login
+        self.args = args
+        self.rng = random.Random(semente)
+        self.latencias = latencias
+        self.erros = erros
+        self.produtos = []
+        self.token_admin = None
+        self.inicio_medicao = 0.0
+
+    def medir(self, nome, metodo, caminho, dados=None):
+        inicio = time.perf_counter()
+        status, resposta = self.cliente.requisitar(metodo, caminho, dados)
+        duracao = time.perf_counter() - inicio
+        if inicio < self.inicio_medicao:
+            pass  # aquecimento: login, carga do índice de produtos, caches do SQLite
+        elif status >= 400:
+            self.erros[nome] += 1
+        else:
+            self.latencias[nome].append(duracao)
+        return status, resposta
+
+    def entrar(self):
+        status, _ = self.medir('login', 'POST', '/login', {'login': self.login, 'senha': self.args.senha})
+        if status != 200:
+            print(f'Login de {self.login} recusado ({status}); a base foi gerada com benchmarks/dados.py?')
+        return status == 200
+
+    def busca_produto(self):
+        termo = self.rng.choice([self.rng.choice(ITENS), self.rng.choice(CORES),
+                                 f'{self.rng.choice(ITENS)} {self.rng.choice(CORES)}'])
+        status, resposta = self.medir('busca_produto', 'GET', f'/api/produtos/buscar?q={urllib.parse.quote(termo)}')
+        if status == 200 and resposta:
+            self.produtos = resposta
+
+    def busca_cliente(self):
+        if self.rng.random() < 0.3:
+            termo = str(self.rng.randint(90, 99))  # prefixo de documento
+        else:
+            termo = f'{self.rng.choice(NOMES)} {self.rng.choice(SOBRENOMES)}'
+        self.medir('busca_cliente', 'GET', f'/api/clientes?busca={urllib.parse.quote(termo)}')
+
+    def venda(self):
+        if not self.produtos:
+            self.busca_produto()
+            if not self.produtos:
+                return
+        itens = [{'produto_id': p['id'], 'quantidade': self.rng.choice([1, 1, 1, 2, 3]),
+                  'preco_unitario': p['preco_venda']}
+                 for p in self.rng.sample(self.produtos, min(len(self.produtos), self.rng.randint(1, 4)))]
+        total = round(sum(i['quantidade'] * i['preco_unitario'] for i in itens), 2)
+        self.medir('venda', 'POST', '/api/vendas', {'total': total, 'itens': itens})
+
+    def sangria(self):
+        if self.token_admin is None:
+            status, resposta = self.medir('autorizacao', 'POST', '/api/caixa/autorizacao',
+                                          {'senha_admin': self.args.senha_admin})
+            if status != 200:
+                return
+            self.token_admin = resposta['token']
+        status, _ = self.medir('sangria', 'POST', '/api/caixa/sangria', {
+            'valor': round(self.rng.uniform(50, 500), 2),
+            'especificacao': 'benchmark',
+            'token_admin': self.token_admin,
+        })
+        if status == 403:
+            self.token_admin = None  # autorização expirada: pede outra na próxima sangria
+
+    def executar(self, operacoes, pesos, inicio_medicao, fim):
+        self.inicio_medicao = inicio_medicao
+        if not self.entrar():
+            return
+        while time.perf_counter() < fim:
+            getattr(self, self.rng.choices(operacoes, pesos)[0])()
+
+def ler_mix(texto):
+    mix = {}
+    for parte in texto.split(','):
+        nome, _, peso = parte.partition('=')
+        if nome.strip() not in ('busca_produto', 'busca_cliente', 'venda', 'sangria'):
+            raise argparse.ArgumentTypeError(f'operação desconhecida: {nome}')
+        mix[nome.strip()] = float(peso)
+    return mix
+
+def main():
+    parser = argparse.ArgumentParser(description='Carga de vários terminais de caixa')
+    parser.add_argument('--banco', default='benchmark.db', help='base gerada por benchmarks/dados.py')
+    parser.add_argument('--url', help='servidor em execução (ex.: http://localhost:5000); sem ele roda no processo')
+    parser.add_argument('--terminais', type=int, default=8)
+    parser.add_argument('--duracao', type=float, default=30, help='segundos de carga medidos')
+    parser.add_argument('--aquecimento', type=float, default=5, help='segundos de carga antes de começar a medir')
+    parser.add_argument('--mix', type=ler_mix, default=ler_mix(MIX_PADRAO), help=f'pesos das operações ({MIX_PADRAO})')
+    parser.add_argument('--operadores', type=int, default=10, help='logins operador1..N usados pelos terminais')
+    parser.add_argument('--senha', default='operador123')
+    parser.add_argument('--senha-admin', default='java1814')
+    parser.add_argument('--semente', type=int, default=42)
+    parser.add_argument('--salvar', help='grava o resultado em JSON para comparações futuras')
+    parser.add_argument('--comparar', help='resultado JSON anterior; sai com erro se algum p95 piorar')
+    parser.add_argument('--tolerancia', type=float, default=20, help='piora aceitável do p95, em %%')
+    args = parser.parse_args()
+
+    if args.url:
+        novo_cliente = lambda: ClienteHttp(args.url)
+    else:
+        if not os.path.exists(args.banco):
+            parser.error(f'{args.banco} não existe; gere a base com benchmarks/dados.py')
+        os.environ['DATABASE_URL'] = f'sqlite:///{os.path.abspath(args.banco)}'
+        sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        from app import app, criar_usuarios_padrao
+        criar_usuarios_padrao()
+        novo_cliente = lambda: ClienteTeste(app)
+
+    latencias = defaultdict(list)
+    erros = defaultdict(int)
+    operacoes, pesos = list(args.mix), list(args.mix.values())
+    terminais = [Terminal(novo_cliente(), f'operador{n % args.operadores + 1}', args, args.semente + n, latencias, erros)
+                 for n in range(args.terminais)]
+    inicio_medicao = time.perf_counter() + args.aquecimento
+    fim = inicio_medicao + args.duracao
+    threads = [threading.Thread(target=t.executar, args=(operacoes, pesos, inicio_medicao, fim)) for t in terminais]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    duracao = time.perf_counter() - inicio_medicao
+
+    resumo = relatorio.resumir(latencias, erros, duracao)
+    print(f"terminais: {args.terminais}  duração: {args.duracao:.0f}s  destino: {args.url or args.banco}")
+    relatorio.imprimir(resumo, duracao)
+    if args.salvar:
+        relatorio.salvar(resumo, args.salvar, {k: v for k, v in vars(args).items() if k not in ('salvar', 'comparar')})
+    if args.comparar:
+        regressoes = relatorio.comparar(resumo, args.comparar, args.tolerancia)
+        for nome, antes, agora, variacao in regressoes:
+            print(f'✗ {nome}: p95 {antes:.1f}ms → {agora:.1f}ms (+{variacao:.0f}%)')
+        if regressoes:
+            raise SystemExit(1)
+        print(f'✓ nenhum p95 piorou mais de {args.tolerancia:.0f}%')
+
+if __name__ == '__main__':
+    main()
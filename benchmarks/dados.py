@@ -0,0 +1,164 @@
+# Gera uma base sintética com volumes de loja real para os benchmarks: produtos com
+# descrições de armarinho, clientes com CPF/CNPJ únicos e anos de vendas com itens.
+# A geração é determinística (--semente), então duas execuções produzem a mesma base.
+#
+# Uso: python benchmarks/dados.py --banco /tmp/bench.db --produtos 100000 --clientes 500000 --vendas 2000000
+import argparse
+import itertools
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+ITENS = ['Linha', 'Fita', 'Botão', 'Agulha', 'Zíper', 'Elástico', 'Renda', 'Viés', 'Lã', 'Barbante',
+         'Tesoura', 'Alfinete', 'Colchete', 'Ilhós', 'Velcro', 'Entretela', 'Bordado', 'Sianinha',
+         'Cordão', 'Pompom', 'Miçanga', 'Paetê', 'Strass', 'Feltro', 'Tricoline', 'Dedal', 'Fivela']
+MATERIAIS = ['de Algodão', 'de Cetim', 'de Poliéster', 'de Madeira', 'de Metal', 'de Nylon', 'de Seda',
+             'de Gorgurão', 'Acrílica', 'Invisível', 'Destacável', 'Metálica', 'Perolada']
+CORES = ['Branco', 'Preto', 'Azul', 'Vermelho', 'Verde', 'Amarelo', 'Rosa', 'Lilás', 'Bege', 'Marrom',
+         'Cinza', 'Dourado', 'Prata', 'Laranja', 'Vinho', 'Marinho', 'Caqui', 'Creme']
+MEDIDAS = ['1mm', '3mm', '5mm', '10mm', '15mm', '22mm', '38mm', '50m', '100m', '500m', 'nº 10', 'nº 14',
+           '15cm', '20cm', '40cm', '60cm', 'Pct 10un', 'Pct 50un', 'Cartela']
+NOMES = ['Maria', 'José', 'Ana', 'João', 'Francisca', 'Antônio', 'Adriana', 'Carlos', 'Juliana', 'Paulo',
+         'Márcia', 'Pedro', 'Fernanda', 'Lucas', 'Patrícia', 'Luiz', 'Aline', 'Marcos', 'Sandra', 'Rafael',
+         'Camila', 'Daniel', 'Amanda', 'Bruno', 'Jéssica', 'Eduardo', 'Letícia', 'Felipe', 'Raimunda', 'Tiago']
+SOBRENOMES = ['Silva', 'Santos', 'Oliveira', 'Souza', 'Rodrigues', 'Ferreira', 'Alves', 'Pereira', 'Lima',
+              'Gomes', 'Costa', 'Ribeiro', 'Martins', 'Carvalho', 'Almeida', 'Lopes', 'Soares', 'Fernandes',
+              'Vieira', 'Barbosa', 'Rocha', 'Dias', 'Nascimento', 'Andrade', 'Moreira', 'Nunes', 'Marques']
+RAMOS = ['Confecção', 'Ateliê', 'Costura', 'Modas', 'Bordados', 'Uniformes', 'Enxovais', 'Artesanato']
+LOTE = 10000
+
+def gerar_produtos(rng, quantidade):
+    for i in range(quantidade):
+        descricao = f'{rng.choice(ITENS)} {rng.choice(MATERIAIS)} {rng.choice(CORES)} {rng.choice(MEDIDAS)}'
+        custo = round(rng.lognormvariate(1.3, 0.9), 2)
+        yield {
+            'codigo': f'789{i:010d}',
+            'descricao': descricao,
+            'preco_custo': custo,
+            'preco_venda': round(custo * rng.uniform(1.6, 2.4), 2),
+            'estoque': rng.randint(0, 500),
+            'ativo': rng.random() > 0.03,
+            'versao': 0,
+        }
+
+def gerar_clientes(rng, quantidade):
+    for i in range(quantidade):
+        if rng.random() < 0.08:
+            nome = f'{rng.choice(RAMOS)} {rng.choice(SOBRENOMES)} LTDA'
+            tipo, documento = 'cnpj', f'9{i:013d}'
+        else:
+            nome = f'{rng.choice(NOMES)} {rng.choice(SOBRENOMES)} {rng.choice(SOBRENOMES)}'
+            tipo, documento = 'cpf', f'9{i:010d}'
+        yield {
+            'nome': nome,
+            'tipo': tipo,
+            'documento': documento,
+            'telefone': f'849{rng.randint(10000000, 99999999)}',
+            'email': None,
+            'endereco': None,
+        }
+
+def em_lotes(linhas, tamanho=LOTE):
+    lote = []
+    for linha in linhas:
+        lote.append(linha)
+        if len(lote) == tamanho:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+def main():
+    parser = argparse.ArgumentParser(description='Gera uma base sintética para os benchmarks')
+    parser.add_argument('--banco', default='benchmark.db', help='arquivo SQLite a criar')
+    parser.add_argument('--produtos', type=int, default=100000)
+    parser.add_argument('--clientes', type=int, default=500000)
+    parser.add_argument('--vendas', type=int, default=2000000)
+    parser.add_argument('--operadores', type=int, default=10, help='operadores (operador1..N, senha operador123)')
+    parser.add_argument('--dias', type=int, default=730, help='período coberto pelas vendas')
+    parser.add_argument('--semente', type=int, default=42)
+    args = parser.parse_args()
+
+    if os.path.exists(args.banco):
+        parser.error(f'{args.banco} já existe; escolha outro arquivo ou apague-o')
+    os.environ['DATABASE_URL'] = f'sqlite:///{os.path.abspath(args.banco)}'
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from app import (app, db, criar_usuarios_padrao, hash_senha, reconstruir_fechamentos, reconstruir_giro,
+                     Cliente, ItemVenda, Produto, Usuario, Venda)
+
+    rng = random.Random(args.semente)
+    inicio_geral = time.perf_counter()
+    criar_usuarios_padrao()
+
+    with app.app_context():
+        senha_hash = hash_senha('operador123').decode('utf-8')
+        db.session.execute(Usuario.__table__.insert(), [
+            {'nome': f'Operador {n}', 'login': f'operador{n}', 'senha_hash': senha_hash,
+             'perfil': 'operador', 'ativo': True}
+            for n in range(1, args.operadores + 1)
+        ])
+        db.session.commit()
+        operadores = db.session.scalars(db.select(Usuario.id).where(Usuario.perfil == 'operador')).all()
+
+        def inserir(nome, tabela, linhas, total):
+            inicio = time.perf_counter()
+            feitos = 0
+            for lote in em_lotes(linhas):
+                db.session.execute(tabela.insert(), lote)
+                db.session.commit()
+                feitos += len(lote)
+                print(f'\r{nome}: {feitos}/{total}', end='', flush=True)
+            print(f'\r{nome}: {feitos} em {time.perf_counter() - inicio:.1f}s')
+
+        inserir('produtos', Produto.__table__, gerar_produtos(rng, args.produtos), args.produtos)
+        inserir('clientes', Cliente.__table__, gerar_clientes(rng, args.clientes), args.clientes)
+
+        produtos = db.session.execute(db.select(Produto.id, Produto.preco_venda)).all()
+        clientes = db.session.scalars(db.select(Cliente.id)).all()
+        # Poucos produtos concentram boa parte das vendas, como numa loja de verdade
+        pesos = list(itertools.accumulate(1 / (posicao + 1) for posicao in range(len(produtos))))
+        proximo_id = (db.session.scalar(db.select(db.func.max(Venda.id))) or 0) + 1
+        primeira_data = datetime.now() - timedelta(days=args.dias)
+        intervalo = args.dias * 86400 / max(args.vendas, 1)
+
+        inicio = time.perf_counter()
+        gravadas = 0
+        while gravadas < args.vendas:
+            vendas, itens = [], []
+            for _ in range(min(LOTE, args.vendas - gravadas)):
+                venda_id = proximo_id + gravadas
+                quantidade_itens = rng.choices([1, 2, 3, 4, 5, 8], [30, 25, 20, 12, 8, 5])[0]
+                escolhidos = rng.choices(produtos, cum_weights=pesos, k=quantidade_itens)
+                total = 0.0
+                for produto_id, preco in escolhidos:
+                    quantidade = rng.choices([1, 2, 3, 5, 10], [60, 20, 10, 6, 4])[0]
+                    itens.append({'venda_id': venda_id, 'produto_id': produto_id,
+                                  'quantidade': quantidade, 'preco_unitario': preco})
+                    total += quantidade * preco
+                vendas.append({
+                    'id': venda_id,
+                    'data': primeira_data + timedelta(seconds=gravadas * intervalo + rng.uniform(0, intervalo)),
+                    'usuario_id': rng.choice(operadores),
+                    'cliente_id': rng.choice(clientes) if clientes and rng.random() < 0.3 else None,
+                    'total': round(total, 2),
+                    'tipo_cupom': 'nao_fiscal',
+                    'cancelada': rng.random() < 0.01,
+                    'chave_idempotencia': None,
+                })
+                gravadas += 1
+            db.session.execute(Venda.__table__.insert(), vendas)
+            db.session.execute(ItemVenda.__table__.insert(), itens)
+            db.session.commit()
+            print(f'\rvendas: {gravadas}/{args.vendas}', end='', flush=True)
+        print(f'\rvendas: {gravadas} em {time.perf_counter() - inicio:.1f}s')
+
+        reconstruir_fechamentos()
+        reconstruir_giro()
+        db.session.commit()
+
+    print(f'✓ Base gerada em {args.banco} ({time.perf_counter() - inicio_geral:.1f}s)')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+# Compara, para listagens grandes, a leitura antiga (objetos do ORM + to_dict) com a leitura
+# sem ORM (colunas do Core direto para JSON), medindo consulta + serialização de uma
+# resposta com --linhas linhas. Cada repetição usa uma sessão nova, como uma requisição.
+#
+# Uso: python benchmarks/dados.py --banco /tmp/bench.db
+#      python benchmarks/leitura.py --banco /tmp/bench.db --linhas 10000 --repeticoes 30
+import argparse
+import json
+import os
+import sys
+import time
+
+import relatorio
+
+def main():
+    parser = argparse.ArgumentParser(description='Leitura de listagens: ORM x Core')
+    parser.add_argument('--banco', default='benchmark.db', help='base gerada por benchmarks/dados.py')
+    parser.add_argument('--linhas', type=int, default=10000, help='linhas por resposta')
+    parser.add_argument('--repeticoes', type=int, default=30)
+    args = parser.parse_args()
+
+    if not os.path.exists(args.banco):
+        parser.error(f'{args.banco} não existe; gere a base com benchmarks/dados.py')
+    os.environ['DATABASE_URL'] = f'sqlite:///{os.path.abspath(args.banco)}'
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from app import app, db, como_dicts, gerar_lista_json, COLUNAS_CLIENTE, COLUNAS_PRODUTO, Cliente, Produto
+
+    n = args.linhas
+    leituras = {
+        'produtos': (
+            lambda: json.dumps([p.to_dict() for p in
+                                Produto.query.filter_by(ativo=True).order_by(Produto.id).limit(n)]),
+            lambda: ''.join(gerar_lista_json(
+                db.select(*COLUNAS_PRODUTO).where(Produto.ativo == True).order_by(Produto.id).limit(n))),
+        ),
+        'clientes': (
+            lambda: json.dumps([c.to_dict() for c in
+                                Cliente.query.order_by(Cliente.nome, Cliente.id).limit(n)]),
+            lambda: json.dumps(como_dicts(db.session.execute(
+                db.select(*COLUNAS_CLIENTE).order_by(Cliente.nome, Cliente.id).limit(n)).all())),
+        ),
+    }
+
+    print(f"{'listagem':10s} {'leitura':6s} {'linhas':>7s} {'p50 ms':>9s} {'p95 ms':>9s} {'média ms':>9s}")
+    with app.app_context():
+        for nome, (orm, core) in leituras.items():
+            # As duas leituras precisam devolver o mesmo conteúdo
+            if json.loads(orm()) != json.loads(core()):
+                raise SystemExit(f'✗ {nome}: ORM e Core devolveram respostas diferentes')
+            db.session.remove()
+            medianas = {}
+            for rotulo, ler in (('orm', orm), ('core', core)):
+                tempos = []
+                for _ in range(args.repeticoes):
+                    inicio = time.perf_counter()
+                    corpo = ler()
+                    tempos.append((time.perf_counter() - inicio) * 1000)
+                    db.session.remove()
+                linhas = len(json.loads(corpo))
+                medianas[rotulo] = relatorio.percentil(tempos, 50)
+                print(f'{nome:10s} {rotulo:6s} {linhas:7d} {medianas[rotulo]:9.1f} '
+                      f'{relatorio.percentil(tempos, 95):9.1f} {sum(tempos) / len(tempos):9.1f}')
+            print(f"✓ {nome}: Core {medianas['orm'] / medianas['core']:.1f}x mais rápido (p50)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+# Benchmark de login sob carga: vários terminais fazendo login ao mesmo tempo
+# (início de turno) enquanto outros buscam produtos.
+#
+# Uso: python benchmarks/login.py --terminais 16 --logins 10 --concorrencia 4
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+from relatorio import percentil
+
+def main():
+    parser = argparse.ArgumentParser(description='Latência de login sob carga concorrente')
+    parser.add_argument('--terminais', type=int, default=16)
+    parser.add_argument('--logins', type=int, default=10, help='logins por terminal')
+    parser.add_argument('--buscas', type=int, default=4, help='terminais fazendo buscas durante o teste')
+    parser.add_argument('--concorrencia', type=int, default=None, help='BCRYPT_CONCORRENCIA')
+    args = parser.parse_args()
+
+    pasta = tempfile.mkdtemp(prefix='bench-login-')
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(pasta, 'vendas.db')}"
+    if args.concorrencia:
+        os.environ['BCRYPT_CONCORRENCIA'] = str(args.concorrencia)
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from app import app, criar_usuarios_padrao
+
+    criar_usuarios_padrao()
+    latencias = {'login': [], 'busca': []}
+    fim = threading.Event()
+
+    def terminal_login():
+        cliente = app.test_client()
+        for _ in range(args.logins):
+            inicio = time.perf_counter()
+            resposta = cliente.post('/login', json={'login': 'operador', 'senha': 'operador123'})
+            latencias['login'].append(time.perf_counter() - inicio)
+            assert resposta.status_code == 200
+
+    def terminal_busca():
+        cliente = app.test_client()
+        cliente.post('/login', json={'login': 'operador', 'senha': 'operador123'})
+        while not fim.is_set():
+            inicio = time.perf_counter()
+            cliente.get('/api/produtos/buscar?q=fita')
+            latencias['busca'].append(time.perf_counter() - inicio)
+
+    buscas = [threading.Thread(target=terminal_busca) for _ in range(args.buscas)]
+    logins = [threading.Thread(target=terminal_login) for _ in range(args.terminais)]
+    for t in buscas:
+        t.start()
+    inicio = time.perf_counter()
+    for t in logins:
+        t.start()
+    for t in logins:
+        t.join()
+    duracao = time.perf_counter() - inicio
+    fim.set()
+    for t in buscas:
+        t.join()
+
+    print(f"bcrypt concorrente: {app.config['BCRYPT_CONCORRENCIA']}  terminais: {args.terminais}")
+    for nome, valores in latencias.items():
+        if not valores:
+            continue
+        ms = [v * 1000 for v in valores]
+        print(f'{nome:6s} n={len(ms):5d}  p50={percentil(ms, 50):8.1f}ms  p95={percentil(ms, 95):8.1f}ms  '
+              f'p99={percentil(ms, 99):8.1f}ms  média={statistics.mean(ms):8.1f}ms')
+    print(f"logins/s: {len(latencias['login']) / duracao:.1f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+# Funções comuns dos benchmarks: percentis, relatório por endpoint e comparação com uma
+# execução anterior salva em JSON.
+import json
+import statistics
+
+def percentil(valores, p):
+    valores = sorted(valores)
+    if not valores:
+        return 0.0
+    indice = min(len(valores) - 1, int(round(p / 100 * (len(valores) - 1))))
+    return valores[indice]
+
+def resumir(latencias, erros, duracao):
+    # latencias: {endpoint: [segundos]}; erros: {endpoint: quantidade}
+    resumo = {}
+    for nome in sorted(set(latencias) | set(erros)):
+        ms = sorted(v * 1000 for v in latencias.get(nome, []))
+        resumo[nome] = {
+            'n': len(ms),
+            'erros': erros.get(nome, 0),
+            'por_segundo': len(ms) / duracao if duracao else 0.0,
+            'p50': percentil(ms, 50),
+            'p95': percentil(ms, 95),
+            'p99': percentil(ms, 99),
+            'media': statistics.mean(ms) if ms else 0.0,
+        }
+    return resumo
+
+def imprimir(resumo, duracao):
+    print(f"{'endpoint':22s} {'n':>7s} {'erros':>6s} {'req/s':>8s} {'p50 ms':>9s} {'p95 ms':>9s} "
+          f"{'p99 ms':>9s} {'média ms':>9s}")
+    for nome, r in resumo.items():
+        print(f"{nome:22s} {r['n']:7d} {r['erros']:6d} {r['por_segundo']:8.1f} {r['p50']:9.1f} "
+              f"{r['p95']:9.1f} {r['p99']:9.1f} {r['media']:9.1f}")
+    total = sum(r['n'] for r in resumo.values())
+    print(f'total: {total} requisições em {duracao:.1f}s ({total / duracao if duracao else 0:.1f} req/s)')
+
+def salvar(resumo, caminho, parametros):
+    with open(caminho, 'w', encoding='utf-8') as arquivo:
+        json.dump({'parametros': parametros, 'endpoints': resumo}, arquivo, ensure_ascii=False, indent=2)
+
+def comparar(resumo, caminho, tolerancia):
+    # Devolve as regressões: endpoints cujo p95 piorou mais que a tolerância (%)
+    with open(caminho, encoding='utf-8') as arquivo:
+        anterior = json.load(arquivo)['endpoints']
+    regressoes = []
+    for nome, r in resumo.items():
+        base = anterior.get(nome)
+        if not base or not base['p95']:
+            continue
+        variacao = (r['p95'] - base['p95']) / base['p95'] * 100
+        if variacao > tolerancia:
+            regressoes.append((nome, base['p95'], r['p95'], variacao))
+    return regressoes
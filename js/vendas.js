@@ -0,0 +1,644 @@
+let carrinho = [];
+let clienteSelecionado = null;
+let tokenAdmin = null;
+
+function formatarMoeda(valor) {
+    return new Intl.NumberFormat('pt-BR', { style: 'currency', currency: 'BRL' }).format(valor);
+}
+
+// Descrições vêm do cadastro e da importação de CSV: escapar antes de ir para o innerHTML
+function escaparHtml(texto) {
+    return String(texto).replace(/[&<>"']/g, c => ({
+        '&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;'
+    })[c]);
+}
+
+function formatarDocumento(doc, tipo) {
+    if (tipo === 'cpf') {
+        return doc.replace(/(\d{3})(\d{3})(\d{3})(\d{2})/, '$1.$2.$3-$4');
+    } else {
+        return doc.replace(/(\d{2})(\d{3})(\d{3})(\d{4})(\d{2})/, '$1.$2.$3/$4-$5');
+    }
+}
+
+function atualizarCarrinho() {
+    const container = document.getElementById('itens-carrinho');
+    const countEl = document.getElementById('cart-count');
+    const subtotalEl = document.getElementById('subtotal');
+    const totalEl = document.getElementById('total');
+    
+    if (carrinho.length === 0) {
+        container.innerHTML = '<div class="empty-cart">Carrinho vazio. Adicione produtos para iniciar a venda.</div>';
+        countEl.textContent = '0 itens';
+        subtotalEl.textContent = 'R$ 0,00';
+        totalEl.textContent = 'R$ 0,00';
+        return;
+    }
+    
+    let html = '';
+    let subtotal = 0;
+    
+    carrinho.forEach((item, index) => {
+        const totalItem = item.quantidade * item.preco;
+        subtotal += totalItem;
+        
+        html += `
+            <div class="cart-item">
+                <div class="desc">${escaparHtml(item.descricao)}</div>
+                <div class="qty">${item.quantidade}x</div>
+                <div class="price">${formatarMoeda(item.preco)}</div>
+            </div>
+        `;
+    });
+    
+    container.innerHTML = html;
+    countEl.textContent = `${carrinho.length} itens`;
+    subtotalEl.textContent = formatarMoeda(subtotal);
+    totalEl.textContent = formatarMoeda(subtotal);
+}
+
+// Carregar clientes no modal
+async function carregarClientesModal() {
+    try {
+        const response = await fetch('/api/clientes');
+        const clientes = await response.json();
+        
+        const lista = document.getElementById('lista-clientes-modal');
+        if (clientes.length === 0) {
+            lista.innerHTML = '<div style="padding:15px; text-align:center; color:#999">Nenhum cliente cadastrado</div>';
+            return;
+        }
+        
+        let html = '';
+        clientes.forEach(c => {
+            html += `
+                <div class="client-item" onclick="selecionarCliente(${c.id}, '${c.nome.replace(/'/g, "\\'")}', '${c.documento}', '${c.tipo}')">
+                    <div class="name">${c.nome}</div>
+                    <div class="doc">${formatarDocumento(c.documento, c.tipo)}</div>
+                </div>
+            `;
+        });
+        
+        lista.innerHTML = html;
+    } catch (err) {
+        console.error('Erro ao carregar clientes:', err);
+    }
+}
+
+// Selecionar cliente
+window.selecionarCliente = function(id, nome, documento, tipo) {
+    clienteSelecionado = { id, nome, documento, tipo };
+    document.getElementById('cliente-selecionado').innerHTML = `
+        <div class="client-selected">
+            <div class="name">${nome}</div>
+            <div class="doc">${formatarDocumento(documento, tipo)}</div>
+        </div>
+    `;
+    document.getElementById('modal-selecionar-cliente').style.display = 'none';
+};
+
+// Catálogo local: baixado uma vez e depois atualizado só com as alterações
+const CHAVE_CATALOGO = 'catalogoProdutos';
+let catalogo = { versao: null, produtos: {} };
+
+function carregarCatalogoLocal() {
+    try {
+        const salvo = JSON.parse(localStorage.getItem(CHAVE_CATALOGO));
+        if (salvo && salvo.produtos) {
+            catalogo = salvo;
+        }
+    } catch (err) {
+        console.error('Catálogo local inválido:', err);
+    }
+}
+
+function renderizarCatalogo() {
+    if (document.getElementById('busca-produto').value.trim().length >= 2) return;
+    
+    const lista = document.getElementById('lista-produtos');
+    const produtos = Object.values(catalogo.produtos)
+        .sort((a, b) => a.descricao.localeCompare(b.descricao, 'pt-BR'));
+    
+    if (produtos.length === 0) {
+        lista.innerHTML = '<div style="padding:15px; text-align:center; color:#999">Nenhum produto cadastrado</div>';
+        return;
+    }
+    
+    let html = '';
+    produtos.forEach(p => {
+        html += `
+            <div class="product-item" data-id="${p.id}" data-preco="${p.preco_venda}" data-desc="${escaparHtml(p.descricao)}">
+                <div class="name">${escaparHtml(p.descricao)}</div>
+                <div class="price">R$ ${p.preco_venda.toFixed(2)}</div>
+            </div>
+        `;
+    });
+    lista.innerHTML = html;
+}
+
+async function sincronizarCatalogo() {
+    const url = catalogo.versao === null ? '/api/catalogo' : `/api/catalogo?desde=${catalogo.versao}`;
+    const response = await fetch(url);
+    if (response.status === 304 || !response.ok) return;
+    
+    const dados = await response.json();
+    if (dados.completo) {
+        catalogo.produtos = {};
+    }
+    dados.produtos.forEach(p => { catalogo.produtos[p.id] = p; });
+    dados.removidos.forEach(id => { delete catalogo.produtos[id]; });
+    catalogo.versao = dados.versao;
+    
+    localStorage.setItem(CHAVE_CATALOGO, JSON.stringify(catalogo));
+    renderizarCatalogo();
+}
+
+// Alterações de preço e estoque chegam por Server-Sent Events e são aplicadas na
+// lista já desenhada; a sincronização periódica fica só para quando o canal cai
+let fonteEventos = null;
+
+function conectarEventosProdutos() {
+    if (!window.EventSource || fonteEventos || catalogo.versao === null) return;
+    fonteEventos = new EventSource(`/api/produtos/eventos?desde=${catalogo.versao}`);
+    fonteEventos.addEventListener('produtos', (e) => {
+        aplicarAlteracoesProdutos(JSON.parse(e.data), Number(e.lastEventId));
+    });
+    fonteEventos.addEventListener('sincronizar', () => {
+        sincronizarCatalogo().catch(err => console.error(err));
+    });
+}
+
+function aplicarAlteracoesProdutos(alteracoes, versao) {
+    let produtoNovo = false;
+    alteracoes.forEach(a => {
+        const elemento = document.querySelector(`#lista-produtos .product-item[data-id="${a.id}"]`);
+        if (!a.ativo) {
+            delete catalogo.produtos[a.id];
+            if (elemento) elemento.remove();
+            return;
+        }
+        const produto = catalogo.produtos[a.id];
+        if (!produto) {
+            produtoNovo = true;  // a descrição não vem no evento
+            return;
+        }
+        produto.preco_venda = a.preco;
+        produto.estoque = a.estoque;
+        if (elemento) {
+            elemento.dataset.preco = a.preco;
+            elemento.querySelector('.price').textContent = `R$ ${a.preco.toFixed(2)}`;
+        }
+    });
+    
+    if (produtoNovo) {
+        // Mantém a versão anterior para que a diferença traga o produto completo
+        sincronizarCatalogo().catch(err => console.error(err));
+        return;
+    }
+    if (versao > catalogo.versao) {
+        catalogo.versao = versao;
+    }
+    localStorage.setItem(CHAVE_CATALOGO, JSON.stringify(catalogo));
+}
+
+setInterval(() => {
+    if (fonteEventos && fonteEventos.readyState === EventSource.OPEN) return;
+    sincronizarCatalogo().catch(err => console.error(err));
+}, 30000);
+
+// Busca de produtos
+document.getElementById('busca-produto').addEventListener('input', async (e) => {
+    const termo = e.target.value.trim();
+    const lista = document.getElementById('lista-produtos');
+    
+    if (termo.length < 2) {
+        renderizarCatalogo();
+        return;
+    }
+    
+    try {
+        const response = await fetch(`/api/produtos/buscar?q=${encodeURIComponent(termo)}`);
+        const resultados = await response.json();
+        
+        if (resultados.length === 0) {
+            lista.innerHTML = '<div style="padding:15px; text-align:center; color:#999">Nenhum produto encontrado</div>';
+            return;
+        }
+        
+        let html = '';
+        resultados.forEach(p => {
+            html += `
+                <div class="product-item" data-id="${p.id}" data-preco="${p.preco_venda}" data-desc="${escaparHtml(p.descricao)}">
+                    <div class="name">${escaparHtml(p.descricao)}</div>
+                    <div class="price">R$ ${p.preco_venda.toFixed(2).replace('.', ',')}</div>
+                </div>
+            `;
+        });
+        
+        lista.innerHTML = html;
+    } catch (err) {
+        console.error('Erro na busca:', err);
+    }
+});
+
+// Adicionar produto ao carrinho ao clicar
+document.getElementById('lista-produtos').addEventListener('click', (e) => {
+    const item = e.target.closest('.product-item');
+    if (!item) return;
+    
+    adicionarAoCarrinho(
+        parseInt(item.getAttribute('data-id')),
+        item.getAttribute('data-desc'),
+        parseFloat(item.getAttribute('data-preco'))
+    );
+});
+
+function adicionarAoCarrinho(produtoId, descricao, preco) {
+    // Verificar se já existe no carrinho
+    const existente = carrinho.find(i => i.produto_id === produtoId);
+    if (existente) {
+        existente.quantidade += 1;
+    } else {
+        carrinho.push({
+            produto_id: produtoId,
+            descricao: descricao,
+            quantidade: 1,
+            preco: preco
+        });
+    }
+    
+    atualizarCarrinho();
+    document.getElementById('busca-produto').value = '';
+    document.getElementById('busca-produto').focus();
+}
+
+// Leitor de código de barras: o código chega seguido de Enter
+document.getElementById('busca-produto').addEventListener('keydown', async (e) => {
+    if (e.key !== 'Enter') return;
+    e.preventDefault();
+    
+    const codigo = e.target.value.trim();
+    if (!codigo) return;
+    
+    try {
+        const response = await fetch(`/api/produtos/codigo/${encodeURIComponent(codigo)}`);
+        if (response.status === 404) {
+            alert(`⚠️ Produto com código ${codigo} não encontrado`);
+            e.target.select();
+            return;
+        }
+        
+        const p = await response.json();
+        adicionarAoCarrinho(p.id, p.descricao, p.preco_venda);
+    } catch (err) {
+        console.error('Erro na leitura do código:', err);
+    }
+});
+
+// Finalizar venda
+document.getElementById('btn-finalizar').addEventListener('click', async () => {
+    if (carrinho.length === 0) {
+        alert('⚠️ Adicione produtos ao carrinho antes de finalizar!');
+        return;
+    }
+    
+    const total = carrinho.reduce((sum, item) => sum + (item.quantidade * item.preco), 0);
+    let msg = `✅ Confirmar venda no valor de ${formatarMoeda(total)}?`;
+    if (clienteSelecionado) {
+        msg = `✅ Confirmar venda para ${clienteSelecionado.nome} no valor de ${formatarMoeda(total)}?`;
+    }
+    
+    if (!confirm(msg)) {
+        return;
+    }
+    
+    const venda = {
+        chave_idempotencia: gerarChaveIdempotencia(),
+        data: new Date().toISOString(),
+        itens: carrinho.map(item => ({
+            produto_id: item.produto_id,
+            quantidade: item.quantidade,
+            preco_unitario: item.preco
+        })),
+        total: total,
+        tipo_cupom: 'nao_fiscal',
+        cliente_id: clienteSelecionado ? clienteSelecionado.id : null
+    };
+    
+    // A venda entra na fila local antes de qualquer envio: se a rede cair, nada se perde
+    salvarVendasPendentes([...lerVendasPendentes(), venda]);
+    const nomeCliente = clienteSelecionado ? clienteSelecionado.nome : null;
+    
+    // O carrinho só é limpo com a venda gravada (ou guardada offline); se o servidor
+    // a recusar, o operador ainda pode ajustá-lo
+    const limparVenda = () => {
+        carrinho = [];
+        clienteSelecionado = null;
+        document.getElementById('cliente-selecionado').innerHTML = '<div style="color: #7f8c8d; font-style: italic;">Nenhum cliente selecionado</div>';
+        atualizarCarrinho();
+    };
+    
+    try {
+        let resultados = await enviarVendasPendentes();
+        if (!(venda.chave_idempotencia in resultados)) {
+            // Havia um envio em andamento que leu a fila antes desta venda entrar
+            resultados = await enviarVendasPendentes();
+        }
+        const result = resultados[venda.chave_idempotencia];
+        
+        if (result && result.success) {
+            limparVenda();
+            let msgSucesso = `✅ Venda ${result.venda_id} registrada com sucesso!\nTotal: ${formatarMoeda(result.total)}`;
+            if (nomeCliente) {
+                msgSucesso += `\nCliente: ${nomeCliente}`;
+            }
+            alert(msgSucesso);
+        } else if (result) {
+            // Recusada (estoque insuficiente, dados inválidos): já saiu da fila
+            alert('❌ Venda não registrada: ' + (result.error || 'Desconhecido'));
+        }
+    } catch (err) {
+        if (envioRecusado(err.status)) {
+            // O servidor recusou o envio: a venda não foi gravada e não deve ser
+            // reenviada sozinha, muito menos como offline
+            salvarVendasPendentes(lerVendasPendentes().filter(v =>
+                v.chave_idempotencia !== venda.chave_idempotencia));
+            alert(`❌ Venda não registrada (HTTP ${err.status}): ${err.message}`);
+        } else {
+            // Falha de rede ou erro sem resposta definitiva (5xx de um proxy pode chegar depois
+            // de o servidor gravar): a venda fica na fila e é reenviada com a mesma chave, que
+            // impede a duplicata. A mercadoria sai sem confirmação do servidor, então no
+            // reenvio a venda é gravada mesmo que o estoque do sistema não a cubra
+            salvarVendasPendentes(lerVendasPendentes().map(v =>
+                v.chave_idempotencia === venda.chave_idempotencia ? { ...v, offline: true } : v));
+            limparVenda();
+            alert(err.status
+                ? `⚠️ O servidor não confirmou a venda (HTTP ${err.status}). Ela foi guardada neste terminal e será reenviada automaticamente.`
+                : '⚠️ Sem conexão com o servidor. A venda foi guardada neste terminal e será enviada automaticamente.');
+        }
+        console.error(err);
+    }
+});
+
+// Fila local de vendas pendentes, enviada em lotes com chave de idempotência
+const CHAVE_VENDAS_PENDENTES = 'vendasPendentes';
+const TAMANHO_LOTE_VENDAS = 50;
+let envioEmAndamento = null;
+
+function lerVendasPendentes() {
+    try {
+        return JSON.parse(localStorage.getItem(CHAVE_VENDAS_PENDENTES)) || [];
+    } catch (err) {
+        return [];
+    }
+}
+
+function salvarVendasPendentes(vendas) {
+    localStorage.setItem(CHAVE_VENDAS_PENDENTES, JSON.stringify(vendas));
+}
+
+// Só um 4xx diz que o servidor não gravou a venda. Sessão expirada (401/403), lote igual
+// ainda em gravação (409), timeout (408) e excesso de requisições (429) valem um reenvio
+const STATUS_REENVIAVEIS = [401, 403, 408, 409, 429];
+
+function envioRecusado(status) {
+    return status >= 400 && status < 500 && !STATUS_REENVIAVEIS.includes(status);
+}
+
+function gerarChaveIdempotencia() {
+    if (window.crypto && crypto.randomUUID) {
+        return crypto.randomUUID();
+    }
+    return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+}
+
+async function enviarVendasPendentes() {
+    // Um único envio por vez; chamadas simultâneas aguardam o mesmo envio
+    if (envioEmAndamento) {
+        return envioEmAndamento;
+    }
+    
+    envioEmAndamento = (async () => {
+        const resultados = {};
+        let pendentes = lerVendasPendentes();
+        
+        while (pendentes.length > 0) {
+            const lote = pendentes.slice(0, TAMANHO_LOTE_VENDAS);
+            const response = await fetch('/api/vendas/lote', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ vendas: lote })
+            });
+            if (!response.ok) {
+                // O servidor respondeu: o erro leva o status, o que o distingue de falha de rede
+                const corpo = await response.json().catch(() => ({}));
+                const erro = new Error(corpo.error || `Falha ao enviar vendas (HTTP ${response.status})`);
+                erro.status = response.status;
+                throw erro;
+            }
+            
+            const result = await response.json();
+            result.resultados.forEach((r, i) => {
+                resultados[lote[i].chave_idempotencia] = r;
+                if (!r.success) {
+                    console.error('Venda recusada pelo servidor:', lote[i], r.error);
+                }
+            });
+            
+            const enviadas = new Set(lote.map(v => v.chave_idempotencia));
+            pendentes = lerVendasPendentes().filter(v => !enviadas.has(v.chave_idempotencia));
+            salvarVendasPendentes(pendentes);
+        }
+        
+        return resultados;
+    })();
+    
+    try {
+        return await envioEmAndamento;
+    } finally {
+        envioEmAndamento = null;
+    }
+}
+
+setInterval(() => enviarVendasPendentes().catch(err => console.error(err)), 15000);
+window.addEventListener('online', () => enviarVendasPendentes().catch(err => console.error(err)));
+
+// Modal Selecionar Cliente
+document.getElementById('btn-selecionar-cliente').addEventListener('click', () => {
+    document.getElementById('modal-selecionar-cliente').style.display = 'flex';
+    carregarClientesModal();
+    document.getElementById('busca-cliente-modal').focus();
+});
+
+document.getElementById('btn-fechar-cliente').addEventListener('click', () => {
+    document.getElementById('modal-selecionar-cliente').style.display = 'none';
+});
+
+document.getElementById('btn-remover-cliente').addEventListener('click', () => {
+    clienteSelecionado = null;
+    document.getElementById('cliente-selecionado').innerHTML = '<div style="color: #7f8c8d; font-style: italic;">Nenhum cliente selecionado</div>';
+    document.getElementById('modal-selecionar-cliente').style.display = 'none';
+});
+
+// Busca de clientes no modal
+document.getElementById('busca-cliente-modal').addEventListener('input', async (e) => {
+    const termo = e.target.value.trim();
+    
+    try {
+        const response = await fetch(`/api/clientes?busca=${encodeURIComponent(termo)}`);
+        const clientes = await response.json();
+        
+        const lista = document.getElementById('lista-clientes-modal');
+        if (clientes.length === 0) {
+            lista.innerHTML = '<div style="padding:15px; text-align:center; color:#999">Nenhum cliente encontrado</div>';
+            return;
+        }
+        
+        let html = '';
+        clientes.forEach(c => {
+            html += `
+                <div class="client-item" onclick="selecionarCliente(${c.id}, '${c.nome.replace(/'/g, "\\'")}', '${c.documento}', '${c.tipo}')">
+                    <div class="name">${c.nome}</div>
+                    <div class="doc">${formatarDocumento(c.documento, c.tipo)}</div>
+                </div>
+            `;
+        });
+        
+        lista.innerHTML = html;
+    } catch (err) {
+        console.error('Erro ao buscar clientes:', err);
+    }
+});
+
+// Sangria
+document.getElementById('btn-sangria').addEventListener('click', () => {
+    document.getElementById('modal-sangria').style.display = 'flex';
+    document.getElementById('valor-sangria').focus();
+});
+
+document.getElementById('btn-cancelar-sangria').addEventListener('click', () => {
+    document.getElementById('modal-sangria').style.display = 'none';
+});
+
+document.getElementById('btn-confirmar-sangria').addEventListener('click', async () => {
+    const valor = parseFloat(document.getElementById('valor-sangria').value);
+    const especificacao = document.getElementById('especificacao-sangria').value;
+    const senha = document.getElementById('senha-admin-sangria').value;
+    
+    if (!valor || valor <= 0) {
+        alert('⚠️ Informe um valor válido para a sangria!');
+        return;
+    }
+    
+    if (!senha && !tokenAdmin) {
+        alert('⚠️ Informe a senha de administrador!');
+        return;
+    }
+    
+    try {
+        // A senha é verificada uma vez e troca-se por uma autorização de curta duração
+        if (senha) {
+            const autorizacao = await fetch('/api/caixa/autorizacao', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ senha_admin: senha })
+            });
+            const resultAutorizacao = await autorizacao.json();
+            if (!resultAutorizacao.success) {
+                alert('❌ ' + (resultAutorizacao.error || 'Senha de administrador inválida'));
+                return;
+            }
+            tokenAdmin = resultAutorizacao.token;
+        }
+        
+        const response = await fetch('/api/caixa/sangria', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ valor, especificacao, token_admin: tokenAdmin })
+        });
+        
+        const result = await response.json();
+        
+        if (response.status === 403) {
+            tokenAdmin = null;
+        }
+        
+        if (result.success) {
+            alert(`✅ Sangria de ${formatarMoeda(valor)} registrada com sucesso!`);
+            document.getElementById('modal-sangria').style.display = 'none';
+            document.getElementById('valor-sangria').value = '';
+            document.getElementById('especificacao-sangria').value = '';
+            document.getElementById('senha-admin-sangria').value = '';
+        } else {
+            alert('❌ ' + (result.error || 'Senha de administrador inválida'));
+        }
+    } catch (err) {
+        alert('❌ Erro de conexão com o servidor');
+        console.error(err);
+    }
+});
+
+// Cancelar venda
+document.getElementById('btn-cancelar').addEventListener('click', () => {
+    if (carrinho.length === 0) {
+        alert('ℹ️ Carrinho já está vazio');
+        return;
+    }
+    
+    if (confirm('⚠️ Deseja cancelar esta venda? Todos os itens serão removidos.')) {
+        carrinho = [];
+        clienteSelecionado = null;
+        document.getElementById('cliente-selecionado').innerHTML = '<div style="color: #7f8c8d; font-style: italic;">Nenhum cliente selecionado</div>';
+        atualizarCarrinho();
+        alert('✅ Venda cancelada com sucesso!');
+    }
+});
+
+// Atalhos de teclado
+document.addEventListener('keydown', (e) => {
+    if (e.key === 'F2' || e.key === 'f2') {
+        e.preventDefault();
+        document.getElementById('busca-produto').focus();
+        document.getElementById('busca-produto').select();
+    }
+    
+    if (e.key === 'F3' || e.key === 'f3') {
+        e.preventDefault();
+        document.getElementById('btn-finalizar').click();
+    }
+    
+    if (e.key === 'F4' || e.key === 'f4') {
+        e.preventDefault();
+        document.getElementById('btn-sangria').click();
+    }
+    
+    if (e.key === 'Escape') {
+        e.preventDefault();
+        if (carrinho.length > 0 && confirm('Deseja limpar o carrinho?')) {
+            carrinho = [];
+            clienteSelecionado = null;
+            document.getElementById('cliente-selecionado').innerHTML = '<div style="color: #7f8c8d; font-style: italic;">Nenhum cliente selecionado</div>';
+            atualizarCarrinho();
+        }
+        document.getElementById('busca-produto').focus();
+    }
+});
+
+// Fechar modais ao clicar fora
+window.addEventListener('click', (e) => {
+    const modalCliente = document.getElementById('modal-selecionar-cliente');
+    const modalSangria = document.getElementById('modal-sangria');
+    if (e.target === modalCliente) modalCliente.style.display = 'none';
+    if (e.target === modalSangria) modalSangria.style.display = 'none';
+});
+
+// Inicialização
+window.onload = () => {
+    document.getElementById('busca-produto').focus();
+    carregarCatalogoLocal();
+    renderizarCatalogo();
+    sincronizarCatalogo()
+        .catch(err => console.error(err))
+        .finally(conectarEventosProdutos);
+    enviarVendasPendentes().catch(err => console.error(err));
+};
@@ -0,0 +1,54 @@
+# Os testes rodam sobre um banco SQLite temporário, criado antes de importar a aplicação
+# (DATABASE_URL é lido na importação).
+import itertools
+import os
+import sys
+import tempfile
+
+import pytest
+
+PASTA_TESTES = tempfile.mkdtemp(prefix='armarinho-testes-')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(PASTA_TESTES, 'vendas.db')}"
+os.environ['RELATORIOS_INTERVALO'] = '0'
+os.environ['CUPOM_TRABALHADORES'] = '0'  # os cupons só são enfileirados
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app as aplicacao, criar_usuarios_padrao, db, Produto
+
+_codigos = itertools.count(1)
+
+@pytest.fixture(scope='session')
+def app():
+    criar_usuarios_padrao()
+    return aplicacao
+
+@pytest.fixture
+def contexto(app):
+    with app.app_context():
+        yield
+        db.session.remove()
+
+@pytest.fixture
+def criar_produto(contexto):
+    # Cada teste cria os próprios produtos, com código único
+    def criar(estoque=10, preco_venda=5.0):
+        produto = Produto(codigo=f'T{next(_codigos):06d}', descricao='Produto de teste',
+                          preco_venda=preco_venda, estoque=estoque)
+        db.session.add(produto)
+        db.session.commit()
+        return produto.id
+    return criar
+
+@pytest.fixture
+def operador(app):
+    cliente = app.test_client()
+    resposta = cliente.post('/login', json={'login': 'operador', 'senha': 'operador123'})
+    assert resposta.status_code == 200
+    return cliente
+
+@pytest.fixture
+def administrador(app):
+    cliente = app.test_client()
+    resposta = cliente.post('/login', json={'login': 'admin', 'senha': 'java1814'})
+    assert resposta.status_code == 200
+    return cliente
@@ -0,0 +1,32 @@
+import os
+from datetime import datetime, timedelta
+
+from app import db, arquivar_meses, caminho_arquivo, gerar_exportacao_vendas, ItemVenda, Venda
+
+def _exportar():
+    return ''.join(gerar_exportacao_vendas('csv'))
+
+def test_arquivar_meses_fechados_preserva_a_exportacao(contexto, criar_produto):
+    produto_id = criar_produto()
+    antigo = datetime.now().replace(day=1, hour=10, minute=0, second=0, microsecond=0) - timedelta(days=70)
+    mes = antigo.replace(day=1, hour=0)
+    for i, data in enumerate([antigo, antigo + timedelta(days=1), antigo + timedelta(hours=2), datetime.now()]):
+        venda = Venda(data=data, usuario_id=2, total=5.0 * (i + 1))
+        db.session.add(venda)
+        db.session.flush()
+        db.session.add(ItemVenda(venda_id=venda.id, produto_id=produto_id, quantidade=i + 1, preco_unitario=5.0))
+    db.session.commit()
+    antes = _exportar()
+    
+    arquivados = {m: vendas for m, vendas, _ in arquivar_meses(manter_meses=2)}
+    db.session.remove()
+    
+    assert arquivados[mes] >= 3
+    assert os.path.exists(caminho_arquivo(mes))
+    restantes = db.session.scalar(db.select(db.func.count()).select_from(Venda).where(
+        Venda.data >= mes, Venda.data < mes + timedelta(days=31)))
+    assert restantes == 0
+    assert _exportar() == antes
+    # Rodar de novo não arquiva nem duplica nada
+    assert all(vendas == 0 for _, vendas, _ in arquivar_meses(manter_meses=2))
+    assert _exportar() == antes
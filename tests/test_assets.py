@@ -0,0 +1,18 @@
+import re
+
+def test_tela_de_vendas_carrega_o_script_por_url_versionada(operador):
+    pagina = operador.get('/vendas').get_data(as_text=True)
+    [url] = re.findall(r'<script src="(/assets/js/vendas\.[0-9a-f]{12}\.js)"', pagina)
+    
+    resposta = operador.get(url, headers={'Accept-Encoding': 'gzip'})
+    assert resposta.status_code == 200
+    assert resposta.headers['Cache-Control'] == 'public, max-age=31536000, immutable'
+    assert resposta.headers['Content-Encoding'] == 'gzip'
+    
+    etag = resposta.headers['ETag']
+    assert operador.get(url, headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag}).status_code == 304
+
+def test_asset_sem_hash_e_revalidado(operador):
+    resposta = operador.get('/assets/js/vendas.js')
+    assert resposta.status_code == 200
+    assert resposta.headers['Cache-Control'] == 'public, no-cache'
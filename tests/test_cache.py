@@ -0,0 +1,49 @@
+from datetime import date, datetime, timedelta
+
+from app import db, base_relatorios, cache_consultas, FechamentoCaixa
+
+def test_fechamento_de_dia_anterior_fica_em_cache_ate_atualizar_a_base(administrador, contexto):
+    ontem = date.today() - timedelta(days=1)
+    url = f'/api/caixa/fechamento?data={ontem.isoformat()}&usuario_id=1'
+    administrador.post('/api/relatorios/base')
+    assert administrador.get(url).get_json()['operadores'] == []
+    
+    db.session.add(FechamentoCaixa(data=ontem, usuario_id=1, vendas_quantidade=1, vendas_total=10.0))
+    db.session.commit()
+    acertos = cache_consultas.estatisticas()['acerto']
+    assert administrador.get(url).get_json()['operadores'] == []
+    assert cache_consultas.estatisticas()['acerto'] == acertos + 1
+    
+    assert administrador.post('/api/relatorios/base').status_code == 200
+    [operador] = administrador.get(url).get_json()['operadores']
+    assert operador['vendas_total'] == 10.0
+
+def test_busca_de_produtos_nao_usa_o_cache(operador, criar_produto):
+    criar_produto()
+    antes = cache_consultas.estatisticas()
+    assert operador.get('/api/produtos/buscar?q=teste').get_json()
+    assert operador.get('/api/produtos/buscar?q=teste').get_json()
+    depois = cache_consultas.estatisticas()
+    assert (depois['acerto'], depois['falha']) == (antes['acerto'], antes['falha'])
+
+def test_fechamento_vem_do_banco_se_a_copia_e_anterior_ao_fim_do_dia(administrador, contexto, monkeypatch):
+    dia = date.today() - timedelta(days=3)
+    url = f'/api/caixa/fechamento?data={dia.isoformat()}&usuario_id=1'
+    administrador.post('/api/relatorios/base')
+    db.session.add(FechamentoCaixa(data=dia, usuario_id=1, vendas_quantidade=1, vendas_total=7.0))
+    db.session.commit()
+    
+    # Cópia feita um minuto antes da meia-noite: não tem as últimas vendas do dia
+    fim_do_dia = datetime.combine(dia + timedelta(days=1), datetime.min.time()).timestamp()
+    monkeypatch.setattr(base_relatorios, 'gerada_em', fim_do_dia - 60)
+    antes = cache_consultas.estatisticas()
+    [operador] = administrador.get(url).get_json()['operadores']
+    assert operador['vendas_total'] == 7.0
+    depois = cache_consultas.estatisticas()
+    assert (depois['acerto'], depois['falha']) == (antes['acerto'], antes['falha'])
+
+def test_consultas_ao_cache_sao_exportadas_como_contador(app):
+    metricas = app.test_client().get('/metrics').get_data(as_text=True).splitlines()
+    assert '# TYPE armarinho_cache_consultas_total counter' in metricas
+    acertos = cache_consultas.estatisticas()['acerto']
+    assert f'armarinho_cache_consultas_total{{resultado="acerto"}} {acertos}' in metricas
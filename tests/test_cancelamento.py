@@ -0,0 +1,43 @@
+import threading
+import uuid
+from datetime import date
+
+from app import db, FechamentoCaixa, Produto, Usuario
+
+def _canceladas_hoje():
+    db.session.expire_all()
+    operador_id = Usuario.query.filter_by(login='operador').one().id
+    fechamento = db.session.get(FechamentoCaixa, (date.today(), operador_id))
+    return fechamento.canceladas_quantidade if fechamento else 0
+
+def test_cancelamentos_simultaneos_devolvem_o_estoque_uma_vez(operador, criar_produto):
+    produto_id = criar_produto(estoque=120)
+    venda = operador.post('/api/vendas', json={
+        'total': 5.0, 'chave_idempotencia': str(uuid.uuid4()),
+        'itens': [{'produto_id': produto_id, 'quantidade': 1, 'preco_unitario': 5.0}]
+    }).get_json()
+    canceladas_antes = _canceladas_hoje()
+    
+    # Autorização emitida antes: sem bcrypt no cancelamento, as requisições chegam juntas
+    token = operador.post('/api/caixa/autorizacao', json={'senha_admin': 'java1814'}).get_json()['token']
+    barreira = threading.Barrier(8)
+    status = []
+    
+    def cancelar():
+        barreira.wait()
+        status.append(operador.post(f"/api/vendas/{venda['venda_id']}/cancelar",
+                                    json={'token_admin': token}).status_code)
+    
+    threads = [threading.Thread(target=cancelar) for _ in range(barreira.parties)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    assert sorted(status) == [200] + [400] * (barreira.parties - 1)
+    assert db.session.get(Produto, produto_id).estoque == 120
+    assert _canceladas_hoje() == canceladas_antes + 1
+
+def test_cancelar_venda_inexistente(operador, contexto):
+    resposta = operador.post('/api/vendas/999999/cancelar', json={'senha_admin': 'java1814'})
+    assert resposta.status_code == 404
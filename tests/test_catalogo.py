@@ -0,0 +1,70 @@
+import uuid
+
+from app import db, baixar_estoque, executar_escrita, transmissor_produtos, versao_atual_catalogo, Produto
+
+def _venda(produto_id, quantidade, preco=5.0, **extra):
+    return dict({'total': quantidade * preco,
+                 'itens': [{'produto_id': produto_id, 'quantidade': quantidade, 'preco_unitario': preco}]}, **extra)
+
+def _versao():
+    db.session.expire_all()
+    return versao_atual_catalogo()
+
+def _eventos_desde(versao):
+    eventos, lacuna = transmissor_produtos.aguardar(versao, 0)
+    assert not lacuna
+    return eventos
+
+def test_venda_recusada_nao_gasta_versao(operador, criar_produto):
+    produto_id = criar_produto(estoque=1)
+    versao = _versao()
+    
+    resposta = operador.post('/api/vendas', json=_venda(produto_id, 2))
+    assert resposta.status_code == 409
+    assert _versao() == versao
+    assert _eventos_desde(versao) == []
+    
+    resposta = operador.post('/api/vendas', json=_venda(produto_id, 1))
+    assert resposta.status_code == 200
+    assert _versao() == versao + 1
+    [(versao_evento, dados)] = _eventos_desde(versao)
+    assert versao_evento == versao + 1
+    assert f'"id":{produto_id}' in dados and '"estoque":0' in dados
+
+def test_lote_com_venda_recusada_publica_uma_versao(operador, criar_produto):
+    com_estoque, sem_estoque = criar_produto(estoque=5), criar_produto(estoque=0)
+    versao = _versao()
+    
+    resposta = operador.post('/api/vendas/lote', json={'vendas': [
+        _venda(com_estoque, 2, chave_idempotencia=str(uuid.uuid4())),
+        _venda(sem_estoque, 1, chave_idempotencia=str(uuid.uuid4())),
+    ]})
+    assert [r['success'] for r in resposta.get_json()['resultados']] == [True, False]
+    assert _versao() == versao + 1
+    [(versao_evento, dados)] = _eventos_desde(versao)
+    assert versao_evento == versao + 1
+    assert f'"id":{com_estoque}' in dados and f'"id":{sem_estoque}' not in dados
+
+def test_versao_sem_produto_alterado_vira_evento_vazio(contexto):
+    versao = _versao()
+    executar_escrita(baixar_estoque, {10 ** 9: 1})  # produto inexistente: nenhuma linha muda
+    assert _versao() == versao + 1
+    assert _eventos_desde(versao) == [(versao + 1, '[]')]
+
+def test_catalogo_por_diferenca_e_etag(operador, criar_produto):
+    alterado, removido = criar_produto(), criar_produto()
+    versao = operador.get('/api/catalogo').get_json()['versao']
+    
+    produto = db.session.get(Produto, alterado)
+    produto.preco_venda = 7.5
+    db.session.get(Produto, removido).ativo = False
+    db.session.commit()
+    
+    resposta = operador.get(f'/api/catalogo?desde={versao}')
+    diferenca = resposta.get_json()
+    assert not diferenca['completo'] and diferenca['versao'] == versao + 1
+    assert [(p['id'], p['preco_venda']) for p in diferenca['produtos']] == [(alterado, 7.5)]
+    assert diferenca['removidos'] == [removido]
+    assert operador.get('/api/catalogo', headers={'If-None-Match': resposta.headers['ETag']}).status_code == 304
+    # Versão desconhecida (banco recriado): o catálogo vem completo
+    assert operador.get(f'/api/catalogo?desde={versao + 1000}').get_json()['completo']
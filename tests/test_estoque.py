@@ -0,0 +1,87 @@
+import threading
+import uuid
+
+from app import db, DivergenciaEstoque, Produto
+
+def _venda(produto_id, quantidade, offline=False, preco=5.0):
+    return {'total': quantidade * preco, 'chave_idempotencia': str(uuid.uuid4()), 'offline': offline,
+            'itens': [{'produto_id': produto_id, 'quantidade': quantidade, 'preco_unitario': preco}]}
+
+def _estoque(produto_id):
+    db.session.expire_all()
+    return db.session.get(Produto, produto_id).estoque
+
+def _divergencias(produto_id):
+    return db.session.execute(
+        db.select(DivergenciaEstoque.venda_id, DivergenciaEstoque.quantidade)
+        .where(DivergenciaEstoque.produto_id == produto_id).order_by(DivergenciaEstoque.venda_id)
+    ).all()
+
+def test_venda_offline_para_o_estoque_em_zero_e_registra_a_falta(operador, criar_produto):
+    produto_id = criar_produto(estoque=1)
+    
+    resposta = operador.post('/api/vendas/lote', json={'vendas': [
+        _venda(produto_id, 2, offline=True), _venda(produto_id, 1, offline=True)
+    ]})
+    primeira, segunda = resposta.get_json()['resultados']
+    assert primeira['success'] and segunda['success']
+    assert _estoque(produto_id) == 0
+    # Faltaram 2 unidades: a venda mais recente fica com a sua, a anterior com o resto
+    assert _divergencias(produto_id) == [(primeira['venda_id'], 1), (segunda['venda_id'], 1)]
+
+def test_venda_offline_coberta_pelo_estoque_nao_gera_divergencia(operador, criar_produto):
+    produto_id = criar_produto(estoque=5)
+    
+    resposta = operador.post('/api/vendas/lote', json={'vendas': [_venda(produto_id, 3, offline=True)]})
+    assert resposta.get_json()['resultados'][0]['success']
+    assert _estoque(produto_id) == 2
+    assert _divergencias(produto_id) == []
+
+def test_divergencia_resolvida_sai_da_lista_de_pendentes(operador, administrador, criar_produto):
+    produto_id = criar_produto(estoque=0)
+    operador.post('/api/vendas/lote', json={'vendas': [_venda(produto_id, 1, offline=True)]})
+    
+    pendentes = administrador.get('/api/estoque/divergencias').get_json()
+    [divergencia] = [d for d in pendentes if d['produto_id'] == produto_id]
+    assert operador.post(f"/api/estoque/divergencias/{divergencia['id']}/resolver").status_code == 403
+    assert administrador.post(f"/api/estoque/divergencias/{divergencia['id']}/resolver").status_code == 200
+    
+    pendentes = administrador.get('/api/estoque/divergencias').get_json()
+    assert divergencia['id'] not in [d['id'] for d in pendentes]
+    todas = administrador.get('/api/estoque/divergencias?todas=1').get_json()
+    assert [d['resolvida'] for d in todas if d['id'] == divergencia['id']] == [True]
+
+def test_venda_sem_estoque_e_recusada_sem_baixar_nada(operador, criar_produto):
+    com_estoque, sem_estoque = criar_produto(estoque=5), criar_produto(estoque=1)
+    
+    resposta = operador.post('/api/vendas', json={'total': 15.0, 'itens': [
+        {'produto_id': com_estoque, 'quantidade': 1, 'preco_unitario': 5.0},
+        {'produto_id': sem_estoque, 'quantidade': 2, 'preco_unitario': 5.0},
+    ]})
+    assert resposta.status_code == 409
+    assert [p['id'] for p in resposta.get_json()['produtos']] == [sem_estoque]
+    # A baixa do produto que tinha estoque é desfeita junto com a venda
+    assert (_estoque(com_estoque), _estoque(sem_estoque)) == (5, 1)
+
+def test_dois_terminais_disputando_a_ultima_unidade(app, criar_produto):
+    produto_id = criar_produto(estoque=1)
+    terminais = []
+    for _ in range(2):
+        cliente = app.test_client()
+        cliente.post('/login', json={'login': 'operador', 'senha': 'operador123'})
+        terminais.append(cliente)
+    barreira = threading.Barrier(len(terminais))
+    status = []
+    
+    def vender(cliente):
+        barreira.wait()
+        status.append(cliente.post('/api/vendas', json=_venda(produto_id, 1)).status_code)
+    
+    threads = [threading.Thread(target=vender, args=(cliente,)) for cliente in terminais]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    assert sorted(status) == [200, 409]
+    assert _estoque(produto_id) == 0
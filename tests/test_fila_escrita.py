@@ -0,0 +1,71 @@
+import threading
+from concurrent.futures import Future
+
+import pytest
+
+from app import db, executar_escrita, fila_escrita, Contador, FilaEscrita
+
+def _contar(nome):
+    def gravar():
+        contador = db.session.get(Contador, nome)
+        if contador is None:
+            db.session.add(Contador(nome=nome, valor=1))
+        else:
+            contador.valor += 1
+        db.session.flush()
+        return nome
+    return gravar
+
+def _falhar():
+    db.session.add(Contador(nome='fila-falha', valor=1))
+    db.session.flush()
+    raise ValueError('falha da gravação')
+
+def _valor(nome):
+    contador = db.session.get(Contador, nome)
+    return contador.valor if contador else None
+
+def test_lote_confirmado_com_um_unico_commit(contexto):
+    dbapi = db.session.connection().connection.driver_connection
+    comandos = []
+    dbapi.set_trace_callback(comandos.append)
+    lote = [(Future(), func, (), {}) for func in (_contar('fila-a'), _contar('fila-b'), _falhar, _contar('fila-a'))]
+    try:
+        fila_escrita._gravar_lote(lote)
+    finally:
+        dbapi.set_trace_callback(None)
+    
+    assert comandos.count('BEGIN IMMEDIATE') == 1
+    assert comandos.count('COMMIT') == 1
+    assert comandos[-1] == 'COMMIT'
+    assert [f.result() for f, *_ in (lote[0], lote[1], lote[3])] == ['fila-a', 'fila-b', 'fila-a']
+    with pytest.raises(ValueError):
+        lote[2][0].result()
+    # A gravação que falhou é desfeita sozinha; as outras do lote ficam
+    assert (_valor('fila-a'), _valor('fila-b'), _valor('fila-falha')) == (2, 1, None)
+
+def test_thread_escritora_devolve_resultado_e_erro(contexto):
+    fila = FilaEscrita()
+    assert fila.executar(_contar('fila-thread')) == 'fila-thread'
+    with pytest.raises(ValueError):
+        fila.executar(_falhar)
+    db.session.rollback()
+    assert _valor('fila-thread') == 1
+    assert _valor('fila-falha') is None
+
+def test_escritas_concorrentes_pela_fila_nao_se_perdem(app, contexto, monkeypatch):
+    monkeypatch.setitem(app.config, 'FILA_ESCRITA', True)
+    
+    def terminal():
+        with app.app_context():
+            for _ in range(10):
+                executar_escrita(_contar('fila-concorrente'))
+    
+    threads = [threading.Thread(target=terminal) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    db.session.expire_all()
+    assert _valor('fila-concorrente') == 80
@@ -0,0 +1,29 @@
+import app as aplicacao
+from app import db, Produto
+
+def _codigos_importados(prefixo):
+    return db.session.scalars(db.select(Produto.codigo).where(Produto.codigo.like(f'{prefixo}%'))).all()
+
+def test_erro_de_leitura_no_meio_do_arquivo_informa_o_que_foi_importado(administrador, contexto, monkeypatch):
+    # Lotes pequenos: vários já confirmados quando o erro aparece
+    monkeypatch.setattr(aplicacao, 'LINHAS_POR_COMANDO_IMPORTACAO', 50)
+    monkeypatch.setattr(aplicacao, 'COMANDOS_POR_TRANSACAO_IMPORTACAO', 2)
+    linhas = [f'IMP{i:05d};Produto importado {i};1,50' for i in range(1000)]
+    corpo = ('codigo;descricao;preco_venda\n' + '\n'.join(linhas[:600]) + '\n').encode()
+    corpo += b'IMP-RUIM;Descri\xe7\xe3o em latin-1;2,00\n' + '\n'.join(linhas[600:]).encode()
+    
+    resposta = administrador.post('/api/produtos/importar', data=corpo, content_type='text/csv')
+    assert resposta.status_code == 400
+    dados = resposta.get_json()
+    # Tudo antes da linha informada foi gravado; dela em diante, nada
+    importados = dados['linha'] - 2
+    assert 0 < importados <= 600
+    assert dados['inseridos'] == importados
+    assert sorted(_codigos_importados('IMP')) == [f'IMP{i:05d}' for i in range(importados)]
+
+def test_importacao_completa(administrador, contexto):
+    corpo = 'codigo;descricao;preco_venda;estoque\nIMC1;Linha;2,50;3\nIMC2;Agulha;1,00;\nIMC3;;1,00;\n'
+    dados = administrador.post('/api/produtos/importar', data=corpo.encode(), content_type='text/csv').get_json()
+    assert (dados['inseridos'], dados['atualizados'], dados['rejeitados']) == (2, 0, 1)
+    assert dados['erros'] == [{'linha': 4, 'erro': 'código e descrição são obrigatórios'}]
+    assert sorted(_codigos_importados('IMC')) == ['IMC1', 'IMC2']
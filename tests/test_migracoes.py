@@ -0,0 +1,34 @@
+import pytest
+from sqlalchemy import text
+
+import app as aplicacao
+from app import db, migrar_banco, versao_esquema, _adicionar_coluna
+
+def _colunas_produto():
+    return {linha[1] for linha in db.session.execute(text('PRAGMA table_info(produto)'))}
+
+def test_migracao_interrompida_nao_muda_esquema_nem_versao(contexto, monkeypatch):
+    versao = versao_esquema()
+    db.session.commit()
+    
+    def migracao_com_erro():
+        _adicionar_coluna('produto', 'coluna_da_migracao', 'INTEGER')
+        raise RuntimeError('falha no meio da migração')
+    
+    monkeypatch.setattr(aplicacao, 'MIGRACOES', aplicacao.MIGRACOES + [(versao + 1, 'teste', migracao_com_erro)])
+    with pytest.raises(RuntimeError):
+        migrar_banco()
+    
+    assert versao_esquema() == versao
+    assert 'coluna_da_migracao' not in _colunas_produto()
+
+def test_migracao_aplicada_grava_a_versao(contexto, monkeypatch):
+    versao = versao_esquema()
+    db.session.commit()
+    monkeypatch.setattr(aplicacao, 'MIGRACOES', aplicacao.MIGRACOES + [(versao + 1, 'teste', lambda: None)])
+    try:
+        migrar_banco()
+        assert versao_esquema() == versao + 1
+    finally:
+        db.session.execute(text(f'PRAGMA user_version = {versao}'))
+        db.session.commit()
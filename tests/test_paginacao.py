@@ -0,0 +1,32 @@
+from app import db, Cliente
+
+def _percorrer(cliente, url):
+    itens, cursor = [], None
+    while True:
+        resposta = cliente.get(url + (f'&cursor={cursor}' if cursor else ''))
+        assert resposta.status_code == 200
+        itens += resposta.get_json()
+        cursor = resposta.headers.get('X-Proximo-Cursor')
+        if not cursor:
+            return itens
+
+def test_paginas_de_clientes_cobrem_tudo_sem_repetir(operador, contexto):
+    # Nomes repetidos: o desempate é pelo id, que também vai no cursor
+    for i in range(23):
+        db.session.add(Cliente(nome=f'Paginação {i % 4}', tipo='cpf', documento=f'8{i:010d}'))
+    db.session.commit()
+    esperados = db.session.scalars(db.select(Cliente.id).order_by(Cliente.nome, Cliente.id)).all()
+    
+    assert [c['id'] for c in _percorrer(operador, '/api/clientes?limite=5')] == esperados
+
+def test_paginas_de_produtos_seguem_descricao_e_id(operador, criar_produto):
+    for _ in range(12):
+        criar_produto()
+    esperados = [p['id'] for p in sorted(operador.get('/api/catalogo').get_json()['produtos'],
+                                         key=lambda p: (p['descricao'], p['id']))]
+    
+    assert [p['id'] for p in _percorrer(operador, '/api/produtos?limite=4')] == esperados
+
+def test_cursor_invalido(operador):
+    assert operador.get('/api/clientes?cursor=nao-e-cursor').status_code == 400
+    assert operador.get('/api/produtos?cursor=WzFd').status_code == 400  # [1]: colunas a menos